@@ -1,7 +1,36 @@
 import subprocess
 import sys
 import time
-import urllib.request
+import http.client
+
+# The Streamlit process owns the NexusRuntime (app.py caches it with
+# st.cache_resource), so every request forwarded here shares one runtime.
+STREAMLIT_HOST = "127.0.0.1"
+STREAMLIT_PORT = 8000
+
+
+def _connection():
+    """Keep-alive connection to the Streamlit server, reused across requests."""
+    conn = globals().get("streamlit_connection")
+    if conn is None:
+        conn = http.client.HTTPConnection(STREAMLIT_HOST, STREAMLIT_PORT, timeout=30)
+        globals()["streamlit_connection"] = conn
+    return conn
+
+
+def _fetch(path="/"):
+    # One retry on a fresh connection if the kept-alive one was closed by the server
+    for attempt in range(2):
+        conn = _connection()
+        try:
+            conn.request("GET", path)
+            return conn.getresponse().read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            globals()["streamlit_connection"] = None
+            if attempt:
+                raise
+
 
 def handler(request, response):
 
@@ -13,7 +42,7 @@ def handler(request, response):
                 "-m", "streamlit",
                 "run", "app.py",
                 "--server.headless", "true",
-                "--server.port", "8000",
+                "--server.port", str(STREAMLIT_PORT),
                 "--server.address", "0.0.0.0",
                 "--server.enableCORS", "false",
                 "--server.enableXsrfProtection", "false",
@@ -29,7 +58,7 @@ def handler(request, response):
 
     # Forward response from Streamlit server
     try:
-        html = urllib.request.urlopen("http://127.0.0.1:8000").read()
+        html = _fetch("/")
     except Exception as e:
         html = f"Streamlit failed to start: {e}".encode()
 
@@ -1,11 +1,29 @@
 # app.py
+import os
 import streamlit as st
 import json
 import traceback
-from nexus_pipeline import run_pipeline
+from nexus_pipeline import stream_pipeline
+from nexus_runtime import get_runtime
+from tracing import start_metrics_server
 
 st.set_page_config(page_title="Project Nexus - Agentic System Builder", layout="wide")
 
+
+@st.cache_resource
+def load_runtime():
+    """Built once per server process and shared by every session and rerun."""
+    runtime = get_runtime()
+    # Restore memory and load the embedding model while the user types
+    runtime.warm_up(background=True)
+    return runtime
+
+
+runtime = load_runtime()
+
+# Pull-style metrics endpoint (idempotent across Streamlit reruns)
+start_metrics_server(int(os.getenv("NEXUS_METRICS_PORT", "9465")))
+
 st.title("🧩 Project Nexus: Agentic System Orchestrator")
 st.write("This interface connects your RAG, prompt engine, validator, reader, and writer agents.")
 
@@ -22,10 +40,67 @@ if st.button("Run Nexus Pipeline"):
     if not user_query.strip():
         st.warning("Please enter a valid query.")
     else:
+        # Live view: stage status, streamed plan, and per-component code as it arrives
+        stage_box = st.empty()
+        st.subheader("Plan (live)")
+        plan_box = st.empty()
+        st.subheader("Components (live)")
+        component_area = st.container()
+
+        stages = {}
+        plan_text = {"attempt": 0, "text": ""}
+        component_boxes = {}
+        component_code = {}
+        result = None
+
+        def render_stages():
+            icons = {"running": "⏳", "success": "✅", "pass": "✅", "warn": "⚠️", "partial": "⚠️"}
+            lines = [f"{icons.get(status, '❌')} {stage.replace('_', ' ')} — {status}" for stage, status in stages.items()]
+            stage_box.markdown("\n\n".join(lines))
+
         with st.spinner("Running Nexus pipeline..."):
             try:
-                result = run_pipeline(user_query, rag_persist_dir=rag_dir, code_output_dir=output_dir)
-                st.success("Pipeline completed successfully!")
+                for event in stream_pipeline(user_query, rag_persist_dir=rag_dir, code_output_dir=output_dir, runtime=runtime):
+                    etype = event["type"]
+                    if etype == "stage_started":
+                        stages[event["stage"]] = "running"
+                        render_stages()
+                    elif etype == "stage_finished":
+                        stages[event["stage"]] = event.get("status") or "done"
+                        render_stages()
+                    elif etype == "plan_token":
+                        if event["attempt"] != plan_text["attempt"]:
+                            plan_text["attempt"], plan_text["text"] = event["attempt"], ""
+                        plan_text["text"] += event["text"]
+                        plan_box.code(plan_text["text"], language="json")
+                    elif etype == "code_chunk":
+                        name = event["component"]
+                        if name not in component_boxes:
+                            with component_area:
+                                st.markdown(f"**{name}**")
+                                component_boxes[name] = st.empty()
+                        component_code[name] = component_code.get(name, "") + event["text"]
+                        component_boxes[name].code(component_code[name], language="python")
+                    elif etype == "component_retry":
+                        # Drop code streamed by the failed attempt
+                        name = event["component"]
+                        component_code[name] = ""
+                        if name in component_boxes:
+                            component_boxes[name].empty()
+                    elif etype == "component_finished" and event.get("status") == "failed":
+                        with component_area:
+                            st.warning(f"{event['component']} failed: {event.get('error')}")
+                    elif etype == "pipeline_error":
+                        raise RuntimeError(event["error"])
+                    elif etype == "pipeline_finished":
+                        result = event["result"]
+
+                if result is None:
+                    raise RuntimeError("Pipeline event stream ended without a result; the run is incomplete.")
+                if result.get("success"):
+                    st.success("Pipeline completed successfully!")
+                else:
+                    st.error(f"Pipeline stopped at stage: {result.get('stage')}")
 
                 # Display the summary cleanly
                 st.subheader("Pipeline Summary")
@@ -0,0 +1,183 @@
+"""
+Embedding backend benchmark: torch vs onnx-int8 (see embedding_provider).
+
+Each backend runs in its own subprocess so peak RSS is measured in isolation.
+For every backend it reports model load time, document throughput, query
+latency p50/p95 and peak RSS. Retrieval agreement against the first backend
+is reported as top-1 agreement, mean top-k overlap, and mean cosine similarity
+between the two backends' vectors for the same text.
+
+Example:
+    python -m benchmarks.bench_embeddings --backends torch onnx-int8 --docs 1000 \
+        --queries 100 --k 5 --output bench_embeddings.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import git_revision, make_insight, percentile
+from insight_record import distill
+
+QUERY_TEMPLATES = [
+    "Build a {fw} agent that avoids {err}",
+    "How should I structure a {fw} pipeline with {tag}?",
+    "Fix {err} in my multi-agent system",
+    "Concise {fw} code for {tag} workflows"
+]
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def build_corpus(docs: int, queries: int) -> Dict[str, List[str]]:
+    frameworks = ["LangGraph", "CrewAI", "LlamaIndex", "AutoGen"]
+    documents = [distill(make_insight(i)) for i in range(docs)]   # the text RAGManager embeds
+    query_texts = [
+        QUERY_TEMPLATES[i % len(QUERY_TEMPLATES)].format(
+            fw=frameworks[i % len(frameworks)], err=f"error pattern {i % 37}", tag=f"tag{i % 23}"
+        )
+        for i in range(queries)
+    ]
+    return {"documents": documents, "queries": query_texts}
+
+
+def run_worker(backend: str, model_name: str, corpus_path: str, output_path: str):
+    """Embed the corpus with one backend and write timings + vectors as JSON."""
+    from embedding_provider import EmbeddingProvider
+
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    rss_start = peak_rss_mb()
+
+    provider = EmbeddingProvider(model_name, backend)
+    started = time.perf_counter()
+    provider.warm_up(background=False)
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    doc_vectors = provider.embed_documents(corpus["documents"])
+    doc_seconds = time.perf_counter() - started
+
+    query_vectors, latencies = [], []
+    for query in corpus["queries"]:
+        started = time.perf_counter()
+        query_vectors.append(provider.embed_query(query))
+        latencies.append(time.perf_counter() - started)
+
+    report = {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 4),
+        "docs_per_second": round(len(doc_vectors) / doc_seconds, 2) if doc_seconds else None,
+        "query_latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p95": round(percentile(latencies, 95) * 1000, 3)
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "rss_before_model_mb": round(rss_start, 1),
+        "doc_vectors": doc_vectors,
+        "query_vectors": query_vectors
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f)
+
+
+def agreement(reference: Dict[str, Any], candidate: Dict[str, Any], k: int) -> Dict[str, float]:
+    import numpy as np
+
+    def normalized(vectors):
+        m = np.asarray(vectors, dtype=np.float32)
+        return m / np.clip(np.linalg.norm(m, axis=1, keepdims=True), 1e-12, None)
+
+    ref_docs, cand_docs = normalized(reference["doc_vectors"]), normalized(candidate["doc_vectors"])
+    ref_queries, cand_queries = normalized(reference["query_vectors"]), normalized(candidate["query_vectors"])
+    k = min(k, len(ref_docs))
+
+    ref_top = np.argsort(-(ref_queries @ ref_docs.T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand_queries @ cand_docs.T), axis=1)[:, :k]
+    overlaps = [len(set(a) & set(b)) / k for a, b in zip(ref_top.tolist(), cand_top.tolist())]
+
+    return {
+        "top1_agreement": round(float(np.mean(ref_top[:, 0] == cand_top[:, 0])), 4),
+        f"top{k}_overlap": round(float(np.mean(overlaps)), 4),
+        "mean_doc_cosine": round(float(np.mean(np.sum(ref_docs * cand_docs, axis=1))), 5),
+        "mean_query_cosine": round(float(np.mean(np.sum(ref_queries * cand_queries, axis=1))), 5)
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare embedding backends.")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx-int8"], help="first one is the reference")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--output", default="bench_embeddings.json")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        run_worker(args.worker, args.model, args.corpus, args.worker_output)
+        return
+
+    reports = []
+    with tempfile.TemporaryDirectory(prefix="nexus_embed_bench_") as workdir:
+        corpus_path = os.path.join(workdir, "corpus.json")
+        with open(corpus_path, "w", encoding="utf-8") as f:
+            json.dump(build_corpus(args.docs, args.queries), f)
+
+        for backend in args.backends:
+            output_path = os.path.join(workdir, f"{backend}.json")
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_embeddings", "--worker", backend, "--model", args.model,
+                 "--corpus", corpus_path, "--worker-output", output_path],
+                check=True,
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            )
+            with open(output_path, "r", encoding="utf-8") as f:
+                reports.append(json.load(f))
+
+    reference = reports[0]
+    results = []
+    for report in reports:
+        row = {key: value for key, value in report.items() if not key.endswith("_vectors")}
+        if report is not reference:
+            row["agreement_vs_" + reference["backend"]] = agreement(reference, report, args.k)
+        results.append(row)
+        print(
+            f"{row['backend']:<10} load={row['load_seconds']:.2f}s docs/s={row['docs_per_second']} "
+            f"query p50={row['query_latency_ms']['p50']:.2f}ms p95={row['query_latency_ms']['p95']:.2f}ms "
+            f"peak_rss={row['peak_rss_mb']:.0f}MB"
+            + (f" agreement={row['agreement_vs_' + reference['backend']]}" if report is not reference else "")
+        )
+
+    output = {
+        "benchmark": "embedding_backends",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "settings": {"model": args.model, "docs": args.docs, "queries": args.queries, "k": args.k},
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+FAISS index tiering benchmark (see index_tiering).
+
+Builds flat, HNSW and IVF indexes over synthetic clustered vectors and reports
+build time, query latency and recall@k against exact search for a sweep of
+ef_search / nprobe values, so the tiering threshold and search parameters can
+be chosen from measurements. Results are written as JSON.
+
+Example:
+    python -m benchmarks.bench_index --sizes 50000 500000 --dim 384 \
+        --kinds flat hnsw ivf --queries 200 --k 10 --output bench_index.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import git_revision
+from index_tiering import HNSW, IVF, INDEX_KINDS, IndexTiering
+
+DEFAULT_SWEEPS = {HNSW: [16, 32, 64, 128, 256], IVF: [1, 4, 16, 64, 128]}
+
+
+def make_vectors(n: int, dim: int, seed: int, clusters: int = 256):
+    """Unit vectors drawn around random centres, closer to sentence embeddings than uniform noise."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare flat / HNSW / IVF memory indexes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50000, 200000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--kinds", nargs="+", default=list(INDEX_KINDS), choices=INDEX_KINDS)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="bench_index.json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for size in args.sizes:
+        vectors = make_vectors(size, args.dim, args.seed)
+        queries = make_vectors(args.queries, args.dim, args.seed + 1)
+        for kind in args.kinds:
+            tiering = IndexTiering(index_type=kind, hnsw_m=args.hnsw_m)
+            started = time.perf_counter()
+            index = tiering.build(kind, vectors)
+            build_seconds = time.perf_counter() - started
+
+            report = tiering.recall(index, queries, k=args.k, sweep=DEFAULT_SWEEPS.get(kind))
+            report["build_seconds"] = round(build_seconds, 3)
+            results.append(report)
+            for row in report["results"]:
+                param = next((f"{key}={row[key]}" for key in ("ef_search", "nprobe") if key in row), "exact")
+                print(
+                    f"size={size:<8} index={kind:<5} {param:<14} recall@{report['k']}={row['recall']:.3f} "
+                    f"latency={row['ms_per_query']:.3f}ms build={build_seconds:.1f}s"
+                )
+
+    output = {
+        "benchmark": "memory_index_tiering",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "settings": {"sizes": args.sizes, "dim": args.dim, "queries": args.queries, "k": args.k, "hnsw_m": args.hnsw_m},
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Offline end-to-end benchmark for run_pipeline.
+
+Runs the whole pipeline against FakeLLM and HashingEmbeddings (no network, no
+Azure credentials) over a grid of component counts, memory sizes and pipeline
+concurrency levels. It reports throughput and p50/p95/p99 latency, and writes the
+results as JSON so runs from different versions can be diffed.
+
+Example:
+    python -m benchmarks.bench_pipeline --components 1 4 8 --memory 0 1000 \
+        --concurrency 1 8 --runs 16 --latency 0.05 --output bench_results.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import contextlib
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import git_revision, make_insight, percentile
+from benchmarks.fakes import FakeLLM, HashingEmbeddings
+from insight_dedup import InsightDeduplicator
+from nexus_pipeline import run_pipeline_async
+from nexus_runtime import NexusRuntime
+from rag_manager import RAGManager
+
+
+def build_memory(size: int, workdir: str) -> RAGManager:
+    rag = RAGManager(
+        persist_dir=os.path.join(workdir, f"rag_{size}"),
+        embedding_model="bench-hashing-384",
+        persist=False,
+        embeddings=HashingEmbeddings(),
+        deduplicator=InsightDeduplicator(enabled=False)   # memory_size insights, not however many survive dedup
+    )
+    if size:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            rag.add_corrective_insights((make_insight(i) for i in range(size)), batch_size=512)
+    return rag
+
+
+async def run_config(args, components: int, rag: RAGManager, concurrency: int, workdir: str) -> Dict[str, Any]:
+    llm = FakeLLM(
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        components=components,
+        seed=args.seed
+    )
+    # One runtime per configuration, as a server would hold it
+    runtime = NexusRuntime(llm_client=llm, rag=rag)
+    semaphore = asyncio.Semaphore(concurrency)
+    # Fresh output directories per configuration: a manifest left by an earlier
+    # configuration would let the writer reuse its code and skip the LLM
+    config_dir = tempfile.mkdtemp(prefix=f"out_{components}_{concurrency}_", dir=workdir)
+    latencies: List[float] = []
+    outcomes: Dict[str, int] = {}
+
+    async def one(run_id: int):
+        async with semaphore:
+            out_dir = os.path.join(config_dir, f"run_{run_id}")
+            started = time.perf_counter()
+            try:
+                result = await run_pipeline_async(
+                    f"Build benchmark system {run_id % 7}",
+                    code_output_dir=out_dir,
+                    runtime=runtime
+                )
+                outcome = result.get("stage", "unknown") if not result.get("success") else "success"
+            except Exception as e:
+                outcome = f"exception:{type(e).__name__}"
+            latencies.append(time.perf_counter() - started)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    started = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            await asyncio.gather(*(one(i) for i in range(args.runs)))
+    finally:
+        runtime.close()
+    wall = time.perf_counter() - started
+
+    return {
+        "components": components,
+        "memory_size": rag.db.index.ntotal if rag.db is not None else 0,
+        "concurrency": concurrency,
+        "runs": args.runs,
+        "wall_seconds": round(wall, 4),
+        "throughput_per_second": round(args.runs / wall, 4) if wall else None,
+        "latency_seconds": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else 0.0
+        },
+        "success_rate": round(outcomes.get("success", 0) / args.runs, 4) if args.runs else 0.0,
+        "outcomes": dict(sorted(outcomes.items())),
+        "llm_calls": llm.calls,
+        "llm_failures": llm.failures
+    }
+
+
+async def main_async(args) -> Dict[str, Any]:
+    results = []
+    with tempfile.TemporaryDirectory(prefix="nexus_bench_") as workdir:
+        for memory_size in args.memory:
+            rag = build_memory(memory_size, workdir)
+            for components in args.components:
+                for concurrency in args.concurrency:
+                    row = await run_config(args, components, rag, concurrency, workdir)
+                    results.append(row)
+                    lat = row["latency_seconds"]
+                    print(
+                        f"components={components:<3} memory={memory_size:<7} concurrency={concurrency:<3} "
+                        f"throughput={row['throughput_per_second']:.2f}/s p50={lat['p50']:.3f}s "
+                        f"p95={lat['p95']:.3f}s p99={lat['p99']:.3f}s success={row['success_rate']:.0%}"
+                    )
+
+    return {
+        "benchmark": "nexus_pipeline_offline",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "settings": {
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "failure_rate": args.failure_rate,
+            "runs": args.runs,
+            "seed": args.seed
+        },
+        "results": results
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark for the Nexus pipeline.")
+    parser.add_argument("--components", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--memory", type=int, nargs="+", default=[0, 1000])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--runs", type=int, default=8, help="pipelines per configuration")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean fake LLM latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="uniform +/- latency jitter (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="probability each LLM call fails")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="bench_results.json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(main_async(args))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
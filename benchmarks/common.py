@@ -0,0 +1,37 @@
+import math
+import subprocess
+from typing import Any, Dict, List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def make_insight(i: int) -> Dict[str, Any]:
+    frameworks = ["LangGraph", "CrewAI", "LlamaIndex", "AutoGen"]
+    return {
+        "session_id": f"bench-{i % 50}",
+        "system_context": {"preferred_llm": "gpt-4o", "preferred_embedding_model": "all-MiniLM-L6-v2"},
+        "behavioral_insights": {
+            "code_framework_preference": frameworks[i % len(frameworks)],
+            "common_errors": [f"error pattern {i % 37}"],
+            "user_style_preference": "concise"
+        },
+        "corrective_knowledge": {
+            "insight_summary": f"Benchmark insight number {i} about pipeline design.",
+            "recommendations": [f"recommendation {i % 11}"],
+            "relevance_tags": [f"tag{i % 23}", frameworks[i % len(frameworks)].lower()]
+        }
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
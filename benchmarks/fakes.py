@@ -0,0 +1,148 @@
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+
+
+class FakeLLMError(ConnectionError):
+    """Injected failure raised by FakeLLM (classified as transient)."""
+
+
+class FakeLLM:
+    """
+    Offline stand-in for AzureChatOpenAI.
+    -------------------------------------
+    - Recognizes the validator, ReaderAgent and WriterAgent prompts and returns
+      a validator verdict, a schema-valid plan, or component code respectively
+    - Injects latency (mean + uniform jitter) and a failure rate per call
+    - Supports invoke / ainvoke / stream / astream
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        components: int = 4,
+        chunk_size: int = 32,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.components = components
+        self.chunk_size = max(1, chunk_size)
+        self.calls = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _plan(self) -> str:
+        components = {
+            f"Stage{i + 1}Processor": {
+                "description": f"Processing stage {i + 1} of the benchmark system.",
+                "inputs": [f"stage{i}_output"] if i else ["user_request"],
+                "outputs": [f"stage{i + 1}_output"],
+                "dependencies": [f"Stage{i}Processor"] if i else []
+            }
+            for i in range(self.components)
+        }
+        return json.dumps({
+            "framework": "LangGraph",
+            "language": "python",
+            "llm": "fake-llm",
+            "embedding_model": "hashing",
+            "components": components,
+            "termination_policy": {"max_steps": 10},
+            "files": []
+        })
+
+    def _respond(self, prompt) -> str:
+        text = prompt if isinstance(prompt, str) else str(prompt)
+        if "You are a strict validator" in text:
+            return json.dumps({"instruction_fidelity_score": 0.9, "safety_score": 1.0, "suggestions": []})
+        if "You are the Reader Agent" in text:
+            return self._plan()
+        name = "Component"
+        for line in text.splitlines():
+            if line.strip().startswith("- Name:"):
+                name = line.split(":", 1)[1].strip()
+                break
+        return (
+            f"class {name}:\n"
+            f"    \"\"\"Generated offline for benchmarking.\"\"\"\n\n"
+            f"    def __call__(self, state: dict) -> dict:\n"
+            f"        return {{**state, '{name.lower()}': True}}\n"
+        )
+
+    def _draw(self):
+        """Pick this call's latency and whether it fails."""
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            fail = self._rng.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        return delay, fail
+
+    def _chunks(self, text: str) -> List[str]:
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+
+    def invoke(self, prompt, **kwargs):
+        delay, fail = self._draw()
+        time.sleep(delay)
+        if fail:
+            raise FakeLLMError("Injected LLM failure")
+        return AIMessage(content=self._respond(prompt))
+
+    async def ainvoke(self, prompt, **kwargs):
+        delay, fail = self._draw()
+        await asyncio.sleep(delay)
+        if fail:
+            raise FakeLLMError("Injected LLM failure")
+        return AIMessage(content=self._respond(prompt))
+
+    def stream(self, prompt, **kwargs):
+        delay, fail = self._draw()
+        time.sleep(delay)
+        if fail:
+            raise FakeLLMError("Injected LLM failure")
+        for chunk in self._chunks(self._respond(prompt)):
+            yield AIMessage(content=chunk)
+
+    async def astream(self, prompt, **kwargs):
+        delay, fail = self._draw()
+        await asyncio.sleep(delay)
+        if fail:
+            raise FakeLLMError("Injected LLM failure")
+        for chunk in self._chunks(self._respond(prompt)):
+            yield AIMessage(content=chunk)
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words feature-hashing embeddings (no model download)."""
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in text.lower().split():
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
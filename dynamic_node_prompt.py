@@ -1,5 +1,5 @@
 import json
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 class DynamicPromptNode:
     """Dynamic Prompt Creator"""
@@ -7,8 +7,9 @@ class DynamicPromptNode:
     def __init__(self, rag_manager):
         self.rag = rag_manager
 
-    def generate_prompt(self, user_query: str, k: int = 3) -> str:
-        contexts = self.rag.fetch_context(user_query, k=k)
+    def generate_prompt(self, user_query: str, k: int = 3, filters: Optional[Dict] = None) -> str:
+        """filters restricts the memory searched (e.g. {"session_id": ...}); see RAGManager.fetch_context."""
+        contexts = self.rag.fetch_context(user_query, k=k, filters=filters)
 
         if not contexts:
             return f"""
@@ -24,7 +25,10 @@ clearly so they can work autonomously.
         context_blocks = []
         for i, ctx in enumerate(contexts, 1):
             try:
-                data = json.loads(ctx["text"])
+                # RAGManager hands back the parsed insight; other memories may only return JSON text
+                data = ctx.get("insight")
+                if data is None:
+                    data = json.loads(ctx["text"])
                 sys = data.get("system_context", {})
                 beh = data.get("behavioral_insights", {})
                 corr = data.get("corrective_knowledge", {})
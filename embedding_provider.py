@@ -0,0 +1,241 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Backends: full-precision torch via sentence-transformers, or an int8-quantized
+# ONNX export of the same model run by onnxruntime (CPU only, no torch import)
+BACKEND_TORCH = "torch"
+BACKEND_ONNX_INT8 = "onnx-int8"
+EMBEDDING_BACKENDS = (BACKEND_TORCH, BACKEND_ONNX_INT8)
+DEFAULT_EMBEDDING_BACKEND = os.getenv("NEXUS_EMBEDDING_BACKEND", BACKEND_TORCH)
+
+# Quantized export published in the sentence-transformers model repos (AVX2 works on any x86-64 CPU)
+DEFAULT_ONNX_INT8_FILE = os.getenv("NEXUS_ONNX_MODEL_FILE", "onnx/model_quint8_avx2.onnx")
+
+
+class OnnxInt8Embeddings(Embeddings):
+    """
+    Sentence-transformers model run from an int8-quantized ONNX file.
+    ----------------------------------------------------------------
+    - Needs onnxruntime, tokenizers and numpy only (no torch); the first two
+      are optional requirements, installed separately
+    - Mean pooling over the attention mask + L2 normalization, matching the
+      torch pipeline of all-MiniLM-L6-v2, so vectors live in the same space
+    - Texts are batched by length to keep padding small
+
+    model_path may be a local directory holding the ONNX file and tokenizer.json;
+    otherwise both are downloaded from the Hugging Face Hub repo model_name.
+    For a model without a published int8 file, export it with
+    `optimum-cli export onnx --model <model_name> <dir>` and run
+    quantize_onnx_model(<dir>/model.onnx, <dir>/model_qint8.onnx).
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        model_path: Optional[str] = None,
+        onnx_file: str = DEFAULT_ONNX_INT8_FILE,
+        max_length: int = 256,
+        batch_size: int = 32,
+        num_threads: Optional[int] = None
+    ):
+        import numpy as np
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            # Optional dependencies; see requirements.txt
+            raise ImportError("The onnx-int8 embedding backend needs onnxruntime and tokenizers: pip install onnxruntime tokenizers") from e
+
+        self._np = np
+        self.model_name = model_name
+        self.batch_size = max(1, int(batch_size))
+
+        model_file, tokenizer_file = self._resolve_files(model_name, model_path, onnx_file)
+        self.tokenizer = Tokenizer.from_file(tokenizer_file)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_file, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    @staticmethod
+    def _resolve_files(model_name: str, model_path: Optional[str], onnx_file: str) -> Tuple[str, str]:
+        if model_path:
+            model_file = os.path.join(model_path, onnx_file)
+            if not os.path.exists(model_file):
+                model_file = os.path.join(model_path, os.path.basename(onnx_file))
+            return model_file, os.path.join(model_path, "tokenizer.json")
+
+        from huggingface_hub import hf_hub_download
+        return (
+            hf_hub_download(repo_id=model_name, filename=onnx_file),
+            hf_hub_download(repo_id=model_name, filename="tokenizer.json")
+        )
+
+    def _encode(self, texts: List[str]):
+        np = self._np
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(hidden.dtype)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Encode in length-sorted batches, then restore input order
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            chunk = order[start:start + self.batch_size]
+            for index, vector in zip(chunk, self._encode([texts[i] for i in chunk])):
+                vectors[index] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+def quantize_onnx_model(source_path: str, target_path: str) -> str:
+    """Dynamically quantize an fp32 ONNX export to int8 weights (onnxruntime.quantization)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(source_path, target_path, weight_type=QuantType.QInt8)
+    return target_path
+
+
+class EmbeddingProvider(Embeddings):
+    """
+    Lazily loaded, process-wide embedding model.
+    -------------------------------------------
+    - Nothing heavy (torch, sentence-transformers) is imported until first use
+    - One instance per model name is shared by every RAGManager in the process
+    - warm_up() lets servers load the model in the background at boot
+    - load_time reports how long the model took to load (seconds)
+    - backend selects torch (HuggingFaceEmbeddings) or onnx-int8 (OnnxInt8Embeddings)
+    """
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, backend: str = DEFAULT_EMBEDDING_BACKEND):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {EMBEDDING_BACKENDS}")
+        self.model_name = model_name
+        self.backend = backend
+        self.load_time: Optional[float] = None
+        self.load_error: Optional[str] = None
+        self._model = None
+        self._lock = threading.Lock()
+        self._warm_thread: Optional[threading.Thread] = None
+
+    @property
+    def embedding_id(self) -> str:
+        """
+        Identifies the vector space for caches and index metadata. Quantized
+        vectors are close to, but not bit-identical with, the torch ones.
+        """
+        return self.model_name if self.backend == BACKEND_TORCH else f"{self.model_name}#{self.backend}"
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    def _load(self):
+        """Load the underlying model exactly once, even under concurrent callers."""
+        if self._model is not None:
+            return self._model
+        with self._lock:
+            if self._model is None:
+                start = time.perf_counter()
+                try:
+                    if self.backend == BACKEND_ONNX_INT8:
+                        self._model = OnnxInt8Embeddings(self.model_name)
+                    else:
+                        from langchain_community.embeddings import HuggingFaceEmbeddings
+                        self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+                except Exception as e:
+                    self.load_error = str(e)
+                    raise
+                self.load_time = time.perf_counter() - start
+                self.load_error = None
+                print(f"Embedding model {self.model_name} ({self.backend}) loaded in {self.load_time:.2f}s")
+        return self._model
+
+    def warm_up(self, background: bool = True) -> Optional[threading.Thread]:
+        """
+        Load the model ahead of the first request.
+
+        Args:
+            background: load on a daemon thread and return immediately.
+        Returns:
+            The loader thread when background=True, otherwise None.
+        """
+        if self.is_loaded:
+            return None
+        if not background:
+            self._load()
+            return None
+
+        with self._lock:
+            if self._warm_thread is not None and self._warm_thread.is_alive():
+                return self._warm_thread
+
+            def _run():
+                try:
+                    self._load()
+                except Exception as e:
+                    print(f"Embedding warm-up failed: {e}")
+
+            self._warm_thread = threading.Thread(target=_run, name="embedding-warmup", daemon=True)
+            self._warm_thread.start()
+            return self._warm_thread
+
+    def stats(self) -> Dict:
+        return {
+            "model_name": self.model_name,
+            "backend": self.backend,
+            "loaded": self.is_loaded,
+            "load_time": self.load_time,
+            "load_error": self.load_error
+        }
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._load().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._load().embed_query(text)
+
+
+_providers: Dict[Tuple[str, str], EmbeddingProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_embedding_provider(model_name: str = DEFAULT_EMBEDDING_MODEL, backend: Optional[str] = None) -> EmbeddingProvider:
+    """Return the shared provider for (model_name, backend), creating it (unloaded) if needed."""
+    backend = backend or DEFAULT_EMBEDDING_BACKEND
+    with _providers_lock:
+        provider = _providers.get((model_name, backend))
+        if provider is None:
+            provider = EmbeddingProvider(model_name, backend)
+            _providers[(model_name, backend)] = provider
+        return provider
+
+
+def warm_up(model_name: str = DEFAULT_EMBEDDING_MODEL, background: bool = True, backend: Optional[str] = None) -> Optional[threading.Thread]:
+    """Convenience hook for servers: start loading the shared embedding model."""
+    return get_embedding_provider(model_name, backend).warm_up(background=background)
@@ -0,0 +1,165 @@
+import os
+import re
+import math
+import heapq
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Retrieval modes for RAGManager.fetch_context
+VECTOR = "vector"      # embedding similarity only (previous behaviour)
+LEXICAL = "lexical"    # BM25 only; the query is never embedded
+HYBRID = "hybrid"      # both, fused
+RETRIEVAL_MODES = (VECTOR, LEXICAL, HYBRID)
+
+# Fusion schemes for hybrid mode
+RRF = "rrf"            # reciprocal rank fusion: sum of 1 / (rrf_k + rank)
+WEIGHTED = "weighted"  # min-max normalized scores, blended by LEXICAL_WEIGHT
+FUSIONS = (RRF, WEIGHTED)
+
+RETRIEVAL_MODE = os.getenv("NEXUS_RETRIEVAL_MODE", HYBRID)
+FUSION = os.getenv("NEXUS_FUSION", RRF)
+RRF_K = int(os.getenv("NEXUS_RRF_K", "60"))
+LEXICAL_WEIGHT = float(os.getenv("NEXUS_LEXICAL_WEIGHT", "0.5"))
+# Each ranking is cut at k * HYBRID_DEPTH before fusing
+HYBRID_DEPTH = int(os.getenv("NEXUS_HYBRID_DEPTH", "4"))
+
+_TOKEN = re.compile(r"[a-z0-9](?:[a-z0-9_.\-]*[a-z0-9])?")
+_SPLIT = re.compile(r"[_.\-]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased terms. Compound tokens ("gpt-4o", "all-minilm-l6-v2", "KeyError")
+    are kept whole and also split into parts, so exact identifiers and their
+    pieces both match.
+    """
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        terms.append(token)
+        parts = _SPLIT.split(token)
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p and p not in _STOPWORDS)
+    return terms
+
+
+class BM25Index:
+    """
+    Incremental BM25 inverted index.
+    --------------------------------
+    - Postings are compact arrays of (FAISS position, term frequency), appended
+      in position order as insights are added
+    - Document lengths and corpus statistics are updated per insert, so there
+      is no separate build step
+    - search() can be restricted to a candidate set (metadata filters) and
+      skip evicted positions until the next compaction
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.clear()
+
+    def clear(self):
+        self._positions: Dict[str, array] = {}
+        self._freqs: Dict[str, array] = {}
+        self._lengths = array("I")
+        self._total_length = 0
+
+    @property
+    def size(self) -> int:
+        return len(self._lengths)
+
+    def add(self, position: int, text: str):
+        # Positions are dense and append-only; pad any gap with empty documents
+        while len(self._lengths) < position:
+            self._lengths.append(0)
+        terms = tokenize(text)
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, tf in counts.items():
+            if term not in self._positions:
+                self._positions[term] = array("I")
+                self._freqs[term] = array("H")
+            self._positions[term].append(position)
+            self._freqs[term].append(min(tf, 65535))
+        self._lengths.append(len(terms))
+        self._total_length += len(terms)
+
+    def add_many(self, start: int, texts: Iterable[str]):
+        for offset, text in enumerate(texts):
+            self.add(start + offset, text)
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        candidates: Optional[Set[int]] = None,
+        exclude: Optional[Set[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """Top-k (position, bm25 score), best first, skipping positions in exclude."""
+        n = self.size
+        if not n or k <= 0:
+            return []
+        avg_length = self._total_length / n or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            positions = self._positions.get(term)
+            if positions is None:
+                continue
+            df = len(positions)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for position, tf in zip(positions, self._freqs[term]):
+                if candidates is not None and position not in candidates:
+                    continue
+                if exclude and position in exclude:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[position] / avg_length)
+                scores[position] = scores.get(position, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def stats(self) -> Dict[str, int]:
+        return {"documents": self.size, "terms": len(self._positions)}
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], rrf_k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Fuse ranked position lists: score = sum over lists of 1 / (rrf_k + rank)."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, position in enumerate(ranking, 1):
+            scores[position] = scores.get(position, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def weighted_fusion(
+    vector_hits: List[Tuple[int, float]],
+    lexical_hits: List[Tuple[int, float]],
+    lexical_weight: float = LEXICAL_WEIGHT
+) -> List[Tuple[int, float]]:
+    """
+    Blend min-max normalized scores. vector_hits carry distances (lower is
+    better), lexical_hits BM25 scores (higher is better).
+    """
+    def normalized(hits, lower_is_better):
+        if not hits:
+            return {}
+        values = [score for _, score in hits]
+        lo, hi = min(values), max(values)
+        span = (hi - lo) or 1.0
+        return {
+            position: ((hi - score) if lower_is_better else (score - lo)) / span if hi != lo else 1.0
+            for position, score in hits
+        }
+
+    vec = normalized(vector_hits, lower_is_better=True)
+    lex = normalized(lexical_hits, lower_is_better=False)
+    scores = {
+        position: (1 - lexical_weight) * vec.get(position, 0.0) + lexical_weight * lex.get(position, 0.0)
+        for position in set(vec) | set(lex)
+    }
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,340 @@
+import os
+import time
+import random
+from typing import Any, Dict, List, Optional, Sequence
+
+# Index kinds
+FLAT = "flat"    # exact search, linear in memory size
+HNSW = "hnsw"    # graph index, no training, fast inserts
+IVF = "ivf"      # inverted lists, trained on a sample, smallest memory overhead
+INDEX_KINDS = (FLAT, HNSW, IVF)
+
+# Tiering settings (override via environment)
+ANN_INDEX = os.getenv("NEXUS_ANN_INDEX", HNSW)
+ANN_THRESHOLD = int(os.getenv("NEXUS_ANN_THRESHOLD", "50000"))
+HNSW_M = int(os.getenv("NEXUS_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("NEXUS_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("NEXUS_HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.getenv("NEXUS_IVF_NLIST", "0"))       # 0 = 4 * sqrt(n) at build time
+IVF_NPROBE = int(os.getenv("NEXUS_IVF_NPROBE", "16"))
+# Filtered searches over at most this many candidates are exact scans
+FILTER_EXACT_LIMIT = int(os.getenv("NEXUS_FILTER_EXACT_LIMIT", "20000"))
+
+# Vectors copied out of an index per step when rebuilding or computing exact results
+_CHUNK = 65536
+
+
+def index_kind(index) -> str:
+    """FLAT, HNSW or IVF for a faiss index."""
+    import faiss
+
+    if isinstance(index, faiss.IndexHNSW):
+        return HNSW
+    if isinstance(index, faiss.IndexIVF):
+        return IVF
+    return FLAT
+
+
+def reconstruct(index, start: int = 0, stop: Optional[int] = None):
+    """Stored vectors [start, stop) as a float32 matrix, in insertion order."""
+    import faiss
+    import numpy as np
+
+    stop = index.ntotal if stop is None else stop
+    if stop <= start:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if isinstance(index, faiss.IndexIVF) and index.direct_map.type == faiss.DirectMap.NoMap:
+        index.make_direct_map()
+    return np.vstack([
+        index.reconstruct_n(pos, min(_CHUNK, stop - pos))
+        for pos in range(start, stop, _CHUNK)
+    ]).astype(np.float32, copy=False)
+
+
+class IndexTiering:
+    """
+    Size-based FAISS index tiering.
+    -------------------------------
+    - Below `threshold` vectors the memory uses an exact flat index
+    - At `threshold` it is rebuilt as HNSW or IVF (index_type)
+    - IVF is retrained once the memory has grown enough that nlist is too small
+    - Shrinking below half the threshold goes back to flat
+    - Search parameters (ef_search / nprobe) can be changed at any time;
+      recall() measures them against exact search
+
+    RAGManager runs the rebuild in a background thread; this class only decides
+    and builds.
+    """
+
+    def __init__(
+        self,
+        index_type: str = ANN_INDEX,
+        threshold: int = ANN_THRESHOLD,
+        hnsw_m: int = HNSW_M,
+        hnsw_ef_construction: int = HNSW_EF_CONSTRUCTION,
+        hnsw_ef_search: int = HNSW_EF_SEARCH,
+        ivf_nlist: int = IVF_NLIST,
+        ivf_nprobe: int = IVF_NPROBE,
+        background: bool = True,
+        filter_exact_limit: int = FILTER_EXACT_LIMIT
+    ):
+        """
+        Args:
+            index_type: HNSW or IVF, used once the memory reaches threshold
+                (FLAT disables tiering).
+            threshold: vector count at which the flat index is replaced.
+            hnsw_m: HNSW graph degree (memory vs. recall).
+            hnsw_ef_construction: HNSW build-time beam width.
+            hnsw_ef_search: HNSW query-time beam width (latency vs. recall).
+            ivf_nlist: IVF cluster count; 0 picks 4 * sqrt(n) at build time.
+            ivf_nprobe: IVF clusters scanned per query (latency vs. recall).
+            background: rebuild in a background thread instead of inline.
+            filter_exact_limit: candidate count up to which filtered searches
+                scan exactly instead of using the ANN index (see search_subset).
+        """
+        if index_type not in INDEX_KINDS:
+            raise ValueError(f"Unknown index_type {index_type!r}; expected one of {INDEX_KINDS}")
+        self.index_type = index_type
+        self.threshold = max(1, int(threshold))
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        self.ivf_nlist = ivf_nlist
+        self.ivf_nprobe = ivf_nprobe
+        self.background = background
+        self.filter_exact_limit = max(0, int(filter_exact_limit))
+
+    def _nlist_for(self, n: int) -> int:
+        nlist = self.ivf_nlist or int(4 * n ** 0.5)
+        # faiss wants roughly 39 training points per centroid
+        return max(1, min(nlist, n // 39 or 1))
+
+    def kind_for(self, n: int, current: str) -> str:
+        """Kind an index of n vectors should be, given its current kind."""
+        if self.index_type == FLAT or n < self.threshold:
+            # Hysteresis: only fall back to flat well below the threshold
+            if current != FLAT and (self.index_type == FLAT or n < self.threshold // 2):
+                return FLAT
+            return current
+        return self.index_type
+
+    def target_kind(self, index) -> Optional[str]:
+        """Kind the index should be rebuilt as, or None if it is fine as is."""
+        n, current = index.ntotal, index_kind(index)
+        kind = self.kind_for(n, current)
+        if kind != current:
+            return kind
+        if kind == FLAT or kind != self.index_type:
+            return None
+        if current == IVF and not self.ivf_nlist and self._nlist_for(n) >= 2 * index.nlist:
+            return IVF   # grown ~4x since training
+        return None
+
+    def build(self, kind: str, vectors, metric: Optional[int] = None):
+        """New index of `kind` holding `vectors` (same order, so docstore positions stay valid)."""
+        import faiss
+        import numpy as np
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n, d = vectors.shape
+        metric = faiss.METRIC_L2 if metric is None else metric
+
+        if kind == HNSW:
+            index = faiss.IndexHNSWFlat(d, self.hnsw_m, metric)
+            index.hnsw.efConstruction = self.hnsw_ef_construction
+        elif kind == IVF:
+            nlist = self._nlist_for(n)
+            index = faiss.IndexIVFFlat(faiss.IndexFlat(d, metric), d, nlist, metric)
+            sample = vectors
+            if n > 256 * nlist:
+                rows = np.random.default_rng(0).choice(n, 256 * nlist, replace=False)
+                sample = vectors[np.sort(rows)]
+            index.train(sample)
+            index.make_direct_map()
+        else:
+            index = faiss.IndexFlat(d, metric)
+
+        for start in range(0, n, _CHUNK):
+            index.add(vectors[start:start + _CHUNK])
+        self.apply_search_params(index)
+        return index
+
+    def apply_search_params(self, index):
+        """Set ef_search / nprobe on index from the current settings."""
+        kind = index_kind(index)
+        if kind == HNSW:
+            index.hnsw.efSearch = self.hnsw_ef_search
+        elif kind == IVF:
+            index.nprobe = self.ivf_nprobe
+
+    def search_params(self, index) -> Dict[str, Any]:
+        kind = index_kind(index)
+        if kind == HNSW:
+            return {"ef_search": index.hnsw.efSearch}
+        if kind == IVF:
+            return {"nlist": index.nlist, "nprobe": index.nprobe}
+        return {}
+
+    @staticmethod
+    def _selector_params(index, selector, k: int):
+        import faiss
+
+        kind = index_kind(index)
+        if kind == HNSW:
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=max(index.hnsw.efSearch, k))
+        if kind == IVF:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+        return faiss.SearchParameters(sel=selector)
+
+    def search(self, index, vector, k: int, positions=None, exclude=None):
+        """
+        Top-k (distances, positions) over the whole index, or only `positions`
+        if given. Positions in `exclude` (evicted entries awaiting compaction)
+        are skipped by the index itself rather than filtered afterwards.
+        """
+        import faiss
+        import numpy as np
+
+        if positions is not None:
+            return self.search_subset(index, vector, k, positions)
+        query = np.asarray([vector], dtype=np.float32)
+        if exclude:
+            skipped = faiss.IDSelectorBatch(np.fromiter(exclude, dtype=np.int64, count=len(exclude)))
+            selector = faiss.IDSelectorNot(skipped)
+            dists, found = index.search(query, k, params=self._selector_params(index, selector, k))
+            del selector, skipped   # the selector only borrows `skipped`; keep both alive until here
+        else:
+            dists, found = index.search(query, k)
+        keep = found[0] >= 0
+        return dists[0][keep], found[0][keep]
+
+    def search_subset(self, index, vector, k: int, positions):
+        """
+        Top-k (distances, positions) among `positions` only. Subsets up to
+        filter_exact_limit are scanned exactly, so selective filters cost
+        O(len(positions)); larger ones use the index with an id selector, and
+        fall back to the exact scan if that finds fewer than k.
+        """
+        import faiss
+        import numpy as np
+
+        query = np.asarray([vector], dtype=np.float32)
+        ids = np.fromiter(positions, dtype=np.int64, count=len(positions))
+        k = min(k, len(ids))
+        if not k:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+        if len(ids) > self.filter_exact_limit:
+            selector = faiss.IDSelectorBatch(ids)
+            dists, found = index.search(query, k, params=self._selector_params(index, selector, k))
+            keep = found[0] >= 0
+            if keep.sum() >= k:
+                return dists[0][keep], found[0][keep]
+
+        ids.sort()
+        if isinstance(index, faiss.IndexIVF) and index.direct_map.type == faiss.DirectMap.NoMap:
+            index.make_direct_map()
+        best_d, best_i = [], []
+        for start in range(0, len(ids), _CHUNK):
+            block = ids[start:start + _CHUNK]
+            vectors = index.reconstruct_batch(block)
+            if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                dists = -(vectors @ query[0])
+            else:
+                dists = np.sum((vectors - query) ** 2, axis=1)
+            order = np.argsort(dists, kind="stable")[:k]
+            best_d.append(dists[order])
+            best_i.append(block[order])
+        dists, found = np.concatenate(best_d), np.concatenate(best_i)
+        order = np.argsort(dists, kind="stable")[:k]
+        if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            return -dists[order], found[order]
+        return dists[order], found[order]
+
+    @staticmethod
+    def exact_search(index, queries, k: int):
+        """Exact top-k (distances, ids) for queries, computed from the stored vectors in chunks."""
+        import faiss
+        import numpy as np
+
+        ids, dists = [], []
+        for start in range(0, index.ntotal, _CHUNK):
+            block = reconstruct(index, start, min(index.ntotal, start + _CHUNK))
+            flat = faiss.IndexFlat(index.d, index.metric_type)
+            flat.add(block)
+            d, i = flat.search(queries, min(k, len(block)))
+            dists.append(d)
+            ids.append(i + start)
+        dists, ids = np.hstack(dists), np.hstack(ids)
+        sign = -1 if index.metric_type == faiss.METRIC_INNER_PRODUCT else 1
+        order = np.argsort(sign * dists, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(dists, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def recall(self, index, queries=None, k: int = 10, sample: int = 200, sweep: Optional[Sequence[int]] = None, seed: int = 0) -> Dict[str, Any]:
+        """
+        Recall@k of index against exact search, with per-query latency. A result
+        counts as a hit if it is no farther than the exact k-th neighbour, so
+        ties between identical vectors are not counted as misses.
+
+        Args:
+            index: the faiss index to measure.
+            queries: query vectors (n x d). If None, `sample` stored vectors are
+                used; real query embeddings give a more representative figure.
+            k: neighbours compared per query.
+            sample: stored vectors to use as queries when queries is None.
+            sweep: ef_search (HNSW) or nprobe (IVF) values to try; the index's
+                current setting is restored afterwards.
+        Returns:
+            {"index", "ntotal", "k", "queries", "exact_ms_per_query", "results"}
+            where results holds one {param: value, "recall", "ms_per_query"} row
+            per setting.
+        """
+        import faiss
+        import numpy as np
+
+        kind = index_kind(index)
+        n = index.ntotal
+        if queries is None:
+            rows = sorted(random.Random(seed).sample(range(n), min(sample, n)))
+            queries = np.vstack([reconstruct(index, r, r + 1) for r in rows]) if rows else None
+        if queries is None:
+            queries = np.zeros((0, index.d), dtype=np.float32)
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        k = max(1, min(k, n))
+        report: Dict[str, Any] = {"index": kind, "ntotal": n, "k": k, "queries": len(queries)}
+        if not n or not len(queries):
+            report.update({"exact_ms_per_query": 0.0, "results": []})
+            return report
+
+        started = time.perf_counter()
+        truth, _ = self.exact_search(index, queries, k)
+        sign = -1 if index.metric_type == faiss.METRIC_INNER_PRODUCT else 1
+        # k-th exact distance per query, with float slack
+        cutoff = sign * truth[:, -1:] + 1e-5 * np.maximum(1.0, np.abs(truth[:, -1:]))
+        report["exact_ms_per_query"] = round((time.perf_counter() - started) * 1000 / len(queries), 4)
+
+        param = {HNSW: "ef_search", IVF: "nprobe"}.get(kind)
+        current = self.search_params(index).get(param)
+        values: List[Optional[int]] = list(sweep) if (sweep and param) else [current]
+        results = []
+        try:
+            for value in values:
+                if kind == HNSW:
+                    index.hnsw.efSearch = max(value, k)
+                elif kind == IVF:
+                    index.nprobe = value
+                started = time.perf_counter()
+                dists, found = index.search(queries, k)
+                elapsed = time.perf_counter() - started
+                hits = int(np.sum((found >= 0) & (sign * dists <= cutoff)))
+                row = {"recall": round(hits / (len(queries) * k), 4), "ms_per_query": round(elapsed * 1000 / len(queries), 4)}
+                if param:
+                    row[param] = value
+                results.append(row)
+        finally:
+            if kind == HNSW:
+                index.hnsw.efSearch = current
+            elif kind == IVF:
+                index.nprobe = current
+        report["results"] = results
+        return report
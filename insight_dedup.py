@@ -0,0 +1,211 @@
+import os
+import json
+import hashlib
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from hybrid_search import tokenize
+from insight_record import RECORD_KEY
+
+# Near-duplicate thresholds (override via environment)
+DEDUP_ENABLED = os.getenv("NEXUS_DEDUP", "1") != "0"
+DEDUP_MIN_SIMILARITY = float(os.getenv("NEXUS_DEDUP_MIN_SIMILARITY", "0.97"))
+# Insights are short, so one changed word moves the 64-bit SimHash by ~10 bits (and
+# unrelated insights can land as close); it only pre-filters, the term overlap decides
+DEDUP_MAX_HAMMING = int(os.getenv("NEXUS_DEDUP_MAX_HAMMING", "16"))
+# Jaccard overlap of the two insights' terms (one changed word in ~20 terms is ~0.9;
+# insights differing in summary, recommendation or error stay below ~0.85)
+DEDUP_MIN_OVERLAP = float(os.getenv("NEXUS_DEDUP_MIN_OVERLAP", "0.88"))
+DEDUP_PROBE_K = int(os.getenv("NEXUS_DEDUP_PROBE_K", "4"))
+
+# Fields that differ between otherwise identical insights
+_VOLATILE_KEYS = ("session_id", "timestamp")
+
+
+def _leaves(value: Any) -> Iterable[str]:
+    if isinstance(value, dict):
+        for key in sorted(value):
+            yield from _leaves(value[key])
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _leaves(item)
+    elif value is not None:
+        yield str(value)
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of text's terms, weighted by term frequency."""
+    weights = [0] * 64
+    counts: Dict[str, int] = {}
+    for term in tokenize(text):
+        counts[term] = counts.get(term, 0) + 1
+    for term, tf in counts.items():
+        h = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += tf if (h >> bit) & 1 else -tf
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def _content(insight: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in insight.items() if key not in _VOLATILE_KEYS}
+
+
+def fingerprint(insight: Dict[str, Any]) -> Tuple[str, int]:
+    """(content hash, simhash) of an insight, ignoring session id and timestamp."""
+    content = _content(insight)
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest(), simhash(" ".join(_leaves(content)))
+
+
+def _terms(insight: Dict[str, Any]) -> Set[str]:
+    return set(tokenize(" ".join(_leaves(_content(insight)))))
+
+
+def term_overlap(a: Dict[str, Any], b: Dict[str, Any]) -> float:
+    """Jaccard overlap of two insights' terms, ignoring session id and timestamp."""
+    terms_a, terms_b = _terms(a), _terms(b)
+    union = terms_a | terms_b
+    return len(terms_a & terms_b) / len(union) if union else 1.0
+
+
+def merge_records(stored: Dict[str, Any], newer: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The insight kept for a merged duplicate: newer's fields, with list fields
+    (recommendations, errors, tags, ...) unioned with stored's so nothing
+    either insight said is lost. Session id and timestamp stay the stored ones.
+    """
+    merged = dict(stored)
+    for key, value in newer.items():
+        if key in _VOLATILE_KEYS and key in stored:
+            continue
+        old = stored.get(key)
+        if isinstance(old, dict) and isinstance(value, dict):
+            merged[key] = merge_records(old, value)
+        elif isinstance(old, list) and isinstance(value, list):
+            seen = {json.dumps(item, sort_keys=True, default=str) for item in old}
+            merged[key] = old + [item for item in value if json.dumps(item, sort_keys=True, default=str) not in seen]
+        elif value not in (None, "", [], {}):
+            merged[key] = value
+    return merged
+
+
+class InsightDeduplicator:
+    """
+    Duplicate detection for insight inserts.
+    ----------------------------------------
+    - Exact duplicates: same content hash (session id and timestamp ignored);
+      found before anything is embedded
+    - Near duplicates: an ANN probe finds stored neighbours with cosine
+      similarity >= min_similarity and SimHash Hamming distance <= max_hamming,
+      confirmed by term overlap >= min_overlap, and within the same tenant
+    - RAGManager merges a duplicate into the stored entry (hit_count,
+      last_seen, session_ids, and the records via merge_records) instead of
+      adding a vector
+
+    Hashes are keyed by FAISS position and rebuilt with the other secondary
+    indexes.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = DEDUP_ENABLED,
+        min_similarity: float = DEDUP_MIN_SIMILARITY,
+        max_hamming: int = DEDUP_MAX_HAMMING,
+        probe_k: int = DEDUP_PROBE_K,
+        min_overlap: float = DEDUP_MIN_OVERLAP
+    ):
+        """
+        Args:
+            enabled: False stores every insert as a new entry.
+            min_similarity: cosine similarity at which a neighbour may be a near duplicate.
+            max_hamming: largest SimHash distance (of 64 bits) for a candidate.
+            probe_k: stored neighbours checked per insert.
+            min_overlap: term overlap (Jaccard) of the two insights that confirms it.
+        """
+        self.enabled = enabled
+        self.min_similarity = min_similarity
+        self.max_hamming = max_hamming
+        self.min_overlap = min_overlap
+        self.probe_k = max(1, int(probe_k))
+        self.clear()
+
+    def clear(self):
+        self._by_hash: Dict[str, int] = {}
+        self._simhashes = array("Q")
+        self._tenants: Dict[int, Optional[str]] = {}
+
+    def add(self, position: int, metadata: Dict[str, Any]):
+        while len(self._simhashes) < position:
+            self._simhashes.append(0)
+        content_hash = metadata.get("content_hash")
+        if content_hash:
+            self._by_hash.setdefault(content_hash, position)
+        self._simhashes.append(int(metadata.get("simhash") or 0))
+        if metadata.get("tenant_id") is not None:
+            self._tenants[position] = metadata["tenant_id"]
+
+    def add_many(self, start: int, metadatas: Iterable[Dict[str, Any]]):
+        for offset, metadata in enumerate(metadatas):
+            self.add(start + offset, metadata or {})
+
+    def discard(self, position: int, metadata: Dict[str, Any]):
+        """Forget an evicted entry, so a later insert of the same content is stored anew."""
+        if self._by_hash.get(metadata.get("content_hash")) == position:
+            del self._by_hash[metadata["content_hash"]]
+        self._tenants.pop(position, None)
+        if position < len(self._simhashes):
+            self._simhashes[position] = 0
+
+    def exact(self, metadata: Dict[str, Any]) -> Optional[int]:
+        """Position of a stored insight with the same content hash."""
+        if not self.enabled:
+            return None
+        return self._by_hash.get(metadata.get("content_hash"))
+
+    def _overlaps(self, record: Optional[Dict[str, Any]], other: Optional[Dict[str, Any]]) -> bool:
+        # Without both records there is nothing to merge safely
+        return record is not None and other is not None and term_overlap(record, other) >= self.min_overlap
+
+    def near(
+        self,
+        metadata: Dict[str, Any],
+        neighbours: List[Tuple[int, float]],
+        stored_record: Callable[[int], Optional[Dict[str, Any]]]
+    ) -> Optional[int]:
+        """
+        First neighbour (position, cosine similarity) that is a near duplicate
+        of the insight described by metadata; stored_record(position) returns
+        a stored neighbour's insight.
+        """
+        if not self.enabled:
+            return None
+        sketch = int(metadata.get("simhash") or 0)
+        for position, similarity in neighbours:
+            if similarity < self.min_similarity or position >= len(self._simhashes):
+                continue
+            if self._tenants.get(position) != metadata.get("tenant_id"):
+                continue
+            if bin(self._simhashes[position] ^ sketch).count("1") > self.max_hamming:
+                continue
+            if self._overlaps(metadata.get(RECORD_KEY), stored_record(position)):
+                return position
+        return None
+
+    def near_in_batch(self, metadata: Dict[str, Any], vector, batch: List[Tuple[Dict[str, Any], Any]]) -> Optional[int]:
+        """Index into batch of an earlier (metadata, unit vector) pair that vector/metadata duplicates."""
+        if not self.enabled:
+            return None
+        import numpy as np
+
+        sketch = int(metadata.get("simhash") or 0)
+        for i, (other, other_vector) in enumerate(batch):
+            if other_vector is None or other.get("tenant_id") != metadata.get("tenant_id"):
+                continue
+            if bin(int(other.get("simhash") or 0) ^ sketch).count("1") > self.max_hamming:
+                continue
+            if float(np.dot(vector, other_vector)) >= self.min_similarity and self._overlaps(metadata.get(RECORD_KEY), other.get(RECORD_KEY)):
+                return i
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "hashes": len(self._by_hash)}
@@ -0,0 +1,81 @@
+import json
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+# Docstore metadata key holding the structured insight
+RECORD_KEY = "insight"
+
+# Fields embedded first, wherever they appear in the insight (MiniLM truncates
+# long inputs, so the most useful text must come early)
+_PRIORITY = (
+    "insight_summary",
+    "recommendations",
+    "common_errors",
+    "fix_patterns",
+    "code_framework_preference",
+    "user_style_preference",
+    "relevance_tags"
+)
+# Bookkeeping fields that carry no meaning for retrieval
+_SKIP = ("session_id", "session_ids", "tenant_id", "timestamp")
+
+
+def _text(value: Any) -> str:
+    if isinstance(value, dict):
+        return ", ".join(f"{key}: {_text(item)}" for key, item in value.items() if item not in (None, "", [], {}))
+    if isinstance(value, (list, tuple)):
+        return "; ".join(_text(item) for item in value if item not in (None, "", [], {}))
+    return "" if value is None else str(value).strip()
+
+
+def _label(key: str) -> str:
+    return key.replace("_", " ").capitalize()
+
+
+def _fields(insight: Dict[str, Any], section: str = "") -> Iterator[Tuple[str, str, str]]:
+    """
+    (key, label, text) for each leaf field; lists are joined, nested dicts are
+    descended into. The label keeps the enclosing sections ("Corrective
+    knowledge / Fix") so equal keys under different sections stay distinct.
+    """
+    for key, value in insight.items():
+        if key in _SKIP:
+            continue
+        label = f"{section} / {_label(key)}" if section else _label(key)
+        if isinstance(value, dict):
+            yield from _fields(value, label)
+        else:
+            text = _text(value)
+            if text:
+                yield key, label, text
+
+
+def distill(insight: Dict[str, Any]) -> str:
+    """
+    Plain "Label: value" lines of an insight's meaningful fields, most useful
+    first. This is the only text that is embedded and BM25-indexed; the
+    insight itself is kept as a structured record next to it.
+    """
+    rank = {key: i for i, key in enumerate(_PRIORITY)}
+    fields = sorted(_fields(insight), key=lambda field: rank.get(field[0], len(_PRIORITY)))
+    return "\n".join(f"{label}: {text}" for _, label, text in fields)
+
+
+def stored_insight(doc) -> Optional[Dict[str, Any]]:
+    """
+    The structured insight behind a stored document. Memories written before
+    records existed kept the insight as pretty-printed JSON text; those are
+    parsed once and the result cached on the document.
+    """
+    metadata = doc.metadata
+    if RECORD_KEY not in metadata:
+        try:
+            record = json.loads(doc.page_content)
+        except (ValueError, TypeError):
+            record = None
+        metadata[RECORD_KEY] = record if isinstance(record, dict) else None
+    return metadata[RECORD_KEY]
+
+
+def is_legacy_text(doc) -> bool:
+    """Whether doc's text (and so its vector) is the old JSON dump rather than distilled text."""
+    return doc.page_content.lstrip().startswith("{")
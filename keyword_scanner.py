@@ -0,0 +1,127 @@
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+# Common English inflections accepted after a keyword ("attacks", "hacked", "exploiting")
+INFLECTION_SUFFIX = r"(?:s|es|ed|ing|er|ers)?"
+_MAX_SUFFIX_LEN = 4
+
+
+class KeywordHit(NamedTuple):
+    keyword: str
+    start: int
+    end: int
+    matched: str
+
+
+def _trie_to_regex(node: Dict) -> str:
+    """Turn a character trie into an equivalent regex that never re-tries shared prefixes."""
+    terminal = "" in node
+    branches = [re.escape(ch) + _trie_to_regex(child) for ch, child in sorted(node.items()) if ch != ""]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if terminal:
+        return "(?:" + "|".join(branches) + ")?"
+    return body
+
+
+class KeywordScanner:
+    """
+    Multi-keyword matcher compiled into one trie-shaped regex.
+    ---------------------------------------------------------
+    - One pass over the text regardless of how many keywords there are
+    - Case-insensitive, with optional word boundaries ("skill" does not match "kill")
+    - Returns every hit with its position
+    - stream() scans text chunk by chunk, reporting each hit exactly once
+    """
+
+    def __init__(self, keywords: Iterable[str], word_boundaries: bool = True, match_inflections: bool = True):
+        self.keywords = sorted({k.strip().lower() for k in keywords if k and k.strip()})
+        self.word_boundaries = word_boundaries
+        self.match_inflections = match_inflections and word_boundaries
+
+        trie: Dict = {}
+        for word in self.keywords:
+            node = trie
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[""] = True
+
+        body = _trie_to_regex(trie) if self.keywords else r"(?!x)x"
+        pattern = f"(?P<kw>{body})"
+        if self.match_inflections:
+            pattern += INFLECTION_SUFFIX
+        if word_boundaries:
+            pattern = rf"(?<!\w){pattern}(?!\w)"
+        self.pattern = re.compile(pattern, re.IGNORECASE)
+
+        longest = max((len(k) for k in self.keywords), default=0)
+        # Characters that must stay buffered between chunks before a match near the end is final
+        self.holdback = longest + (_MAX_SUFFIX_LEN if self.match_inflections else 0) + 1
+
+    def _hit(self, match: "re.Match", offset: int = 0) -> KeywordHit:
+        return KeywordHit(
+            keyword=match.group("kw").lower(),
+            start=offset + match.start(),
+            end=offset + match.end(),
+            matched=match.group(0)
+        )
+
+    def scan(self, text: str) -> List[KeywordHit]:
+        """Return every keyword occurrence in text, in order."""
+        return [self._hit(m) for m in self.pattern.finditer(text)]
+
+    def find_keywords(self, text: str) -> List[str]:
+        """Distinct keywords present in text, in order of first occurrence."""
+        return list(dict.fromkeys(hit.keyword for hit in self.scan(text)))
+
+    def stream(self) -> "KeywordStream":
+        return KeywordStream(self)
+
+
+class KeywordStream:
+    """Incremental scanner: feed() chunks as they arrive, then finish()."""
+
+    def __init__(self, scanner: KeywordScanner):
+        self.scanner = scanner
+        self._buffer = ""
+        self._offset = 0      # absolute position of _buffer[0]
+        self._scan_from = 0   # index in _buffer where unscanned text starts
+        self.hits: List[KeywordHit] = []
+
+    def _scan(self, final: bool) -> List[KeywordHit]:
+        buffer = self._buffer
+        safe = len(buffer) if final else len(buffer) - self.scanner.holdback
+        resume: Optional[int] = None
+        last_end = self._scan_from
+        new_hits = []
+
+        for match in self.scanner.pattern.finditer(buffer, self._scan_from):
+            if not final and match.end() > safe:
+                # Could still grow or lose its boundary once more text arrives
+                resume = match.start()
+                break
+            new_hits.append(self.scanner._hit(match, self._offset))
+            last_end = match.end()
+
+        if resume is None:
+            resume = max(safe, last_end)
+        resume = max(resume, last_end)
+
+        # Keep one character before the resume point so the lookbehind boundary still works
+        keep_from = max(0, resume - 1)
+        self._buffer = buffer[keep_from:]
+        self._offset += keep_from
+        self._scan_from = resume - keep_from
+
+        self.hits.extend(new_hits)
+        return new_hits
+
+    def feed(self, chunk: str) -> List[KeywordHit]:
+        """Add a chunk and return the hits that are now final."""
+        self._buffer += chunk
+        return self._scan(final=False)
+
+    def finish(self) -> List[KeywordHit]:
+        """Flush the buffered tail and return its hits."""
+        return self._scan(final=True)
@@ -0,0 +1,327 @@
+import os
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+from langchain_core.messages import AIMessage
+
+from tracing import record_llm_call
+
+DEFAULT_LLM_CACHE_PATH = os.getenv("NEXUS_LLM_CACHE_PATH", "./.nexus_cache/llm_cache.sqlite3")
+
+# Marks responses served from the cache so callers (and tracing) can tell them apart
+CACHE_HIT_METADATA = {"nexus_cache": "hit"}
+
+
+class LLMResponseCache:
+    """
+    SQLite-backed cache of LLM completions.
+    ---------------------------------------
+    - Keyed on sha256(deployment, temperature, prompt)
+    - Entries older than ttl_seconds are treated as misses and dropped
+    - At most max_entries rows; least recently used rows are evicted first
+    """
+
+    def __init__(self, path: str = DEFAULT_LLM_CACHE_PATH, ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 5000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, int(max_entries))
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " content TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(deployment: Optional[str], temperature: Optional[float], prompt: Any) -> str:
+        payload = f"{deployment}\x00{temperature}\x00{prompt if isinstance(prompt, str) else repr(prompt)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+
+            content, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.counters["hits"] += 1
+            return content
+
+    def contains(self, key: str) -> bool:
+        """Whether get(key) would hit, without counting a lookup or touching the entry."""
+        with self._lock:
+            row = self._conn.execute("SELECT created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and (self.ttl_seconds is None or time.time() - row[0] <= self.ttl_seconds)
+
+    def put(self, key: str, content: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, content, now, now)
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.counters["evictions"] += overflow
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+            return {**self.counters, "entries": count, "max_entries": self.max_entries}
+
+
+class CachedLLM:
+    """
+    Wraps an LLM client so identical prompts are served from LLMResponseCache.
+
+    invoke(prompt, cache=False) bypasses the cache for a single call (the fresh
+    response is still stored). Every other attribute is forwarded to the client.
+    """
+
+    def __init__(self, llm_client, cache: LLMResponseCache, deployment: Optional[str] = None, temperature: Optional[float] = None):
+        self.llm = llm_client
+        self.cache = cache
+        self.deployment = deployment
+        self.temperature = temperature
+
+    def invoke(self, prompt, cache: bool = True, **kwargs):
+        key = self.cache.make_key(self.deployment, self.temperature, prompt)
+        if cache and not kwargs:
+            content = self.cache.get(key)
+            if content is not None:
+                return AIMessage(content=content, response_metadata=CACHE_HIT_METADATA)
+
+        response = self.llm.invoke(prompt, **kwargs)
+        content = getattr(response, "content", None)
+        if isinstance(content, str) and content and not kwargs:
+            self.cache.put(key, content)
+        return response
+
+    def stream(self, prompt, cache: bool = True, **kwargs) -> Iterator:
+        """Stream chunks from the client; a cache hit is replayed as a single chunk."""
+        key = self.cache.make_key(self.deployment, self.temperature, prompt)
+        if cache and not kwargs:
+            content = self.cache.get(key)
+            if content is not None:
+                yield AIMessage(content=content, response_metadata=CACHE_HIT_METADATA)
+                return
+
+        if not hasattr(self.llm, "stream"):
+            yield self.invoke(prompt, cache=False, **kwargs)
+            return
+
+        parts = []
+        for chunk in self.llm.stream(prompt, **kwargs):
+            text = getattr(chunk, "content", None)
+            if isinstance(text, str):
+                parts.append(text)
+            yield chunk
+        if parts and not kwargs:
+            self.cache.put(key, "".join(parts))
+
+    async def ainvoke(self, prompt, cache: bool = True, **kwargs):
+        """Async invoke; SQLite access runs in a worker thread to keep the event loop free."""
+        key = self.cache.make_key(self.deployment, self.temperature, prompt)
+        if cache and not kwargs:
+            content = await asyncio.to_thread(self.cache.get, key)
+            if content is not None:
+                return AIMessage(content=content, response_metadata=CACHE_HIT_METADATA)
+
+        if hasattr(self.llm, "ainvoke"):
+            response = await self.llm.ainvoke(prompt, **kwargs)
+        else:
+            response = await asyncio.to_thread(self.llm.invoke, prompt, **kwargs)
+        content = getattr(response, "content", None)
+        if isinstance(content, str) and content and not kwargs:
+            await asyncio.to_thread(self.cache.put, key, content)
+        return response
+
+    async def astream(self, prompt, cache: bool = True, **kwargs) -> AsyncIterator:
+        """Async counterpart of stream()."""
+        key = self.cache.make_key(self.deployment, self.temperature, prompt)
+        if cache and not kwargs:
+            content = await asyncio.to_thread(self.cache.get, key)
+            if content is not None:
+                yield AIMessage(content=content, response_metadata=CACHE_HIT_METADATA)
+                return
+
+        if not hasattr(self.llm, "astream"):
+            yield await self.ainvoke(prompt, cache=False, **kwargs)
+            return
+
+        parts = []
+        async for chunk in self.llm.astream(prompt, **kwargs):
+            text = getattr(chunk, "content", None)
+            if isinstance(text, str):
+                parts.append(text)
+            yield chunk
+        if parts and not kwargs:
+            await asyncio.to_thread(self.cache.put, key, "".join(parts))
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+
+def _response_text(response) -> str:
+    return getattr(response, "content", None) or getattr(response, "text", None) or str(response)
+
+
+def _record(prompt, response, started: float):
+    """Report one LLM round-trip to the current tracing span."""
+    metadata = getattr(response, "response_metadata", None) or {}
+    record_llm_call(
+        latency=time.perf_counter() - started,
+        prompt_chars=len(prompt) if isinstance(prompt, str) else len(repr(prompt)),
+        completion_chars=len(_response_text(response)),
+        cached=metadata.get("nexus_cache") == "hit"
+    )
+
+
+def has_cached_response(llm_client, prompt) -> bool:
+    """Whether llm_client would answer prompt from its response cache (False for uncached clients)."""
+    if not isinstance(llm_client, CachedLLM):
+        return False
+    return llm_client.cache.contains(llm_client.cache.make_key(llm_client.deployment, llm_client.temperature, prompt))
+
+
+def run_sync(coro):
+    """Run a coroutine to completion from synchronous code."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # Already inside an event loop (e.g. a notebook): run on a separate thread
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(contextvars.copy_context().run, asyncio.run, coro).result()
+
+
+def invoke_llm(llm_client, prompt, use_cache: bool = True):
+    """
+    Call llm_client.invoke(prompt), passing the cache bypass flag only to
+    clients that understand it (mock or raw clients are called unchanged).
+    """
+    started = time.perf_counter()
+    if not use_cache and isinstance(llm_client, CachedLLM):
+        response = llm_client.invoke(prompt, cache=False)
+    else:
+        response = llm_client.invoke(prompt)
+    _record(prompt, response, started)
+    return response
+
+
+def stream_llm(llm_client, prompt, on_chunk: Callable[[str], None], use_cache: bool = True) -> AIMessage:
+    """
+    Call the LLM and report text through on_chunk as it is produced.
+    Clients without .stream() are invoked normally and reported as one chunk.
+    Returns the complete response as an AIMessage.
+    """
+    if not hasattr(llm_client, "stream"):
+        response = invoke_llm(llm_client, prompt, use_cache=use_cache)
+        text = _response_text(response)
+        on_chunk(text)
+        return AIMessage(content=text, response_metadata=getattr(response, "response_metadata", None) or {})
+
+    started = time.perf_counter()
+    if isinstance(llm_client, CachedLLM):
+        chunks = llm_client.stream(prompt, cache=use_cache)
+    else:
+        chunks = llm_client.stream(prompt)
+
+    parts = []
+    metadata = {}
+    for chunk in chunks:
+        metadata = getattr(chunk, "response_metadata", None) or metadata
+        text = getattr(chunk, "content", None)
+        if not isinstance(text, str):
+            text = str(chunk)
+        if text:
+            parts.append(text)
+            on_chunk(text)
+    response = AIMessage(content="".join(parts), response_metadata=metadata)
+    _record(prompt, response, started)
+    return response
+
+
+async def ainvoke_llm(llm_client, prompt, use_cache: bool = True):
+    """
+    Async counterpart of invoke_llm. Clients without .ainvoke() are called
+    through a worker thread so they never block the event loop.
+    """
+    started = time.perf_counter()
+    if isinstance(llm_client, CachedLLM):
+        response = await llm_client.ainvoke(prompt, cache=use_cache)
+    elif hasattr(llm_client, "ainvoke"):
+        response = await llm_client.ainvoke(prompt)
+    else:
+        response = await asyncio.to_thread(llm_client.invoke, prompt)
+    _record(prompt, response, started)
+    return response
+
+
+async def astream_llm(llm_client, prompt, on_chunk: Callable[[str], None], use_cache: bool = True) -> AIMessage:
+    """Async counterpart of stream_llm."""
+    if not hasattr(llm_client, "astream"):
+        response = await ainvoke_llm(llm_client, prompt, use_cache=use_cache)
+        text = _response_text(response)
+        on_chunk(text)
+        return AIMessage(content=text, response_metadata=getattr(response, "response_metadata", None) or {})
+
+    started = time.perf_counter()
+    if isinstance(llm_client, CachedLLM):
+        chunks = llm_client.astream(prompt, cache=use_cache)
+    else:
+        chunks = llm_client.astream(prompt)
+
+    parts = []
+    metadata = {}
+    async for chunk in chunks:
+        metadata = getattr(chunk, "response_metadata", None) or metadata
+        text = getattr(chunk, "content", None)
+        if not isinstance(text, str):
+            text = str(chunk)
+        if text:
+            parts.append(text)
+            on_chunk(text)
+    response = AIMessage(content="".join(parts), response_metadata=metadata)
+    _record(prompt, response, started)
+    return response
@@ -1,16 +1,110 @@
+import copy
 import json
-from typing import Dict, Any, Optional, List
-from jsonschema import validate as jsonschema_validate, ValidationError as JSONSchemaValidationError
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional, List, Tuple
+from jsonschema.validators import validator_for
+from llm_cache import invoke_llm, ainvoke_llm
+from keyword_scanner import KeywordScanner, KeywordStream
+from retry_policy import RetryPolicy, MalformedOutputError
+from tracing import record_cache_hit
 
 SENSITIVE_KEYWORDS = [
     "hack", "exploit", "bypass", "malware", "injection",
-    "attack", "phishing", "illegal", "bomb", "terror", "kill"
+    "attack", "phishing", "illegal", "bomb", "terror", "terrorism", "terrorist", "kill"
 ]
 
+# Check levels, ordered by cost. A report at a higher level satisfies requests at lower ones.
+CHECK_STATIC = 0
+CHECK_LLM = 1
+
+_JSON_TYPES = {
+    "string": (str,),
+    "object": (dict,),
+    "array": (list,),
+    "null": (type(None),),
+    "boolean": (bool,),
+    "integer": (int,),
+    "number": (int, float),
+}
+
+
+def schema_fingerprint(schema: Dict) -> str:
+    """Content hash used to identify a schema, so equal copies share compiled state."""
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _compile_flat_object_schema(schema: Dict) -> Optional[Callable[[Any], List[str]]]:
+    """
+    Fast path for flat object schemas that only use "type", "required" and
+    per-property "type" (e.g. PLAN_SCHEMA). Returns None for anything richer,
+    which is then handled by the generic jsonschema engine.
+    """
+    if set(schema) - {"type", "properties", "required"} or schema.get("type") != "object":
+        return None
+
+    def type_check(type_spec):
+        names = type_spec if isinstance(type_spec, list) else [type_spec]
+        if not all(name in _JSON_TYPES for name in names):
+            return None
+        allowed = tuple(t for name in names for t in _JSON_TYPES[name])
+        # JSON booleans are not numbers, although bool subclasses int in Python
+        allow_bool = "boolean" in names
+        return names, allowed, allow_bool
+
+    properties = []
+    for prop, spec in schema.get("properties", {}).items():
+        if not isinstance(spec, dict) or set(spec) - {"type"}:
+            return None
+        if "type" not in spec:
+            continue
+        checked = type_check(spec["type"])
+        if checked is None:
+            return None
+        properties.append((prop,) + checked)
+    required = list(schema.get("required", []))
+
+    def check(instance: Any) -> List[str]:
+        if not isinstance(instance, dict):
+            return [f"{instance!r} is not of type 'object'"]
+        errors = [f"'{name}' is a required property" for name in required if name not in instance]
+        for prop, names, allowed, allow_bool in properties:
+            if prop not in instance:
+                continue
+            value = instance[prop]
+            if not isinstance(value, allowed) or (isinstance(value, bool) and not allow_bool):
+                expected = ", ".join(repr(n) for n in names)
+                errors.append(f"{value!r} is not of type {expected} (at '{prop}')")
+        return errors
+
+    return check
+
+
 class LLMValidator:
-    def __init__(self, llm_client, max_length: int = 2500):
+    def __init__(
+        self,
+        llm_client,
+        max_length: int = 2500,
+        use_llm_cache: bool = True,
+        memo_size: int = 256,
+        schema_fast_path: bool = True,
+        sensitive_keywords: Optional[List[str]] = None,
+        retry_policy: Optional[RetryPolicy] = None
+    ):
         self.llm = llm_client
         self.max_length = max_length
+        self.use_llm_cache = use_llm_cache
+        self.memo_size = max(0, int(memo_size))
+        self.memo_stats = {"hits": 0, "misses": 0}
+        self._memo: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self.schema_fast_path = schema_fast_path
+        self._schema_checkers: Dict[str, Callable[[Any], List[str]]] = {}
+        self._schema_lock = threading.Lock()
+        self.safety_scanner = KeywordScanner(sensitive_keywords or SENSITIVE_KEYWORDS)
+        # Transient errors and unparsable verdicts are retried before the check gives up
+        self.retry_policy = retry_policy or RetryPolicy()
 
     def _try_json(self, text: str) -> Optional[Any]:
         try:
@@ -18,31 +112,81 @@ class LLMValidator:
         except Exception:
             return None
 
-    def _validate_schema(self, data: Any, schema: Dict) -> Optional[str]:
-        try:
-            jsonschema_validate(instance=data, schema=schema)
-            return None
-        except JSONSchemaValidationError as e:
-            return str(e)
+    def register_schema(self, schema: Dict) -> Callable[[Any], List[str]]:
+        """
+        Compile a schema once and cache the checker. The schema is checked against
+        its metaschema here (raising jsonschema.SchemaError if invalid), not on
+        every validation. Returns a callable mapping an instance to error messages.
+        """
+        fingerprint = schema_fingerprint(schema)
+        with self._schema_lock:
+            checker = self._schema_checkers.get(fingerprint)
+            if checker is not None:
+                return checker
+
+            cls = validator_for(schema)
+            cls.check_schema(schema)
+            checker = _compile_flat_object_schema(schema) if self.schema_fast_path else None
+            if checker is None:
+                compiled = cls(schema)
+
+                def checker(instance: Any) -> List[str]:
+                    return [
+                        f"{e.message} (at '{'/'.join(str(p) for p in e.absolute_path)}')" if e.absolute_path else e.message
+                        for e in compiled.iter_errors(instance)
+                    ]
+
+            self._schema_checkers[fingerprint] = checker
+            return checker
+
+    def _validate_schema(self, data: Any, schema: Dict) -> List[str]:
+        """Return every schema violation in one pass (empty list if valid)."""
+        return self.register_schema(schema)(data)
 
     def _scan_safety(self, text: str) -> List[str]:
-        issues = []
-        lower = text.lower()
-        for word in SENSITIVE_KEYWORDS:
-            if word in lower:
-                issues.append(word)
-        return issues
+        """Distinct sensitive keywords found in text (whole words, single pass)."""
+        return self.safety_scanner.find_keywords(text)
 
-    def validate_response(
-        self,
-        response_text: str,
-        *,
-        expected_schema: Optional[Dict] = None,
-        instruction: Optional[str] = None,
-        require_json: bool = False,
-        run_llm_check: bool = True
-    ) -> Dict[str, Any]:
+    def safety_stream(self) -> KeywordStream:
+        """Incremental safety scan for streamed output: feed(chunk) per chunk, then finish()."""
+        return self.safety_scanner.stream()
+
+    # ------------------------------------------------------------------
+    # Report memoization
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _memo_key(response_text: str, expected_schema: Optional[Dict], instruction: Optional[str],
+                  require_json: bool, level: int) -> Tuple:
+        response_hash = hashlib.sha256(response_text.encode("utf-8")).hexdigest()
+        schema_hash = schema_fingerprint(expected_schema) if expected_schema is not None else None
+        return (response_hash, schema_hash, instruction, bool(require_json), level)
 
+    def _memo_get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """Return a copy of the report for key, or of any stricter report for the same input."""
+        if not self.memo_size:
+            return None
+        with self._memo_lock:
+            for level in range(CHECK_LLM, key[-1] - 1, -1):
+                report = self._memo.get(key[:-1] + (level,))
+                if report is not None:
+                    self._memo.move_to_end(key[:-1] + (level,))
+                    return copy.deepcopy(report)
+            return None
+
+    def _memo_put(self, key: Tuple, report: Dict[str, Any]):
+        if not self.memo_size:
+            return
+        with self._memo_lock:
+            self._memo[key] = copy.deepcopy(report)
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # Checks
+    # ------------------------------------------------------------------
+    def _static_report(self, response_text: str, expected_schema: Optional[Dict], require_json: bool) -> Dict[str, Any]:
+        """Length, truncation, JSON, schema and keyword checks (no LLM call)."""
         report = {
             "status": "pass",
             "scores": {"format": 1.0, "instruction_fidelity": 1.0, "safety": 1.0},
@@ -71,21 +215,25 @@ class LLMValidator:
             else:
                 report["parsed"] = parsed
                 if expected_schema:
-                    err = self._validate_schema(parsed, expected_schema)
-                    if err:
-                        report["issues"].append({"schema_error": err})
+                    errors = self._validate_schema(parsed, expected_schema)
+                    if errors:
+                        report["issues"].append({"schema_error": "; ".join(errors), "schema_errors": errors})
                         report["scores"]["format"] = 0.5
                         report["status"] = "warn"
 
-        safety_hits = self._scan_safety(response_text)
-        if safety_hits:
-            report["issues"].append({"unsafe_terms": safety_hits})
+        hits = self.safety_scanner.scan(response_text)
+        if hits:
+            report["issues"].append({
+                "unsafe_terms": list(dict.fromkeys(hit.keyword for hit in hits)),
+                "unsafe_hits": [{"term": hit.keyword, "start": hit.start, "end": hit.end} for hit in hits]
+            })
             report["scores"]["safety"] = 0.0
             report["status"] = "fail"
 
-        if run_llm_check and instruction:
-            try:
-                check_prompt = f"""
+        return report
+
+    def _build_check_prompt(self, response_text: str, instruction: str) -> str:
+        return f"""
 You are a strict validator.
 
 Compare the following LLM output against the given user instruction.
@@ -101,28 +249,129 @@ Instruction:
 LLM Output:
 {response_text}
 """
-                result = self.llm.invoke(check_prompt)
-                result_text = getattr(result, "content", None) or getattr(result, "text", str(result))
-                feedback = json.loads(result_text)
-                report["llm_feedback"] = feedback
-
-                if "instruction_fidelity_score" in feedback:
-                    fidelity = float(feedback["instruction_fidelity_score"])
-                    report["scores"]["instruction_fidelity"] = fidelity
-                    if fidelity < 0.6:
-                        report["status"] = "warn"
-                        report["issues"].append("Low instruction fidelity")
 
-                if "safety_score" in feedback:
-                    sscore = float(feedback["safety_score"])
-                    report["scores"]["safety"] = sscore
-                    if sscore < 0.5:
-                        report["status"] = "fail"
-                        report["issues"].append("Low safety score")
+    @staticmethod
+    def _parse_feedback(result) -> Dict[str, Any]:
+        """Parse the LLM validator's JSON verdict."""
+        result_text = getattr(result, "content", None) or getattr(result, "text", str(result))
+        try:
+            feedback = json.loads(result_text)
+        except ValueError as e:
+            raise MalformedOutputError(f"Validator verdict is not JSON: {e}") from e
+        if not isinstance(feedback, dict):
+            raise MalformedOutputError("Validator verdict is not a JSON object")
+        return feedback
+
+    def _apply_feedback(self, report: Dict[str, Any], feedback: Dict[str, Any]):
+        """Merge a parsed LLM validator verdict into report."""
+        report["llm_feedback"] = feedback
+
+        if "instruction_fidelity_score" in feedback:
+            fidelity = float(feedback["instruction_fidelity_score"])
+            report["scores"]["instruction_fidelity"] = fidelity
+            if fidelity < 0.6:
+                report["status"] = "warn"
+                report["issues"].append("Low instruction fidelity")
+
+        if "safety_score" in feedback:
+            sscore = float(feedback["safety_score"])
+            report["scores"]["safety"] = sscore
+            if sscore < 0.5:
+                report["status"] = "fail"
+                report["issues"].append("Low safety score")
+
+        if "suggestions" in feedback:
+            report["suggestions"].extend(feedback["suggestions"])
+
+    def _apply_llm_check(self, report: Dict[str, Any], response_text: str, instruction: str):
+        """Ask the LLM to score instruction fidelity and safety, updating report in place."""
+        prompt = self._build_check_prompt(response_text, instruction)
 
-                if "suggestions" in feedback:
-                    report["suggestions"].extend(feedback["suggestions"])
-            except Exception as e:
-                report["issues"].append({"llm_feedback_error": str(e)})
+        def check(attempt: int) -> Dict[str, Any]:
+            # A retried verdict must come from the model, not the cached bad one
+            return self._parse_feedback(invoke_llm(self.llm, prompt, use_cache=self.use_llm_cache and attempt == 1))
+
+        try:
+            self._apply_feedback(report, self.retry_policy.call(check, site="validator"))
+        except Exception as e:
+            report["issues"].append({"llm_feedback_error": str(e)})
 
+    async def _aapply_llm_check(self, report: Dict[str, Any], response_text: str, instruction: str):
+        """Async counterpart of _apply_llm_check."""
+        prompt = self._build_check_prompt(response_text, instruction)
+
+        async def check(attempt: int) -> Dict[str, Any]:
+            response = await ainvoke_llm(self.llm, prompt, use_cache=self.use_llm_cache and attempt == 1)
+            return self._parse_feedback(response)
+
+        try:
+            self._apply_feedback(report, await self.retry_policy.acall(check, site="validator"))
+        except Exception as e:
+            report["issues"].append({"llm_feedback_error": str(e)})
+
+    def _begin_validation(self, response_text, expected_schema, instruction, require_json, run_llm_check):
+        """
+        Shared front half of (a)validate_response.
+        Returns (key, report, done): done=True means report is final (memo hit or static-only).
+        Each call counts once in memo_stats; reusing the static report for an LLM check is a miss.
+        """
+        level = CHECK_LLM if (run_llm_check and instruction) else CHECK_STATIC
+        key = self._memo_key(response_text, expected_schema, instruction, require_json, level)
+
+        cached = self._memo_get(key)
+        if self.memo_size:
+            with self._memo_lock:
+                self.memo_stats["hits" if cached is not None else "misses"] += 1
+        if cached is not None:
+            record_cache_hit("validator_memo")
+            return key, cached, True
+
+        static_key = key[:-1] + (CHECK_STATIC,)
+        report = self._memo_get(static_key) if level > CHECK_STATIC else None
+        if report is None:
+            report = self._static_report(response_text, expected_schema, require_json)
+            self._memo_put(static_key, report)
+
+        return key, report, level == CHECK_STATIC
+
+    def _finish_validation(self, key: Tuple, report: Dict[str, Any]) -> Dict[str, Any]:
+        # Don't pin a transient LLM failure; the next request should retry the check
+        if not any(isinstance(i, dict) and "llm_feedback_error" in i for i in report["issues"]):
+            self._memo_put(key, report)
         return report
+
+    def validate_response(
+        self,
+        response_text: str,
+        *,
+        expected_schema: Optional[Dict] = None,
+        instruction: Optional[str] = None,
+        require_json: bool = False,
+        run_llm_check: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Validate an LLM response. Reports are memoized on (response hash, schema,
+        instruction, check level); a memoized LLM-checked report also answers
+        later static-only requests, and an LLM check reuses the static report.
+        """
+        key, report, done = self._begin_validation(response_text, expected_schema, instruction, require_json, run_llm_check)
+        if done:
+            return report
+        self._apply_llm_check(report, response_text, instruction)
+        return self._finish_validation(key, report)
+
+    async def avalidate_response(
+        self,
+        response_text: str,
+        *,
+        expected_schema: Optional[Dict] = None,
+        instruction: Optional[str] = None,
+        require_json: bool = False,
+        run_llm_check: bool = True
+    ) -> Dict[str, Any]:
+        """Async counterpart of validate_response; only the LLM check is awaited."""
+        key, report, done = self._begin_validation(response_text, expected_schema, instruction, require_json, run_llm_check)
+        if done:
+            return report
+        await self._aapply_llm_check(report, response_text, instruction)
+        return self._finish_validation(key, report)
@@ -0,0 +1,150 @@
+import os
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# Eviction policies
+LRU = "lru"                  # least recently retrieved (or seen) first
+LOW_UTILITY = "low_utility"  # lowest hit_count + retrievals first, older first on ties
+EVICTION_POLICIES = (LRU, LOW_UTILITY)
+
+# Retention settings (override via environment); 0 disables capacity / TTL
+MEMORY_CAPACITY = int(os.getenv("NEXUS_MEMORY_CAPACITY", "0"))
+MEMORY_TTL_SECONDS = float(os.getenv("NEXUS_MEMORY_TTL_SECONDS", "0"))
+EVICTION_POLICY = os.getenv("NEXUS_EVICTION_POLICY", LRU)
+COMPACT_RATIO = float(os.getenv("NEXUS_COMPACT_RATIO", "0.2"))
+
+
+class UsageStats:
+    """
+    Per-position usage counters for the corrective memory.
+    ------------------------------------------------------
+    - last_used: latest of insert / duplicate merge / retrieval time
+    - utility: hit_count (times the insight was seen) + retrievals
+    - dirty positions have retrieval counters not yet written to the docstore
+    """
+
+    def __init__(self):
+        self.last_used = array("d")
+        self.utility = array("I")
+        self.retrievals = array("I")
+        self.last_retrieved = array("d")
+        self.dirty: Set[int] = set()
+
+    def clear(self):
+        self.__init__()
+
+    @property
+    def size(self) -> int:
+        return len(self.last_used)
+
+    def add(self, position: int, metadata: Dict[str, Any]):
+        while self.size < position:
+            self._append(0.0, 0, 0, 0.0)
+        retrievals = int(metadata.get("retrievals") or 0)
+        last_retrieved = float(metadata.get("last_retrieved") or 0.0)
+        last_seen = float(metadata.get("last_seen") or metadata.get("timestamp") or time.time())
+        self._append(max(last_seen, last_retrieved), int(metadata.get("hit_count") or 1) + retrievals, retrievals, last_retrieved)
+
+    def _append(self, last_used: float, utility: int, retrievals: int, last_retrieved: float):
+        self.last_used.append(last_used)
+        self.utility.append(utility)
+        self.retrievals.append(retrievals)
+        self.last_retrieved.append(last_retrieved)
+
+    def add_many(self, start: int, metadatas: Iterable[Dict[str, Any]]):
+        for offset, metadata in enumerate(metadatas):
+            self.add(start + offset, metadata or {})
+
+    def seen(self, position: int, when: float):
+        """A duplicate of position was inserted."""
+        self.last_used[position] = max(self.last_used[position], when)
+        self.utility[position] += 1
+
+    def retrieved(self, positions: Iterable[int], when: float):
+        for position in positions:
+            self.last_used[position] = max(self.last_used[position], when)
+            self.utility[position] += 1
+            self.retrievals[position] += 1
+            self.last_retrieved[position] = when
+            self.dirty.add(position)
+
+    def select(self, positions: List[int]) -> "UsageStats":
+        """Counters for positions, renumbered 0..len(positions)-1 (used by compaction)."""
+        selected = UsageStats()
+        remap = {old: new for new, old in enumerate(positions)}
+        for old in positions:
+            selected._append(self.last_used[old], self.utility[old], self.retrievals[old], self.last_retrieved[old])
+        selected.dirty = {remap[p] for p in self.dirty if p in remap}
+        return selected
+
+
+class RetentionPolicy:
+    """
+    Capacity and age limits for the corrective memory.
+    --------------------------------------------------
+    - ttl_seconds: insights unused (not seen or retrieved) for longer expire
+    - capacity: above it, the policy's victims are evicted down to
+      low_watermark * capacity, so eviction does not run on every insert
+    - Evicted entries are tombstoned (hidden from search at once); compaction
+      rebuilds the index without them once they reach compact_ratio of it
+
+    RAGManager compacts on its index rebuild thread; this class only decides.
+    """
+
+    def __init__(
+        self,
+        capacity: int = MEMORY_CAPACITY,
+        ttl_seconds: float = MEMORY_TTL_SECONDS,
+        policy: str = EVICTION_POLICY,
+        low_watermark: float = 0.9,
+        compact_ratio: float = COMPACT_RATIO,
+        ttl_check_interval: float = 60.0
+    ):
+        """
+        Args:
+            capacity: maximum live insights (0 = unbounded).
+            ttl_seconds: expire insights unused for this long (0 = never).
+            policy: LRU or LOW_UTILITY, used when over capacity.
+            low_watermark: fraction of capacity kept after an eviction round.
+            compact_ratio: tombstone fraction of the index that triggers compaction.
+            ttl_check_interval: minimum seconds between TTL sweeps triggered by inserts.
+        """
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy {policy!r}; expected one of {EVICTION_POLICIES}")
+        self.capacity = max(0, int(capacity))
+        self.ttl_seconds = max(0.0, float(ttl_seconds))
+        self.policy = policy
+        self.low_watermark = min(1.0, max(0.0, low_watermark))
+        self.compact_ratio = max(0.0, compact_ratio)
+        self.ttl_check_interval = ttl_check_interval
+        self._last_ttl_check = 0.0
+
+    def due(self, live: int, now: float) -> bool:
+        """Whether an eviction round should run after an insert."""
+        if self.capacity and live > self.capacity:
+            return True
+        return bool(self.ttl_seconds) and now - self._last_ttl_check >= self.ttl_check_interval
+
+    def expired(self, usage: UsageStats, deleted: Set[int], now: Optional[float] = None) -> List[int]:
+        now = time.time() if now is None else now
+        self._last_ttl_check = now
+        if not self.ttl_seconds:
+            return []
+        cutoff = now - self.ttl_seconds
+        return [p for p in range(usage.size) if p not in deleted and usage.last_used[p] < cutoff]
+
+    def victims(self, usage: UsageStats, deleted: Set[int]) -> List[int]:
+        """Positions to evict so the live count drops to low_watermark * capacity."""
+        live = [p for p in range(usage.size) if p not in deleted]
+        if not self.capacity or len(live) <= self.capacity:
+            return []
+        excess = len(live) - int(self.capacity * self.low_watermark)
+        if self.policy == LOW_UTILITY:
+            live.sort(key=lambda p: (usage.utility[p], usage.last_used[p]))
+        else:
+            live.sort(key=lambda p: usage.last_used[p])
+        return live[:excess]
+
+    def should_compact(self, total: int, tombstones: int) -> bool:
+        return tombstones > 0 and tombstones >= self.compact_ratio * total
@@ -0,0 +1,167 @@
+import bisect
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Filter keys accepted by MetadataIndex.candidates (and RAGManager.fetch_context)
+FILTER_KEYS = ("session_id", "tenant_id", "framework", "tags", "since", "until")
+
+# Fields with an inverted index (metadata key -> filter key)
+# (session_ids lists every session a merged duplicate was seen in)
+_TERM_FIELDS = {
+    "session_id": "session_id",
+    "session_ids": "session_id",
+    "tenant_id": "tenant_id",
+    "framework": "framework",
+    "tags": "tags"
+}
+_FIELDS = tuple(dict.fromkeys(_TERM_FIELDS.values()))
+
+
+def _norm(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value.lower() or None
+
+
+def to_timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds from a number, datetime or ISO-8601 string (None if unparsable)."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def check_filters(filters: Dict[str, Any]) -> Tuple[Optional[float], Optional[float]]:
+    """Validate filter keys and return the (since, until) bounds as epoch seconds; raises ValueError."""
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filter keys {sorted(unknown)}; expected {FILTER_KEYS}")
+    bounds = []
+    for key in ("since", "until"):
+        value = filters.get(key)
+        ts = to_timestamp(value)
+        if value is not None and ts is None:
+            raise ValueError(f"Cannot parse {key}={value!r}; expected epoch seconds, a datetime or an ISO-8601 string")
+        bounds.append(ts)
+    return bounds[0], bounds[1]
+
+
+def insight_metadata(insight: Dict[str, Any]) -> Dict[str, Any]:
+    """Filterable metadata stored alongside an insight."""
+    behavioral = insight.get("behavioral_insights") or {}
+    corrective = insight.get("corrective_knowledge") or {}
+    tags = corrective.get("relevance_tags") or []
+    if isinstance(tags, str):
+        tags = [tags]
+    framework = behavioral.get("code_framework_preference")
+
+    return {
+        "session_id": insight.get("session_id"),
+        "tenant_id": insight.get("tenant_id"),
+        "framework": _norm(framework) if isinstance(framework, str) else None,
+        "tags": sorted({t for t in (_norm(tag) for tag in tags if isinstance(tag, (str, int))) if t}),
+        "timestamp": to_timestamp(insight.get("timestamp")) or time.time()
+    }
+
+
+class MetadataIndex:
+    """
+    Secondary index over insight metadata.
+    --------------------------------------
+    - Inverted postings (value -> FAISS row positions) for session, tenant,
+      framework preference and relevance tags
+    - A sorted timestamp list for since / until ranges
+    - candidates(filters) intersects postings, smallest first, so a selective
+      filter costs about the size of its result
+
+    Positions are FAISS row numbers, so the index is append-only like the
+    vector index and is rebuilt together with it.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, Set[int]]] = {field: {} for field in _FIELDS}
+        self._ts_keys: List[float] = []
+        self._ts_positions: List[int] = []
+        self.size = 0
+
+    def clear(self):
+        self.__init__()
+
+    def add(self, position: int, metadata: Dict[str, Any]):
+        self.add_terms(position, metadata)
+        ts = metadata.get("timestamp")
+        if isinstance(ts, (int, float)):
+            at = bisect.bisect_right(self._ts_keys, ts)
+            self._ts_keys.insert(at, float(ts))
+            self._ts_positions.insert(at, position)
+        self.size = max(self.size, position + 1)
+
+    def add_terms(self, position: int, metadata: Dict[str, Any]):
+        """Add postings for position's term fields (also used when a merged duplicate adds sessions or tags)."""
+        for key, field in _TERM_FIELDS.items():
+            values = metadata.get(key)
+            if values is None:
+                continue
+            for value in (values if isinstance(values, (list, tuple, set)) else [values]):
+                value = _norm(value)
+                if value:
+                    self._postings[field].setdefault(value, set()).add(position)
+
+    def add_many(self, start: int, metadatas: Iterable[Dict[str, Any]]):
+        for offset, metadata in enumerate(metadatas):
+            self.add(start + offset, metadata or {})
+
+    def candidates(self, filters: Dict[str, Any]) -> Set[int]:
+        """
+        FAISS positions matching every filter.
+
+        Args:
+            filters: any of session_id, tenant_id, framework (a value or a list,
+                matching any), tags (a value or a list, matching any tag), since /
+                until (epoch seconds, datetime or ISO string, inclusive).
+
+        Raises:
+            ValueError: for an unknown key or an unparsable since / until.
+        """
+        since, until = check_filters(filters)
+
+        sets: List[Set[int]] = []
+        for field in _FIELDS:
+            if filters.get(field) is None:
+                continue
+            wanted = filters[field]
+            postings = self._postings[field]
+            matched: Set[int] = set()
+            for value in (wanted if isinstance(wanted, (list, tuple, set)) else [wanted]):
+                matched |= postings.get(_norm(value), set())
+            if not matched:
+                return set()
+            sets.append(matched)
+
+        if since is not None or until is not None:
+            lo = bisect.bisect_left(self._ts_keys, since) if since is not None else 0
+            hi = bisect.bisect_right(self._ts_keys, until) if until is not None else len(self._ts_keys)
+            sets.append(set(self._ts_positions[lo:hi]))
+
+        if not sets:
+            return set(range(self.size))
+        sets.sort(key=len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            result &= other
+            if not result:
+                break
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        stats = {f"{field}_values": len(postings) for field, postings in self._postings.items()}
+        stats["entries"] = self.size
+        return stats
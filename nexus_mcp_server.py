@@ -1,14 +1,17 @@
 # nexus_mcp_server.py
+import os
 import asyncio
 import json
 from fastmcp import FastMCP
-from nexus_pipeline import run_pipeline
+from nexus_pipeline import run_pipeline_async
+from nexus_runtime import get_runtime
+from tracing import metrics, start_metrics_server
 
 # Initialize the MCP server
 mcp = FastMCP("NEXUS")
 
 @mcp.tool()
-def run_nexus_pipeline(query: str) -> str:
+async def run_nexus_pipeline(query: str) -> str:
     """
     Run the full Project Nexus pipeline.
     Args:
@@ -16,8 +19,20 @@ def run_nexus_pipeline(query: str) -> str:
     Returns:
         str: JSON summary of the pipeline result.
     """
-    result = run_pipeline(query)
+    # Async so concurrent clients don't queue behind one long generation
+    result = await run_pipeline_async(query, runtime=get_runtime())
     return json.dumps(result, indent=2)
 
+@mcp.tool()
+def nexus_metrics() -> str:
+    """
+    Pipeline latency histograms and cache counters in Prometheus text format.
+    The same data is served over HTTP at /metrics on NEXUS_METRICS_PORT.
+    """
+    return metrics.render()
+
 if __name__ == "__main__":
+    start_metrics_server(int(os.getenv("NEXUS_METRICS_PORT", "9464")))
+    # Build the shared runtime and restore memory before the first request arrives
+    get_runtime().warm_up(background=True)
     mcp.run()
@@ -5,73 +5,174 @@
 # RAGManager -> DynamicPromptNode -> LLMValidator -> ReaderAgent -> WriterAgent
 
 import os
+import re
 import json
 import sys
-from typing import Optional
+import time
+import queue
+import asyncio
+import argparse
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional
 
 from rag_manager import RAGManager
-from dynamic_node_prompt import DynamicPromptNode
-from llm_validator import LLMValidator
-from reader_agent import ReaderAgent
-from writer_agent import WriterAgent
-from langchain_openai import AzureChatOpenAI
+from llm_cache import run_sync
+from reader_agent import PLAN_SCHEMA
+from nexus_runtime import NexusRuntime, get_runtime, make_llm_client
+from retry_policy import retry_budget
+from tracing import span
 
+# make_llm_client used to be defined here and is re-exported for existing imports
+__all__ = [
+    "run_pipeline",
+    "run_pipeline_async",
+    "stream_pipeline",
+    "run_batch",
+    "run_batch_async",
+    "make_llm_client",
+    "main"
+]
 
-def make_llm_client() -> AzureChatOpenAI:
+
+def _guard_callback(on_event: Optional[Callable[[Dict[str, Any]], None]]) -> Optional[Callable[[Dict[str, Any]], None]]:
+    """Wrap an event callback so a failing consumer can never break the pipeline."""
+    if on_event is None:
+        return None
+
+    def guarded(event: Dict[str, Any]):
+        try:
+            on_event(event)
+        except Exception as e:
+            print(f"Pipeline event handler failed: {e}")
+    return guarded
+
+
+def _make_emitter(on_event: Optional[Callable[[Dict[str, Any]], None]]) -> Callable[..., None]:
+    """emit(event_type, **payload) through a guarded on_event (a no-op without one)."""
+    guarded = _guard_callback(on_event)
+
+    def emit(event_type: str, **payload):
+        if guarded is not None:
+            guarded({"type": event_type, **payload})
+    return emit
+
+
+def run_pipeline(
+    user_query: str,
+    rag_persist_dir: str = "./rag_memory",
+    code_output_dir: str = "./generated_code",
+    on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+    llm_client=None,
+    rag: Optional[RAGManager] = None,
+    runtime: Optional[NexusRuntime] = None
+):
     """
-    Initialize AzureChatOpenAI using environment variables.
-    Adjust this function if you switch to another LLM.
+    Blocking entry point; see run_pipeline_async for the steps and event types.
     """
-    return AzureChatOpenAI(
-        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-        deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
-        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-        temperature=0.7
-    )
+    return run_sync(run_pipeline_async(user_query, rag_persist_dir, code_output_dir, on_event, llm_client, rag, runtime))
 
 
-def run_pipeline(user_query: str, rag_persist_dir: str = "./rag_memory", code_output_dir: str = "./generated_code"):
+async def run_pipeline_async(
+    user_query: str,
+    rag_persist_dir: str = "./rag_memory",
+    code_output_dir: str = "./generated_code",
+    on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+    llm_client=None,
+    rag: Optional[RAGManager] = None,
+    runtime: Optional[NexusRuntime] = None
+):
     """
     Main orchestrator pipeline for the Nexus System.
 
+    LLM calls use ainvoke; embedding, index and file I/O run in worker threads,
+    so many pipelines can be in flight on one event loop.
+
     Steps:
-        1. Initialize dependencies (LLM, RAG, Validator, Reader, Writer).
+        1. Look up dependencies (LLM, RAG, Validator, Reader, Writer) on the runtime.
         2. Generate enhanced prompt dynamically using RAG memory.
         3. Validate the enhanced prompt.
         4. Generate system architecture plan with ReaderAgent.
         5. Validate the plan structure.
         6. Generate component code and orchestrator using WriterAgent.
+
+    on_event, if given, is called with incremental event dicts:
+        {"type": "stage_started", "stage"}
+        {"type": "stage_finished", "stage", "status"}
+        {"type": "plan_token", "attempt", "text"}
+        {"type": "code_chunk", "component", "text"}
+        {"type": "component_retry", "component", "attempt", "error"}
+        {"type": "component_finished", "component", "status", "error"}  (status "reused" = unchanged)
+    See stream_pipeline() for a generator interface.
+
+    Components come from runtime, by default the process-wide get_runtime(), so
+    clients, connection pools and RAG state are reused across calls. To override
+    the LLM or memory repeatedly (e.g. fakes for offline benchmarks), build a
+    NexusRuntime(llm_client=..., rag=...) once and pass it as runtime. llm_client
+    and rag alone build a one-off runtime for this call, closed when it ends;
+    with only rag given it reuses the shared runtime's LLM client and loop.
+
+    Each run is traced as a "pipeline" span with one child span per stage (see
+    tracing.py); the summary carries its trace_id.
     """
+    if runtime is not None or (llm_client is None and rag is None):
+        runtime = runtime or get_runtime()
+        return await runtime.run(_run_traced(runtime, user_query, rag_persist_dir, code_output_dir, on_event))
+
+    shared = get_runtime() if llm_client is None else None
+    one_off = NexusRuntime(llm_client=llm_client or shared.llm, rag=rag, rag_persist_dir=rag_persist_dir)
+    try:
+        # A shared client's async pool is bound to the shared runtime's loop
+        return await (shared or one_off).run(_run_traced(one_off, user_query, rag_persist_dir, code_output_dir, on_event))
+    finally:
+        one_off.close()
+
 
-    # Initialize Azure LLM
-    llm_client = make_llm_client()
+async def _run_traced(runtime: NexusRuntime, user_query: str, rag_persist_dir: str, code_output_dir: str, on_event):
+    # One retry budget per run, shared by every stage, so a failing endpoint can't cause a retry storm
+    with span("pipeline", user_query=user_query) as root, retry_budget(runtime.retry_budget) as budget:
+        result = await _run_stages(runtime, user_query, rag_persist_dir, code_output_dir, on_event)
+        root.set(success=result.get("success"), stage=result.get("stage"), retries_used=budget.used)
+    result["trace_id"] = root.trace_id
+    return result
 
-    # Initialize RAG Manager and Dynamic Prompt Creator
-    rag = RAGManager(persist_dir=rag_persist_dir)
-    dp_node = DynamicPromptNode(rag)
 
-    # Validator, Reader, and Writer
-    validator = LLMValidator(llm_client)
-    reader = ReaderAgent(llm_client=llm_client, validator=validator)
-    writer = WriterAgent(llm_client=llm_client, base_output_dir=code_output_dir, auto_save=True)
+async def _run_stages(runtime: NexusRuntime, user_query: str, rag_persist_dir: str, code_output_dir: str, on_event):
+    """The pipeline steps themselves; _run_traced wraps them in the root span."""
+    emit = _make_emitter(on_event)
+
+    with span("setup"):
+        # Shared components; only the first request for a directory builds (and restores) anything
+        rag = await asyncio.to_thread(runtime.rag_for, rag_persist_dir)
+        dp_node = runtime.prompt_node_for(rag)
+        validator = runtime.validator
+        reader = runtime.reader
+        writer = await asyncio.to_thread(runtime.writer_for, code_output_dir)
 
     # Step 1: Generate enhanced prompt
+    emit("stage_started", stage="prompt_generation")
     print("Generating enhanced prompt from stored corrective memory.")
-    enhanced_prompt = dp_node.generate_prompt(user_query, k=3)
+    with span("prompt_generation") as s:
+        enhanced_prompt = await asyncio.to_thread(dp_node.generate_prompt, user_query, 3)
+        s.set(prompt_chars=len(enhanced_prompt))
     print("Enhanced prompt generated successfully.\n")
+    emit("stage_finished", stage="prompt_generation", status="success")
 
     # Step 2: Validate the enhanced prompt
+    emit("stage_started", stage="prompt_validation")
     print("Validating enhanced prompt for structure and instruction fidelity.")
-    prompt_validation = validator.validate_response(
-        response_text=enhanced_prompt,
-        instruction=user_query,
-        require_json=False,
-        run_llm_check=True
-    )
+    with span("prompt_validation") as s:
+        prompt_validation = await validator.avalidate_response(
+            response_text=enhanced_prompt,
+            instruction=user_query,
+            require_json=False,
+            run_llm_check=True
+        )
+        s.set(status=prompt_validation.get("status"))
     print("Prompt validation report:")
     print(json.dumps(prompt_validation, indent=2))
 
+    emit("stage_finished", stage="prompt_validation", status=prompt_validation.get("status"))
     if prompt_validation.get("status") == "fail":
         print("Prompt validation failed. Exiting pipeline.")
         return {
@@ -81,8 +182,19 @@ def run_pipeline(user_query: str, rag_persist_dir: str = "./rag_memory", code_ou
         }
 
     # Step 3: Use ReaderAgent to generate plan
+    emit("stage_started", stage="reader_planning")
     print("\nRequesting ReaderAgent to create system plan.")
-    plan_result = reader.plan_from_prompt(enhanced_prompt, instruction=user_query)
+    with span("reader_planning") as s:
+        plan_result = await reader.aplan_from_prompt(
+            enhanced_prompt,
+            instruction=user_query,
+            on_token=(lambda attempt, text: emit("plan_token", attempt=attempt, text=text)) if on_event else None
+        )
+        attempts = plan_result.get("attempts") or 0
+        s.set(success=plan_result.get("success"), attempts=attempts, retries=max(0, attempts - 1))
+        if plan_result.get("hedge"):
+            s.set(hedge_candidates=plan_result["hedge"]["candidates"], hedge_winner=plan_result["hedge"]["winner"])
+    emit("stage_finished", stage="reader_planning", status="success" if plan_result.get("success") else "fail")
 
     if not plan_result.get("success"):
         print("ReaderAgent failed to produce a valid plan.")
@@ -97,30 +209,26 @@ def run_pipeline(user_query: str, rag_persist_dir: str = "./rag_memory", code_ou
     plan = plan_result["plan"]
     print("\nSystem plan created successfully. Proceeding with plan validation.")
 
-    # Step 4: Validate plan schema and logical structure
-    plan_text = json.dumps(plan)
-    plan_validation = validator.validate_response(
-        response_text=plan_text,
-        expected_schema={
-            "type": "object",
-            "properties": {
-                "framework": {"type": "string"},
-                "language": {"type": "string"},
-                "llm": {"type": "string"},
-                "embedding_model": {"type": "string"},
-                "components": {"type": ["object", "array"]},
-                "termination_policy": {"type": "object"},
-                "files": {"type": ["array", "null"]}
-            },
-            "required": ["framework", "language", "llm", "components"]
-        },
-        instruction="Validate system plan for schema compliance.",
-        require_json=True,
-        run_llm_check=True
-    )
+    # Step 4: Validate plan schema and logical structure.
+    # ReaderAgent already ran the full (schema + LLM) check on this exact plan, so
+    # reuse its report; otherwise the validator's memo answers without a new LLM call.
+    emit("stage_started", stage="plan_validation")
+    with span("plan_validation") as s:
+        plan_validation = plan_result.get("validation_report")
+        s.set(reused_reader_report=plan_validation is not None)
+        if plan_validation is None:
+            plan_validation = await validator.avalidate_response(
+                response_text=json.dumps(plan),
+                expected_schema=PLAN_SCHEMA,
+                instruction=user_query,
+                require_json=True,
+                run_llm_check=True
+            )
+        s.set(status=plan_validation.get("status"))
     print("Plan validation report:")
     print(json.dumps(plan_validation, indent=2))
 
+    emit("stage_finished", stage="plan_validation", status=plan_validation.get("status"))
     if plan_validation.get("status") == "fail":
         print("Plan validation failed. Exiting pipeline.")
         return {
@@ -139,10 +247,18 @@ def run_pipeline(user_query: str, rag_persist_dir: str = "./rag_memory", code_ou
         plan["components"] = normalized
 
     # Step 6: Generate actual system code using WriterAgent
+    emit("stage_started", stage="code_generation")
     print("\nInvoking WriterAgent for code generation.")
     try:
-        write_result = writer.write_system_code(plan)
+        with span("code_generation", components=len(plan.get("components", {}))) as s:
+            write_result = await writer.awrite_system_code(plan, on_event=_guard_callback(on_event))
+            s.set(
+                status=write_result.get("status"),
+                failed_components=len(write_result.get("errors", [])),
+                reused_components=len(write_result.get("reused", []))
+            )
     except Exception as e:
+        emit("stage_finished", stage="code_generation", status="fail")
         print("WriterAgent encountered an error during code generation.")
         print("Error details:", str(e))
         return {
@@ -151,8 +267,21 @@ def run_pipeline(user_query: str, rag_persist_dir: str = "./rag_memory", code_ou
             "error": str(e)
         }
 
+    emit("stage_finished", stage="code_generation", status=write_result.get("status"))
+    if write_result.get("status") == "failed":
+        print("WriterAgent failed to generate any component.")
+        return {
+            "success": False,
+            "stage": "code_generation",
+            "error": "All components failed to generate.",
+            "component_errors": write_result.get("errors", [])
+        }
+
     # Summarize generated files
-    print("Code generation completed successfully.")
+    if write_result.get("status") == "partial":
+        print("Code generation completed with some failed components.")
+    else:
+        print("Code generation completed successfully.")
     file_summaries = []
     for f in write_result.get("files", []):
         name = f.get("name")
@@ -166,6 +295,10 @@ def run_pipeline(user_query: str, rag_persist_dir: str = "./rag_memory", code_ou
         "plan": plan,
         "plan_validation": plan_validation,
         "generated_files": file_summaries,
+        "component_errors": write_result.get("errors", []),
+        "regenerated_components": write_result.get("regenerated", []),
+        "reused_components": write_result.get("reused", []),
+        "removed_files": write_result.get("removed", []),
         "output_dir": os.path.abspath(code_output_dir)
     }
 
@@ -173,21 +306,234 @@ def run_pipeline(user_query: str, rag_persist_dir: str = "./rag_memory", code_ou
     return result_summary
 
 
+def stream_pipeline(user_query: str, **kwargs) -> Iterator[Dict[str, Any]]:
+    """
+    Run the pipeline on a background thread and yield its events as they happen.
+    The last event is {"type": "pipeline_finished", "result": <run_pipeline summary>}
+    or {"type": "pipeline_error", "error": <message>} if the pipeline raised.
+    """
+    events: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+
+    def worker():
+        try:
+            result = run_pipeline(user_query, on_event=events.put, **kwargs)
+            events.put({"type": "pipeline_finished", "result": result})
+        except Exception as e:
+            events.put({"type": "pipeline_error", "error": str(e)})
+
+    threading.Thread(target=worker, name="nexus-pipeline", daemon=True).start()
+    while True:
+        event = events.get()
+        yield event
+        if event["type"] in ("pipeline_finished", "pipeline_error"):
+            return
+
+
+def _iter_batch_requests(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Stream {"id", "query", "error"} items from a JSONL request file, one per line.
+    A line may be a JSON string or an object with "query" (or "user_query",
+    "prompt", "body") and an optional "id" / "request_id" (default "line-<n>").
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                yield {"id": f"line-{lineno}", "query": None, "error": f"Invalid JSON: {e}"}
+                continue
+            if isinstance(item, str):
+                item = {"query": item}
+            if not isinstance(item, dict):
+                yield {"id": f"line-{lineno}", "query": None, "error": "Request must be a JSON object or string."}
+                continue
+            query = item.get("query") or item.get("user_query") or item.get("prompt") or item.get("body")
+            request_id = str(item.get("id") or item.get("request_id") or f"line-{lineno}")
+            yield {"id": request_id, "query": query, "error": None if query else "No query field in request."}
+
+
+def _load_batch_checkpoint(results_path: str, retry_failed: bool = False) -> set:
+    """
+    Ids already recorded in the results file. With retry_failed, ids whose latest
+    record failed are left out so they run again. A torn last line (from an
+    interrupted write) is ignored.
+    """
+    done = set()
+    try:
+        with open(results_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(record, dict) or "id" not in record:
+                    continue
+                if record.get("success") or not retry_failed:
+                    done.add(record["id"])
+                else:
+                    done.discard(record["id"])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def _safe_dirname(request_id: str) -> str:
+    """Directory name for a request id; ids that had to be sanitized get a hash suffix so they cannot collide."""
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", request_id).strip("._") or "request"
+    if name != request_id:
+        name += "-" + hashlib.sha1(request_id.encode("utf-8")).hexdigest()[:8]
+    return name
+
+
+async def run_batch_async(
+    requests_path: str,
+    results_path: str,
+    output_root: str = "./generated_batches",
+    rag_persist_dir: str = "./rag_memory",
+    workers: int = 4,
+    retry_failed: bool = False,
+    runtime: Optional[NexusRuntime] = None
+) -> Dict[str, int]:
+    """
+    Run every request in a JSONL file through the pipeline.
+
+    Requests are read lazily and run by a bounded pool of workers on one shared
+    runtime (the embedding model and clients load once). Each request writes its
+    code to output_root/<id>. One JSON line per finished request is appended to
+    results_path and flushed to disk immediately; that file is also the
+    checkpoint, so rerunning the same command skips requests already recorded.
+
+    Returns counts: processed, succeeded, failed, skipped.
+    """
+    runtime = runtime or get_runtime()
+    done = _load_batch_checkpoint(results_path, retry_failed)
+    counts = {"processed": 0, "succeeded": 0, "failed": 0, "skipped": 0}
+    if done:
+        print(f"Resuming batch: {len(done)} requests already recorded in {results_path}.")
+
+    os.makedirs(os.path.dirname(os.path.abspath(results_path)), exist_ok=True)
+    workers = max(1, int(workers))
+    pending: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=workers * 2)
+
+    with open(results_path, "a", encoding="utf-8") as results_file:
+        def record(entry: Dict[str, Any]):
+            results_file.write(json.dumps(entry, default=str) + "\n")
+            results_file.flush()
+            os.fsync(results_file.fileno())
+            counts["processed"] += 1
+            counts["succeeded" if entry.get("success") else "failed"] += 1
+            print(f"[batch] {entry['id']}: {'success' if entry.get('success') else 'failed'} ({counts['processed']} done)")
+
+        # A failure to record a result (e.g. disk full) stops the batch; workers keep
+        # draining the queue meanwhile so the reader never blocks on a full queue
+        fatal: list = []
+
+        async def worker():
+            while True:
+                item = await pending.get()
+                if item is None:
+                    return
+                if fatal:
+                    continue
+                try:
+                    await process(item)
+                except Exception as e:
+                    fatal.append(e)
+
+        async def process(item: Dict[str, Any]):
+            entry = {"id": item["id"], "query": item["query"]}
+            if item["error"]:
+                record({**entry, "success": False, "stage": "input", "error": item["error"]})
+                return
+            output_dir = os.path.join(output_root, _safe_dirname(item["id"]))
+            started = time.perf_counter()
+            try:
+                result = await run_pipeline_async(
+                    item["query"],
+                    rag_persist_dir=rag_persist_dir,
+                    code_output_dir=output_dir,
+                    runtime=runtime
+                )
+                entry.update(success=bool(result.get("success")), stage=result.get("stage"), result=result)
+            except Exception as e:
+                entry.update(success=False, stage="exception", error=str(e))
+            entry.update(output_dir=os.path.abspath(output_dir), duration_seconds=round(time.perf_counter() - started, 3))
+            record(entry)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        try:
+            seen = set()
+            for item in _iter_batch_requests(requests_path):
+                if fatal:
+                    break
+                if item["id"] in done:
+                    counts["skipped"] += 1
+                    continue
+                if item["id"] in seen:
+                    print(f"[batch] Duplicate request id {item['id']!r}; skipping.")
+                    counts["skipped"] += 1
+                    continue
+                seen.add(item["id"])
+                await pending.put(item)
+            for _ in tasks:
+                await pending.put(None)
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        if fatal:
+            raise fatal[0]
+
+    print(f"Batch finished: {counts}")
+    return counts
+
+
+def run_batch(requests_path: str, results_path: str, **kwargs) -> Dict[str, int]:
+    """Blocking wrapper around run_batch_async."""
+    return run_sync(run_batch_async(requests_path, results_path, **kwargs))
+
+
 def main(argv: Optional[list] = None):
     """
     Entry point for standalone execution.
 
     Example:
         python nexus_pipeline.py "Create me a weather app in LangGraph"
+        python nexus_pipeline.py --batch queries.jsonl --results results.jsonl --workers 8
     """
     argv = argv if argv is not None else sys.argv[1:]
-    if not argv:
+    parser = argparse.ArgumentParser(description="Run the Project Nexus pipeline.")
+    parser.add_argument("query", nargs="?", help="single user query")
+    parser.add_argument("--batch", metavar="REQUESTS_JSONL", help="run every request in a JSONL file")
+    parser.add_argument("--results", help="results JSONL / checkpoint (default: <batch file>.results.jsonl)")
+    parser.add_argument("--workers", type=int, default=4, help="pipelines run concurrently in batch mode")
+    parser.add_argument("--output-root", default="./generated_batches", help="per-request output directories")
+    parser.add_argument("--rag-dir", default="./rag_memory")
+    parser.add_argument("--retry-failed", action="store_true", help="rerun requests whose recorded result failed")
+    args = parser.parse_args(argv)
+
+    if args.batch:
+        results_path = args.results or os.path.splitext(args.batch)[0] + ".results.jsonl"
+        run_batch(
+            args.batch,
+            results_path,
+            output_root=args.output_root,
+            rag_persist_dir=args.rag_dir,
+            workers=args.workers,
+            retry_failed=args.retry_failed
+        )
+        return
+
+    if not args.query:
         print("No user query provided.")
         print('Usage: python nexus_pipeline.py "Create me a weather app in LangGraph"')
+        print("       python nexus_pipeline.py --batch queries.jsonl [--results results.jsonl] [--workers 4]")
         return
 
-    user_query = argv[0]
-    summary = run_pipeline(user_query)
+    summary = run_pipeline(args.query, rag_persist_dir=args.rag_dir)
 
     print("\nFinal Pipeline Summary:")
     print(json.dumps(summary, indent=2))
@@ -0,0 +1,263 @@
+# nexus_runtime.py
+# Long-lived owner of the pipeline's clients and agents
+# -----------------------------------------------------
+# Built once per process (see get_runtime) and shared by run_pipeline, the
+# Streamlit app and the MCP server, so a request only pays for its own work.
+
+import os
+import asyncio
+import threading
+from typing import Dict, Optional
+
+from rag_manager import RAGManager
+from dynamic_node_prompt import DynamicPromptNode
+from llm_validator import LLMValidator
+from reader_agent import ReaderAgent
+from writer_agent import WriterAgent
+from embedding_provider import get_embedding_provider
+from llm_cache import CachedLLM, LLMResponseCache, DEFAULT_LLM_CACHE_PATH
+from langchain_openai import AzureChatOpenAI
+
+LLM_TEMPERATURE = 0.7
+
+# Keep-alive HTTP pool for the LLM endpoint (override via environment)
+HTTP_MAX_CONNECTIONS = int(os.getenv("NEXUS_HTTP_MAX_CONNECTIONS", "32"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("NEXUS_HTTP_MAX_KEEPALIVE", "16"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("NEXUS_HTTP_KEEPALIVE_EXPIRY", "120"))
+HTTP_TIMEOUT = float(os.getenv("NEXUS_HTTP_TIMEOUT", "120"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("NEXUS_HTTP_CONNECT_TIMEOUT", "10"))
+
+# Hedged planning (see ReaderAgent): concurrent plan candidates, round budget and policy
+PLAN_HEDGE = int(os.getenv("NEXUS_PLAN_HEDGE", "1"))
+PLAN_HEDGE_BUDGET = float(os.environ["NEXUS_PLAN_HEDGE_BUDGET"]) if os.getenv("NEXUS_PLAN_HEDGE_BUDGET") else None
+PLAN_HEDGE_POLICY = os.getenv("NEXUS_PLAN_HEDGE_POLICY", "first_success")
+
+# Retries one pipeline run may spend across the reader, validator and writer
+RETRY_BUDGET = int(os.getenv("NEXUS_RETRY_BUDGET", "8"))
+
+
+def make_http_clients():
+    """
+    Build (sync, async) httpx clients with a bounded keep-alive pool, so LLM
+    calls reuse TCP connections and TLS sessions. Returns (None, None) when
+    httpx is unavailable; the OpenAI SDK then uses its own default clients.
+    """
+    try:
+        import httpx
+    except ImportError:
+        return None, None
+
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+    return httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+def make_llm_client(
+    use_cache: bool = True,
+    cache_path: str = DEFAULT_LLM_CACHE_PATH,
+    http_client=None,
+    http_async_client=None
+):
+    """
+    Initialize AzureChatOpenAI using environment variables.
+    Adjust this function if you switch to another LLM.
+
+    With use_cache=True the client is wrapped in CachedLLM, so identical prompts
+    (same deployment and temperature) are answered from a local SQLite cache.
+    http_client / http_async_client, if given, are the httpx clients (and
+    connection pools) the SDK sends requests through. The SDK's own retries are
+    off; callers retry through RetryPolicy.
+    """
+    deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
+    http_kwargs = {}
+    if http_client is not None:
+        http_kwargs["http_client"] = http_client
+    if http_async_client is not None:
+        http_kwargs["http_async_client"] = http_async_client
+
+    client = AzureChatOpenAI(
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        deployment_name=deployment,
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+        temperature=LLM_TEMPERATURE,
+        max_retries=0,   # RetryPolicy (and its per-pipeline RetryBudget) is the only retry layer
+        **http_kwargs
+    )
+    if not use_cache:
+        return client
+
+    try:
+        cache = LLMResponseCache(cache_path)
+    except Exception as e:
+        print(f"LLM response cache unavailable ({e}); calling the LLM directly.")
+        return client
+    return CachedLLM(client, cache, deployment=deployment, temperature=LLM_TEMPERATURE)
+
+
+class NexusRuntime:
+    """
+    Process-lifetime owner of the pipeline components.
+    --------------------------------------------------
+    - One LLM client on a keep-alive HTTP pool
+    - One shared LLMValidator and ReaderAgent (schema and memo caches persist)
+    - One RAGManager + DynamicPromptNode per memory directory, one WriterAgent
+      per output directory, each built on first use
+    - When it owns the async HTTP pool, a dedicated event loop thread runs every
+      pipeline, since pooled async connections are bound to the loop that opened them
+    """
+
+    def __init__(
+        self,
+        llm_client=None,
+        rag: Optional[RAGManager] = None,
+        rag_persist_dir: str = "./rag_memory",
+        use_llm_cache: bool = True,
+        writer_max_workers: int = 4,
+        plan_hedge: int = PLAN_HEDGE,
+        plan_hedge_budget: Optional[float] = PLAN_HEDGE_BUDGET,
+        plan_hedge_policy: str = PLAN_HEDGE_POLICY,
+        retry_budget: int = RETRY_BUDGET
+    ):
+        """
+        Args:
+            llm_client: LLM instance to share. If None, an Azure client is built
+                with make_llm_client() on pooled HTTP clients.
+            rag: RAGManager to use for every request instead of one per directory.
+            rag_persist_dir: default memory directory (restored by warm_up()).
+            use_llm_cache: wrap the Azure client in the LLM response cache.
+            writer_max_workers: component concurrency of each WriterAgent.
+            plan_hedge, plan_hedge_budget, plan_hedge_policy: ReaderAgent hedge,
+                hedge_budget and hedge_policy.
+            retry_budget: retries allowed per pipeline run (see retry_policy.RetryBudget).
+        """
+        self.rag_persist_dir = rag_persist_dir
+        self.writer_max_workers = writer_max_workers
+        self.retry_budget = retry_budget
+        self._lock = threading.RLock()
+        self._rag_override = rag
+        self._rags: Dict[str, RAGManager] = {}
+        self._prompt_nodes: Dict[int, DynamicPromptNode] = {}
+        self._writers: Dict[str, WriterAgent] = {}
+
+        self.http_client = None
+        self.http_async_client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+
+        if llm_client is None:
+            self.http_client, self.http_async_client = make_http_clients()
+            llm_client = make_llm_client(
+                use_cache=use_llm_cache,
+                http_client=self.http_client,
+                http_async_client=self.http_async_client
+            )
+            if self.http_async_client is not None:
+                self._start_loop()
+        self.llm = llm_client
+
+        self.validator = LLMValidator(self.llm)
+        self.reader = ReaderAgent(
+            llm_client=self.llm,
+            validator=self.validator,
+            hedge=plan_hedge,
+            hedge_budget=plan_hedge_budget,
+            hedge_policy=plan_hedge_policy
+        )
+
+    def _start_loop(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self._loop.run_forever, name="nexus-runtime-loop", daemon=True)
+        self._loop_thread.start()
+
+    def rag_for(self, persist_dir: Optional[str] = None) -> RAGManager:
+        """Shared RAGManager for persist_dir, restored from disk on first use."""
+        if self._rag_override is not None:
+            return self._rag_override
+        key = os.path.abspath(persist_dir or self.rag_persist_dir)
+        with self._lock:
+            rag = self._rags.get(key)
+            if rag is None:
+                rag = RAGManager(persist_dir=persist_dir or self.rag_persist_dir)
+                self._rags[key] = rag
+            return rag
+
+    def prompt_node_for(self, rag: RAGManager) -> DynamicPromptNode:
+        with self._lock:
+            node = self._prompt_nodes.get(id(rag))
+            if node is None or node.rag is not rag:
+                node = DynamicPromptNode(rag)
+                self._prompt_nodes[id(rag)] = node
+            return node
+
+    def writer_for(self, output_dir: str) -> WriterAgent:
+        """Shared WriterAgent saving into output_dir."""
+        key = os.path.abspath(output_dir)
+        with self._lock:
+            writer = self._writers.get(key)
+            if writer is None:
+                writer = WriterAgent(
+                    llm_client=self.llm,
+                    base_output_dir=output_dir,
+                    auto_save=True,
+                    max_workers=self.writer_max_workers
+                )
+                self._writers[key] = writer
+            return writer
+
+    async def run(self, coro):
+        """
+        Await coro on the runtime's event loop (or the caller's loop when the
+        runtime has none), so the pooled async HTTP client stays on one loop.
+        """
+        if self._loop is None:
+            return await coro
+        if asyncio.get_running_loop() is self._loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    def warm_up(self, background: bool = True) -> Optional[threading.Thread]:
+        """Restore the default memory and load its embedding model ahead of the first request."""
+        def _run():
+            try:
+                rag = self.rag_for(self.rag_persist_dir)
+                if rag.embedding_backend is not None:
+                    get_embedding_provider(rag.embedding_model, rag.embedding_backend).warm_up(background=False)
+            except Exception as e:
+                print(f"Runtime warm-up failed: {e}")
+
+        if not background:
+            _run()
+            return None
+        thread = threading.Thread(target=_run, name="nexus-runtime-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        """Release the HTTP pools and stop the runtime's event loop."""
+        if self.http_client is not None:
+            self.http_client.close()
+        if self._loop is not None:
+            if self.http_async_client is not None:
+                asyncio.run_coroutine_threadsafe(self.http_async_client.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop_thread.join()
+            self._loop.close()
+            self._loop = None
+
+
+_runtime: Optional[NexusRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> NexusRuntime:
+    """Return the process-wide NexusRuntime, building it on first use."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = NexusRuntime()
+        return _runtime
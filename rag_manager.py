@@ -61,84 +61,1064 @@
 
 
 import os
+import copy
 import uuid
 import json
-from typing import List, Dict
+import time
+import shutil
+import threading
+from typing import List, Dict, Iterator, Optional, Set, Tuple
+import numpy as np
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Embeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings
+# Embeddings (loaded lazily on first use and shared process-wide)
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.embeddings import Embeddings
+from embedding_provider import DEFAULT_EMBEDDING_MODEL, get_embedding_provider
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from index_tiering import IndexTiering, index_kind, reconstruct
+from metadata_index import MetadataIndex, check_filters, insight_metadata
+from insight_dedup import InsightDeduplicator, fingerprint, merge_records
+from memory_retention import RetentionPolicy, UsageStats
+from insight_record import RECORD_KEY, distill, is_legacy_text, stored_insight
+from hybrid_search import (
+    BM25Index, FUSION, FUSIONS, HYBRID_DEPTH, LEXICAL, LEXICAL_WEIGHT, RETRIEVAL_MODE, RETRIEVAL_MODES, RRF, RRF_K,
+    VECTOR, reciprocal_rank_fusion, weighted_fusion
+)
 
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+INDEX_DIRNAME = "faiss_index"
+LOG_FILENAME = "insights.log.jsonl"
+EMBEDDING_CACHE_FILENAME = "embedding_cache.sqlite3"
+# Records which embedding model/backend produced the checkpointed vectors
+INDEX_META_FILENAME = "index_meta.json"
 
 
 class RAGManager:
-    """Corrective RAG System using FAISS (Vercel-friendly)."""
+    """
+    Corrective RAG System using FAISS (Vercel-friendly).
 
-    def __init__(self, persist_dir: str = "./rag_memory"):
+    Each insight is stored as a structured record (docstore metadata) plus a
+    distilled plain-text summary of its fields; only the distilled text is
+    embedded and BM25-indexed, and fetch_context returns the parsed record.
+
+    With persist=True the memory survives restarts without re-embedding:
+      - every insert appends {id, text, metadata, vector} to an append-only log
+      - every `checkpoint_every` inserts the FAISS index is saved and the log truncated
+      - on startup the last checkpoint is loaded and the log tail replayed
+    With persist=False (or an unwritable persist_dir) memory is in-process only.
+
+    Query and insight embeddings go through a content-addressed cache (LRU in
+    memory, plus SQLite under persist_dir when persisting); see cache_stats().
+
+    embedding_backend selects "torch" or "onnx-int8" (see embedding_provider).
+    Switching backends on an existing memory: vectors stay in the same space but
+    are not identical, so re-embed the stored insights once with reindex() (or
+    pass reindex_on_mismatch=True); a mismatch is reported on startup. The same
+    applies to insights stored as JSON text by older versions, whose vectors are
+    in a different space from distilled text.
+
+    The FAISS index starts flat (exact) and is rebuilt as HNSW or IVF in a
+    background thread once the memory crosses index_tiering.threshold; queries
+    and inserts keep using the old index until the new one is swapped in. See
+    set_search_params(), index_stats() and measure_recall().
+
+    Session, tenant, framework preference, relevance tags and timestamp are kept
+    in a secondary MetadataIndex; fetch_context(filters=...) searches only the
+    matching insights instead of over-fetching and filtering afterwards.
+
+    A BM25 index over the insight text is maintained next to FAISS. By default
+    (retrieval_mode="hybrid") both rankings are fused, so exact framework names
+    and error strings are not lost to embedding similarity; mode="lexical"
+    answers from BM25 alone without embedding the query.
+
+    Inserts are deduplicated (see InsightDeduplicator): an exact or near
+    duplicate of a stored insight is merged into it, bumping hit_count and
+    last_seen, recording the session and folding the newer insight into the
+    stored record, instead of adding another vector.
+
+    Memory size is bounded by a RetentionPolicy: insights unused for longer
+    than its TTL expire, and above its capacity the least recently used (or
+    lowest hit count) ones are evicted. Evicted entries disappear from search
+    at once and are dropped from FAISS by a background compaction that swaps
+    in a rebuilt index; see evict(), compact() and index_stats().
+    """
+
+    def __init__(
+        self,
+        persist_dir: str = "./rag_memory",
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+        persist: bool = True,
+        checkpoint_every: int = 100,
+        embedding_cache_size: int = 2048,
+        embedding_cache_on_disk: bool = True,
+        embeddings: Optional[Embeddings] = None,
+        embedding_backend: Optional[str] = None,
+        reindex_on_mismatch: bool = False,
+        index_tiering: Optional[IndexTiering] = None,
+        retrieval_mode: str = RETRIEVAL_MODE,
+        fusion: str = FUSION,
+        deduplicator: Optional[InsightDeduplicator] = None,
+        retention: Optional[RetentionPolicy] = None
+    ):
         self.persist_dir = persist_dir
-        self.embeddings = embedding_model
+        self.embedding_model = embedding_model
+        self.persist = persist
+        self.checkpoint_every = max(1, int(checkpoint_every))
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval_mode {retrieval_mode!r}; expected one of {RETRIEVAL_MODES}")
+        if fusion not in FUSIONS:
+            raise ValueError(f"Unknown fusion {fusion!r}; expected one of {FUSIONS}")
+        self.retrieval_mode = retrieval_mode
+        self.fusion = fusion
 
-        # FAISS index starts empty
-        # Each restart of Vercel loads fresh memory — serverless friendly
+        self._lock = threading.RLock()
+        self._pending_since_checkpoint = 0
+        self.tiering = index_tiering or IndexTiering()
+        self.metadata_index = MetadataIndex()
+        self.lexical_index = BM25Index()
+        self.dedup = deduplicator or InsightDeduplicator()
+        self.retention = retention or RetentionPolicy()
+        self.usage = UsageStats()
+        self._evicted: Set[int] = set()                   # tombstoned positions awaiting compaction
+        self._compaction_merges: Optional[List[int]] = None
+        self._compact_requested = False
+        self._rebuild_thread: Optional[threading.Thread] = None
+
+        # FAISS index is created on the first insert (or loaded from disk)
         self.db = None
 
-    def _ensure_index(self):
-        """Create FAISS index if it doesn't exist."""
+        if self.persist:
+            try:
+                os.makedirs(self.persist_dir, exist_ok=True)
+            except OSError as e:
+                # Read-only filesystems (e.g. serverless) fall back to in-memory only
+                print(f"RAG persistence disabled ({e}); using in-memory index.")
+                self.persist = False
+
+        # An explicit embeddings object (e.g. an offline fake) replaces the shared provider
+        provider = get_embedding_provider(embedding_model, embedding_backend) if embeddings is None else None
+        self.embedding_backend = provider.backend if provider else None
+        self.embedding_id = provider.embedding_id if provider else embedding_model
+
+        cache_path = None
+        if self.persist and embedding_cache_on_disk:
+            cache_path = os.path.join(self.persist_dir, EMBEDDING_CACHE_FILENAME)
+        self.embedding_cache = EmbeddingCache(self.embedding_id, max_entries=embedding_cache_size, disk_path=cache_path)
+        self.embeddings = CachedEmbeddings(embeddings or provider, self.embedding_cache)
+
+        if self.persist:
+            self._restore()
+            indexed_with = self._indexed_embedding_id()
+            legacy = self._legacy_count()
+            if self.db is not None and indexed_with != self.embedding_id:
+                reason = f"memory was embedded with {indexed_with} but queries use {self.embedding_id}"
+            elif legacy:
+                reason = f"{legacy} insights are stored as JSON text rather than distilled text"
+            else:
+                reason = None
+            if reason and reindex_on_mismatch:
+                print(f"{reason[0].upper()}{reason[1:]}; re-embedding with {self.embedding_id}.")
+                self.reindex()
+            elif reason:
+                print(f"Warning: {reason}. Call reindex() (or pass reindex_on_mismatch=True) to re-embed the memory.")
+            with self._lock:
+                if self.db is not None:
+                    self.tiering.apply_search_params(self.db.index)
+                    self._maybe_evict()
+                    self._schedule_rebuild()
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.persist_dir, INDEX_DIRNAME)
+
+    @property
+    def _log_path(self) -> str:
+        return os.path.join(self.persist_dir, LOG_FILENAME)
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.persist_dir, INDEX_META_FILENAME)
+
+    def _indexed_embedding_id(self) -> str:
+        """Embedding id recorded with the checkpoint; memories predating it used the torch model."""
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("embedding_id") or self.embedding_model
+        except (OSError, ValueError, AttributeError):
+            return self.embedding_model
+
+    def _write_index_meta(self):
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"embedding_id": self.embedding_id}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _restore(self):
+        """
+        Load the last checkpoint and replay the log tail. No text is re-embedded.
+        A checkpoint interrupted mid-swap leaves only index.old (restored into
+        place) and possibly a half-written index.tmp (discarded); an unreadable
+        index falls back to index.old, and the log is replayed on top either way.
+        """
+        tmp_path = self._index_path + ".tmp"
+        old_path = self._index_path + ".old"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isdir(self._index_path) and os.path.isdir(old_path):
+            print("Restoring the previous memory checkpoint (the last one was interrupted).")
+            os.replace(old_path, self._index_path)
+
+        for path in (self._index_path, old_path):
+            if not os.path.isdir(path):
+                continue
+            try:
+                self.db = FAISS.load_local(
+                    path,
+                    self.embeddings,
+                    allow_dangerous_deserialization=True  # our own checkpoint
+                )
+            except Exception as e:
+                print(f"Could not load memory checkpoint {path} ({e}).")
+                continue
+            self._rebuild_secondary_indexes()
+            break
+
+        if not os.path.exists(self._log_path):
+            return
+
+        known_ids = set(self.db.index_to_docstore_id.values()) if self.db is not None else set()
+        text_embeddings, metadatas, ids = [], [], []
+        merges: Dict[str, Dict] = {}
+        evicted_ids: Set[str] = set()
+        with open(self._log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-append; everything before it is intact
+                    print("Skipping corrupt insight log entry.")
+                    continue
+                if "merged" in entry:
+                    merges[entry["id"]] = entry["merged"]   # latest metadata of a merged-into entry
+                    continue
+                if entry.get("evicted"):
+                    evicted_ids.add(entry["id"])
+                    continue
+                if entry["id"] in known_ids:
+                    continue
+                known_ids.add(entry["id"])
+                text_embeddings.append((entry["text"], entry["vector"]))
+                metadatas.append(entry.get("metadata", {}))
+                ids.append(entry["id"])
+
+        if ids:
+            self._add_vectors(text_embeddings, metadatas, ids)
+            self._pending_since_checkpoint = len(ids)
+            print(f"Replayed {len(ids)} insights from the memory log.")
+        if merges and self.db is not None:
+            for position, doc_id in self.db.index_to_docstore_id.items():
+                if doc_id in merges:
+                    self.db.docstore.search(doc_id).metadata.update(merges[doc_id])
+                    self.metadata_index.add_terms(position, merges[doc_id])
+            self._pending_since_checkpoint += len(merges)
+        if evicted_ids and self.db is not None:
+            positions = [p for p, doc_id in self.db.index_to_docstore_id.items() if doc_id in evicted_ids]
+            self._tombstone(positions, log=False)
+            self._pending_since_checkpoint += len(positions)
+
+    def _rebuild_secondary_indexes(self):
+        """Re-derive the metadata, BM25, dedup and usage indexes from the docstore (checkpoints only store the docs)."""
+        for index in (self.metadata_index, self.lexical_index, self.dedup, self.usage):
+            index.clear()
+        self._evicted = set()
+        if self.db is None:
+            return
+        docs = [self.db.docstore.search(self.db.index_to_docstore_id[p]) for p in range(self.db.index.ntotal)]
+        self._evicted = self._index_docs(docs, 0, self.metadata_index, self.lexical_index, self.dedup, self.usage)
+
+    def _legacy_count(self) -> int:
+        """Live insights whose text (and so vector) is the JSON dump written by older versions and reindex() can distill."""
+        if self.db is None:
+            return 0
+        docs = (self.db.docstore.search(doc_id) for p, doc_id in self.db.index_to_docstore_id.items() if p not in self._evicted)
+        return sum(1 for doc in docs if is_legacy_text(doc) and stored_insight(doc) is not None)
+
+    @staticmethod
+    def _doc_metadata(doc) -> Dict:
+        """A copy of doc's metadata, completed from its insight for entries written by older versions."""
+        metadata = dict(getattr(doc, "metadata", None) or {})
+        if "tags" not in metadata or "content_hash" not in metadata:
+            # Older memories only kept session_id (or no dedup fingerprint)
+            try:
+                insight = stored_insight(doc)
+                content_hash, sketch = fingerprint(insight)
+                metadata = {
+                    **insight_metadata(insight),
+                    "content_hash": content_hash,
+                    "simhash": sketch,
+                    **metadata,
+                    RECORD_KEY: insight
+                }
+            except (ValueError, TypeError, AttributeError):
+                pass
+        return metadata
+
+    @classmethod
+    def _index_docs(cls, docs, start: int, metadata_index, lexical_index, dedup, usage) -> Set[int]:
+        """
+        Add docs (at FAISS positions start, start + 1, ...) to the given secondary
+        indexes. Returns the positions of docs marked evicted.
+        """
+        evicted = set()
+        for position, doc in enumerate(docs, start):
+            metadata = cls._doc_metadata(doc)
+            metadata_index.add(position, metadata)
+            lexical_index.add(position, doc.page_content)
+            dedup.add(position, metadata)
+            usage.add(position, metadata)
+            if metadata.get("evicted"):
+                dedup.discard(position, metadata)
+                evicted.add(position)
+        return evicted
+
+    def _append_log(self, text_embeddings: List[Tuple[str, List[float]]], metadatas: List[Dict], ids: List[str]):
+        with open(self._log_path, "a", encoding="utf-8") as f:
+            for (text, vector), metadata, doc_id in zip(text_embeddings, metadatas, ids):
+                f.write(json.dumps({
+                    "id": doc_id,
+                    "text": text,
+                    "metadata": metadata,
+                    "vector": [float(x) for x in vector]
+                }) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _append_merge_log(self, merges: List[Tuple[str, Dict]]):
+        """Log the updated metadata of entries that absorbed duplicates."""
+        with open(self._log_path, "a", encoding="utf-8") as f:
+            for doc_id, metadata in merges:
+                f.write(json.dumps({"id": doc_id, "merged": metadata}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _append_evict_log(self, ids: List[str]):
+        with open(self._log_path, "a", encoding="utf-8") as f:
+            for doc_id in ids:
+                f.write(json.dumps({"id": doc_id, "evicted": True}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _flush_usage(self):
+        """Copy retrieval counters into the docstore metadata so checkpoints keep them. Caller holds the lock."""
+        for position in self.usage.dirty:
+            metadata = self.db.docstore.search(self.db.index_to_docstore_id[position]).metadata
+            metadata["retrievals"] = self.usage.retrievals[position]
+            metadata["last_retrieved"] = self.usage.last_retrieved[position]
+        self.usage.dirty.clear()
+
+    def checkpoint(self):
+        """Save the FAISS index to persist_dir and truncate the append log."""
+        if not self.persist:
+            return
+        with self._lock:
+            if self.db is None:
+                return
+            self._flush_usage()
+            tmp_path = self._index_path + ".tmp"
+            old_path = self._index_path + ".old"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            self.db.save_local(tmp_path)
+
+            self._write_index_meta()
+
+            # Swap in the new checkpoint; the log is only truncated once it is in place
+            # (_restore recovers from a crash between the two renames)
+            if os.path.isdir(self._index_path):
+                shutil.rmtree(old_path, ignore_errors=True)
+                os.replace(self._index_path, old_path)
+            os.replace(tmp_path, self._index_path)
+            shutil.rmtree(old_path, ignore_errors=True)
+
+            open(self._log_path, "w", encoding="utf-8").close()
+            self._pending_since_checkpoint = 0
+
+    # ------------------------------------------------------------------
+    # Index operations
+    # ------------------------------------------------------------------
+    def _add_vectors(self, text_embeddings: List[Tuple[str, List[float]]], metadatas: List[Dict], ids: List[str]):
+        """Add precomputed vectors, creating the FAISS index on first use."""
         if self.db is None:
-            self.db = FAISS.from_texts(
-                texts=[],
+            start = 0
+            for index in (self.metadata_index, self.lexical_index, self.dedup, self.usage):
+                index.clear()
+            self._evicted = set()
+            self.db = FAISS.from_embeddings(
+                text_embeddings=text_embeddings,
                 embedding=self.embeddings,
-                metadatas=[]
+                metadatas=metadatas,
+                ids=ids
             )
+        else:
+            start = self.db.index.ntotal
+            self.db.add_embeddings(text_embeddings=text_embeddings, metadatas=metadatas, ids=ids)
+        self.metadata_index.add_many(start, metadatas)
+        self.lexical_index.add_many(start, (text for text, _ in text_embeddings))
+        self.dedup.add_many(start, metadatas)
+        self.usage.add_many(start, metadatas)
 
-    def add_corrective_insight(self, insight_package: Dict):
-        """Store the entire insight as one paragraph."""
-        try:
-            self._ensure_index()
+    def _prepare_insight(self, insight_package: Dict) -> Tuple[str, Dict]:
+        """Return the (distilled text, metadata with the insight record) pair stored for one insight."""
+        if not isinstance(insight_package, dict):
+            raise TypeError(f"Insight must be a dict, got {type(insight_package).__name__}")
+        record = json.loads(json.dumps(insight_package))   # detached, JSON-safe copy for the docstore and log
+        metadata = insight_metadata(record)
+        content_hash, sketch = fingerprint(record)
+        metadata.update(content_hash=content_hash, simhash=sketch, hit_count=1, last_seen=metadata["timestamp"])
+        metadata[RECORD_KEY] = record
+        return distill(record) or json.dumps(record, separators=(",", ":")), metadata
 
-            paragraph = json.dumps(insight_package, indent=2)
+    def _neighbours(self, vector) -> List[Tuple[int, float]]:
+        """(position, cosine similarity) of the stored vectors nearest to vector. Caller holds the lock."""
+        query = np.asarray(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        _, positions = self.tiering.search(self.db.index, query, self.dedup.probe_k, exclude=self._evicted)
+        neighbours = []
+        for position in positions:
+            stored = reconstruct(self.db.index, int(position), int(position) + 1)[0]
+            neighbours.append((int(position), float(np.dot(query, stored) / max(float(np.linalg.norm(stored)), 1e-12))))
+        return neighbours
 
-            self.db.add_texts(
-                texts=[paragraph],
-                metadatas=[{"session_id": insight_package.get("session_id")}],
-                ids=[str(uuid.uuid4())]
-            )
+    def _stored_record(self, position: int) -> Optional[Dict]:
+        return stored_insight(self.db.docstore.search(self.db.index_to_docstore_id[position]))
+
+    def _merge_duplicate(self, position: int, metadata: Dict) -> Tuple[str, Dict]:
+        """
+        Fold a duplicate insert into the stored entry at position. Caller holds the lock.
+        The stored record takes the newer insight's fields (lists unioned, see
+        merge_records); its embedded text and vector stay those of the first insert.
+        """
+        doc_id = self.db.index_to_docstore_id[position]
+        doc = self.db.docstore.search(doc_id)
+        stored = doc.metadata
+        record = stored_insight(doc)
+        if record is not None and metadata.get(RECORD_KEY) is not None:
+            stored[RECORD_KEY] = merge_records(record, metadata[RECORD_KEY])
+        stored["hit_count"] = int(stored.get("hit_count") or 1) + 1
+        stored["last_seen"] = max(stored.get("last_seen") or 0.0, metadata.get("timestamp") or time.time())
+
+        sessions = list(stored.get("session_ids") or ([stored["session_id"]] if stored.get("session_id") else []))
+        if metadata.get("session_id") and metadata["session_id"] not in sessions:
+            sessions.append(metadata["session_id"])
+        stored["session_ids"] = sessions
+        stored["tags"] = sorted(set(stored.get("tags") or []) | set(metadata.get("tags") or []))
+        self.metadata_index.add_terms(position, stored)
+        self.usage.seen(position, stored["last_seen"])
+        if self._compaction_merges is not None:
+            self._compaction_merges.append(position)   # re-applied to the compacted index at the swap
+        return doc_id, {key: stored[key] for key in ("hit_count", "last_seen", "session_ids", "tags", RECORD_KEY)}
+
+    def _store_prepared(self, texts: List[str], metadatas: List[Dict]) -> List[Tuple[str, str]]:
+        """
+        Embed a batch of prepared insights and add them to the index (and log) in
+        bulk. Duplicates, of stored insights or of earlier ones in the batch, are
+        merged instead; exact duplicates are not embedded at all.
+        Returns one (id, "stored" | "merged") pair per insight.
+        """
+        db = self.db
+        skip = set()
+        if self.dedup.enabled:
+            first_of_hash: Dict[str, int] = {}
+            with self._lock:
+                for i, metadata in enumerate(metadatas):
+                    content_hash = metadata.get("content_hash")
+                    if (db is not None and self.dedup.exact(metadata) is not None) or content_hash in first_of_hash:
+                        skip.add(i)
+                    first_of_hash.setdefault(content_hash, i)
+
+        def embed(indexes):
+            return dict(zip(indexes, self.embeddings.embed_documents([texts[i] for i in indexes]))) if indexes else {}
+
+        vectors = embed([i for i in range(len(texts)) if i not in skip])
+
+        with self._lock:
+            if self.db is not db:
+                # Cleared or re-indexed meanwhile: the skipped inserts may be new after all
+                vectors.update(embed([i for i in range(len(texts)) if i not in vectors]))
 
-            print(f"Insight stored for session: {insight_package.get('session_id')}")
-            return {"status": "stored", "session_id": insight_package.get("session_id")}
+            results: List[Optional[Tuple[str, str]]] = [None] * len(texts)
+            new: List[int] = []
+            kept: List[Tuple[Dict, object]] = []    # (metadata, unit vector) of new, for in-batch checks
+            batch_merges: List[Tuple[int, int]] = []
+            merge_log: List[Tuple[str, Dict]] = []
+
+            for i, metadata in enumerate(metadatas):
+                position = None
+                if self.db is not None and self.dedup.enabled:
+                    position = self.dedup.exact(metadata)
+                    if position is None and i in vectors:
+                        position = self.dedup.near(metadata, self._neighbours(vectors[i]), self._stored_record)
+                if position is not None:
+                    doc_id, merged = self._merge_duplicate(position, metadata)
+                    results[i] = (doc_id, "merged")
+                    merge_log.append((doc_id, merged))
+                    continue
+
+                unit = None
+                if i in vectors:
+                    unit = np.asarray(vectors[i], dtype=np.float32)
+                    unit = unit / max(float(np.linalg.norm(unit)), 1e-12)
+                earlier = None
+                if self.dedup.enabled:
+                    earlier = next(
+                        (j for j, (other, _) in enumerate(kept) if other.get("content_hash") == metadata.get("content_hash")),
+                        None
+                    )
+                    if earlier is None and unit is not None:
+                        earlier = self.dedup.near_in_batch(metadata, unit, kept)
+                if earlier is not None:
+                    batch_merges.append((i, earlier))
+                    continue
+                new.append(i)
+                kept.append((metadata, unit))
+
+            if new:
+                start = self.db.index.ntotal if self.db is not None else 0
+                text_embeddings = [(texts[i], vectors[i]) for i in new]
+                new_metadatas = [metadatas[i] for i in new]
+                ids = [str(uuid.uuid4()) for _ in new]
+                if self.persist:
+                    self._append_log(text_embeddings, new_metadatas, ids)
+                self._add_vectors(text_embeddings, new_metadatas, ids)
+                for i, doc_id in zip(new, ids):
+                    results[i] = (doc_id, "stored")
+                for i, j in batch_merges:
+                    doc_id, merged = self._merge_duplicate(start + j, metadatas[i])
+                    results[i] = (doc_id, "merged")
+                    merge_log.append((doc_id, merged))
+
+            if merge_log and self.persist:
+                self._append_merge_log(merge_log)
+
+            self._pending_since_checkpoint += len(new) + len(merge_log)
+            self._maybe_evict()
+            if self.persist and self._pending_since_checkpoint >= self.checkpoint_every:
+                self.checkpoint()
+            self._schedule_rebuild()
+
+        return results
+
+    def add_corrective_insight(self, insight_package: Dict):
+        """Store the insight as a record plus distilled text (or merge it into a stored duplicate)."""
+        try:
+            text, metadata = self._prepare_insight(insight_package)
+            doc_id, status = self._store_prepared([text], [metadata])[0]
+
+            if status == "merged":
+                print(f"Duplicate insight from session {insight_package.get('session_id')} merged into {doc_id}")
+            else:
+                print(f"Insight stored for session: {insight_package.get('session_id')}")
+            return {"status": status, "id": doc_id, "session_id": insight_package.get("session_id")}
 
         except Exception as e:
             print(f"Error storing insight: {e}")
             return {"status": "failed", "error": str(e)}
 
-    def fetch_context(self, query: str, k: int = 3) -> List[Dict]:
-        """Retrieve relevant paragraphs."""
+    def _iter_insights(self, source) -> Iterator[Tuple[Optional[Dict], Optional[str]]]:
+        """Yield (insight, error) pairs from an iterable of dicts or a JSONL file path."""
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "r", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line), None
+                    except json.JSONDecodeError as e:
+                        yield None, f"Invalid JSON on line {line_no}: {e}"
+        else:
+            for insight in source:
+                yield insight, None
+
+    def add_corrective_insights(self, insights, batch_size: int = 256) -> Dict:
+        """
+        Bulk-ingest corrective insights.
+
+        Args:
+            insights: a list or generator of insight dicts, or a path to a JSONL file.
+            batch_size: number of insights embedded and added to FAISS per batch.
+        Returns:
+            {"status", "stored", "merged", "failed", "items"} where items holds
+            one {"index", "status", ...} entry per input insight, in input order;
+            "merged" items were duplicates folded into an existing entry.
+        """
+        batch_size = max(1, int(batch_size))
+        items: List[Dict] = []
+        batch: List[Tuple[int, str, Dict]] = []
+
+        def flush():
+            if not batch:
+                return
+            try:
+                outcomes = self._store_prepared([b[1] for b in batch], [b[2] for b in batch])
+                for (index, _, metadata), (doc_id, outcome) in zip(batch, outcomes):
+                    items[index] = {
+                        "index": index,
+                        "status": outcome,
+                        "id": doc_id,
+                        "session_id": metadata.get("session_id")
+                    }
+            except Exception as e:
+                for index, _, _ in batch:
+                    items[index] = {"index": index, "status": "failed", "error": str(e)}
+            batch.clear()
+
+        for index, (insight, error) in enumerate(self._iter_insights(insights)):
+            items.append({"index": index, "status": "pending"})
+            if error is None:
+                try:
+                    text, metadata = self._prepare_insight(insight)
+                    batch.append((index, text, metadata))
+                except Exception as e:
+                    error = str(e)
+            if error is not None:
+                items[index] = {"index": index, "status": "failed", "error": error}
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+
+        stored = sum(1 for item in items if item["status"] == "stored")
+        merged = sum(1 for item in items if item["status"] == "merged")
+        failed = len(items) - stored - merged
+        if not failed:
+            status = "stored"
+        elif stored or merged:
+            status = "partial"
+        else:
+            status = "failed"
+
+        print(f"Bulk insight ingestion: {stored} stored, {merged} merged, {failed} failed.")
+        return {"status": status, "stored": stored, "merged": merged, "failed": failed, "items": items}
+
+    def fetch_context(self, query: str, k: int = 3, filters: Optional[Dict] = None, mode: Optional[str] = None) -> List[Dict]:
+        """
+        Retrieve relevant insights.
+
+        Args:
+            query: text to search for.
+            k: number of insights to return.
+            filters: optional metadata restriction, e.g.
+                {"session_id": "abc", "tags": ["langgraph"], "since": "2025-01-01"};
+                see MetadataIndex.candidates for the keys. Only matching insights
+                are searched, and nothing is embedded if none match.
+            mode: "vector", "lexical" or "hybrid" (default: retrieval_mode).
+                "lexical" never embeds the query; use it for short keyword queries.
+        Returns:
+            [{"text", "insight", "similarity"}] best first, where text is the
+            distilled text that was embedded, insight a copy of the stored
+            insight dict (already parsed; None if a legacy entry's text is not JSON) and
+            similarity the vector L2 distance (None for insights only found
+            lexically). Lexical and hybrid results also carry "lexical_score"
+            (BM25) and the fused "score".
+        """
+        mode = mode or self.retrieval_mode
+        # Bad arguments are the caller's error, not a retrieval failure
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}")
+        if filters:
+            check_filters(filters)
         try:
-            self._ensure_index()
+            db = self.db
+            if db is None:
+                return []
 
-            results = self.db.similarity_search_with_score(query, k=k)
+            candidates = None
+            if filters:
+                with self._lock:
+                    candidates = self.metadata_index.candidates(filters) - self._evicted
+                if not candidates:
+                    return []
 
-            return [
-                {"text": doc.page_content, "similarity": score}
-                for doc, score in results
-            ]
+            query_vector = None if mode == LEXICAL else self.embeddings.embed_query(query)
+            with self._lock:
+                if self.db is not db:
+                    db = self.db
+                    if db is None:
+                        return []
+                    if filters:
+                        candidates = self.metadata_index.candidates(filters) - self._evicted
+
+                depth = k if mode == VECTOR else k * HYBRID_DEPTH
+                vector_hits, lexical_hits = [], []
+                if query_vector is not None:
+                    dists, positions = self.tiering.search(db.index, query_vector, depth, candidates, self._evicted)
+                    vector_hits = [(int(position), float(dist)) for dist, position in zip(dists, positions)]
+                if mode != VECTOR:
+                    lexical_hits = self.lexical_index.search(query, depth, candidates, self._evicted)
+
+                if mode == VECTOR:
+                    ranked = vector_hits
+                elif mode == LEXICAL:
+                    ranked = lexical_hits
+                elif self.fusion == RRF:
+                    ranked = reciprocal_rank_fusion([[p for p, _ in vector_hits], [p for p, _ in lexical_hits]], RRF_K)
+                else:
+                    ranked = weighted_fusion(vector_hits, lexical_hits, LEXICAL_WEIGHT)
+
+                distances, lexical_scores = dict(vector_hits), dict(lexical_hits)
+                contexts = []
+                for position, score in ranked[:k]:
+                    doc = db.docstore.search(db.index_to_docstore_id[position])
+                    context = {
+                        "text": doc.page_content,
+                        "insight": copy.deepcopy(stored_insight(doc)),   # callers must not edit the stored record
+                        "similarity": distances.get(position)
+                    }
+                    if mode != VECTOR:
+                        context["lexical_score"] = lexical_scores.get(position)
+                        context["score"] = score
+                    contexts.append(context)
+                self.usage.retrieved([position for position, _ in ranked[:k]], time.time())
+            return contexts
 
         except Exception as e:
             print(f"Error fetching context: {e}")
             return []
 
-    def clear_memory(self, confirm=False):
-        if confirm:
-            self.db = None   # reset in-memory FAISS
-            print("Memory cleared.")
-        else:
-            print("Pass confirm=True to clear memory.")
+    def reindex(self, batch_size: int = 256) -> int:
+        """
+        Re-embed every stored insight with the current embedding backend and
+        rebuild the index (then checkpoint). Use after changing embedding_model
+        or embedding_backend, or to move insights stored as JSON text by older
+        versions (or distilled by an older format) to the current distilled text. Inserts and queries wait until it finishes.
+        Returns the number of insights re-embedded.
+        """
+        batch_size = max(1, int(batch_size))
+        with self._lock:
+            if self.db is None:
+                return 0
+            self._flush_usage()
+            ids = [doc_id for p, doc_id in sorted(self.db.index_to_docstore_id.items()) if p not in self._evicted]
+            if not ids:
+                self.clear_memory(confirm=True)   # everything was evicted
+                return 0
+            docs = [self.db.docstore.search(doc_id) for doc_id in ids]
+            metadatas = [self._doc_metadata(doc) for doc in docs]
+            # Text is re-distilled from the record, which also moves entries stored as JSON text by older versions
+            texts = [
+                distill(metadata[RECORD_KEY]) or doc.page_content if metadata.get(RECORD_KEY) else doc.page_content
+                for doc, metadata in zip(docs, metadatas)
+            ]
+
+            vectors: List[List[float]] = []
+            for start in range(0, len(texts), batch_size):
+                vectors.extend(self.embeddings.embed_documents(texts[start:start + batch_size]))
+
+            self.db = None
+            if ids:
+                self._add_vectors(list(zip(texts, vectors)), metadatas, ids)
+            self._pending_since_checkpoint = len(ids)
+            self.checkpoint()
+            self._schedule_rebuild()
 
+        print(f"Re-embedded {len(ids)} insights with {self.embedding_id}.")
+        return len(ids)
 
+    # ------------------------------------------------------------------
+    # Retention
+    # ------------------------------------------------------------------
+    def _tombstone(self, positions: List[int], log: bool = True):
+        """Hide positions from search until the next compaction removes them. Caller holds the lock."""
+        positions = [p for p in positions if p not in self._evicted]
+        ids = []
+        for position in positions:
+            doc_id = self.db.index_to_docstore_id[position]
+            metadata = self.db.docstore.search(doc_id).metadata
+            metadata["evicted"] = True   # saved with the next checkpoint
+            self.dedup.discard(position, metadata)
+            self._evicted.add(position)
+            ids.append(doc_id)
+        if ids and log and self.persist:
+            self._append_evict_log(ids)
 
+    def _maybe_evict(self):
+        """Run an eviction round if the retention policy says one is due. Caller holds the lock."""
+        if self.db is not None and self.retention.due(self.db.index.ntotal - len(self._evicted), time.time()):
+            self.evict()
 
+    def evict(self, now: Optional[float] = None) -> Dict:
+        """
+        Apply the retention policy: expire insights unused for longer than its
+        TTL, then evict down to its capacity. Evicted insights stop appearing in
+        results immediately; compaction (started here once enough have piled
+        up, or via compact()) removes them from the index.
+
+        Args:
+            now: reference time for the TTL (default: the current time).
+        Returns:
+            {"expired", "evicted", "live"} counts.
+        """
+        with self._lock:
+            if self.db is None:
+                return {"expired": 0, "evicted": 0, "live": 0}
+            expired = self.retention.expired(self.usage, self._evicted, now)
+            self._tombstone(expired)
+            victims = self.retention.victims(self.usage, self._evicted)
+            self._tombstone(victims)
+            self._pending_since_checkpoint += len(expired) + len(victims)
+            live = self.db.index.ntotal - len(self._evicted)
+            if expired or victims:
+                print(f"Memory retention: {len(expired)} expired, {len(victims)} evicted, {live} live.")
+                self._schedule_rebuild()
+            return {"expired": len(expired), "evicted": len(victims), "live": live}
+
+    # ------------------------------------------------------------------
+    # Index tiering and compaction
+    # ------------------------------------------------------------------
+    def _next_rebuild(self):
+        """(method, args) of the rebuild due next, or None: compaction first, then re-tiering."""
+        if self.db is None:
+            return None
+        if self._evicted and (self._compact_requested or self.retention.should_compact(self.db.index.ntotal, len(self._evicted))):
+            return self._compact, (self.db,)
+        kind = self.tiering.target_kind(self.db.index)
+        return (self._rebuild_index, (kind, self.db)) if kind is not None else None
 
+    def _schedule_rebuild(self):
+        """Start a compaction or re-tiering rebuild if one is due. Caller holds the lock."""
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        if self._next_rebuild() is None:
+            return
+        if not self.tiering.background:
+            self._run_rebuilds()
+            return
+        self._rebuild_thread = threading.Thread(target=self._run_rebuilds, name="nexus-index-rebuild", daemon=True)
+        self._rebuild_thread.start()
+
+    def _run_rebuilds(self):
+        """Run due rebuilds one after another; compacting can make a different index kind suit the memory."""
+        while True:
+            with self._lock:
+                job = self._next_rebuild()
+            # A failed or aborted job is retried on a later insert, not in a loop here
+            if job is None or not job[0](*job[1]):
+                return
+
+    def _rebuild_index(self, kind: str, db) -> bool:
+        """
+        Build a `kind` index from db's vectors and swap it in. Only the snapshot
+        and the swap hold the lock; vectors added meanwhile are copied over at the swap.
+        Returns whether the new index was swapped in.
+        """
+        try:
+            with self._lock:
+                if self.db is not db:
+                    return False
+                snapshot_size = db.index.ntotal
+                vectors = reconstruct(db.index, 0, snapshot_size)
+                metric = db.index.metric_type
+
+            started = time.perf_counter()
+            index = self.tiering.build(kind, vectors, metric)
+            del vectors
+
+            with self._lock:
+                if self.db is not db:
+                    return False   # cleared or re-indexed while building
+                if db.index.ntotal > snapshot_size:
+                    index.add(reconstruct(db.index, snapshot_size, db.index.ntotal))
+                db.index = index
+                if self.persist:
+                    self.checkpoint()
+            print(f"Memory index rebuilt as {kind} ({index.ntotal} vectors) in {time.perf_counter() - started:.1f}s.")
+            return True
+        except Exception as e:
+            print(f"Memory index rebuild failed ({e}); keeping the current index.")
+            return False
+
+    def _compact(self, db) -> bool:
+        """
+        Rebuild the index, docstore, id mapping and secondary indexes without the
+        evicted entries and swap them in. As in _rebuild_index, only the snapshot
+        and the swap hold the lock; inserts, merges and evictions made while
+        building are carried over at the swap. Returns whether it was swapped in.
+        """
+        try:
+            with self._lock:
+                if self.db is not db or not self._evicted:
+                    return False
+                snapshot_size = db.index.ntotal
+                keep = [p for p in range(snapshot_size) if p not in self._evicted]
+                ids = [db.index_to_docstore_id[p] for p in keep]
+                docs = [db.docstore.search(doc_id) for doc_id in ids]
+                vectors = reconstruct(db.index, 0, snapshot_size)[keep]
+                metric = db.index.metric_type
+                kind = self.tiering.kind_for(len(keep), index_kind(db.index))
+                self._compaction_merges = []
+                self._compact_requested = False
+
+            started = time.perf_counter()
+            index = self.tiering.build(kind, vectors, metric)
+            del vectors
+            metadata_index, usage = MetadataIndex(), UsageStats()
+            lexical_index = BM25Index(self.lexical_index.k1, self.lexical_index.b)
+            dedup = copy.copy(self.dedup)   # same settings, empty state
+            dedup.clear()
+            self._index_docs(docs, 0, metadata_index, lexical_index, dedup, usage)
+
+            with self._lock:
+                if self.db is not db:
+                    return False   # cleared or re-indexed while building
+                # Inserts made while building (evicted ones stay as tombstones)
+                if db.index.ntotal > snapshot_size:
+                    index.add(reconstruct(db.index, snapshot_size, db.index.ntotal))
+                    delta = range(snapshot_size, db.index.ntotal)
+                    delta_ids = [db.index_to_docstore_id[p] for p in delta]
+                    delta_docs = [db.docstore.search(doc_id) for doc_id in delta_ids]
+                    self._index_docs(delta_docs, len(keep), metadata_index, lexical_index, dedup, usage)
+                    keep.extend(delta)
+                    ids.extend(delta_ids)
+                    docs.extend(delta_docs)
+                remap = {old: new for new, old in enumerate(keep)}
+                evicted = {remap[p] for p in self._evicted if p in remap}
+                for position in evicted:
+                    dedup.discard(position, docs[position].metadata)
+                for position in self._compaction_merges:
+                    if position in remap:
+                        metadata_index.add_terms(remap[position], docs[remap[position]].metadata)
+
+                removed = db.index.ntotal - len(keep)
+                self.db = FAISS(
+                    db.embedding_function,
+                    index,
+                    InMemoryDocstore(dict(zip(ids, docs))),
+                    dict(enumerate(ids)),
+                    relevance_score_fn=db.override_relevance_score_fn,
+                    normalize_L2=db._normalize_L2,
+                    distance_strategy=db.distance_strategy
+                )
+                self.metadata_index, self.lexical_index, self.dedup = metadata_index, lexical_index, dedup
+                self.usage = self.usage.select(keep)
+                self._evicted = evicted
+                if self.persist:
+                    self.checkpoint()
+            print(
+                f"Memory compacted: {removed} evicted insights removed, {index.ntotal} kept "
+                f"({kind}) in {time.perf_counter() - started:.1f}s."
+            )
+            return True
+        except Exception as e:
+            print(f"Memory compaction failed ({e}); keeping the current index.")
+            return False
+        finally:
+            self._compaction_merges = None
+
+    def compact(self, wait: bool = True) -> int:
+        """
+        Drop evicted entries from the index now instead of waiting for the
+        retention policy's compact_ratio. Reads continue during the rebuild.
+
+        Args:
+            wait: block until the compaction has finished.
+        Returns:
+            The number of evicted entries still awaiting removal.
+        """
+        with self._lock:
+            self._compact_requested = True
+            self._schedule_rebuild()
+        if wait:
+            self.wait_for_index_rebuild()
+            with self._lock:
+                if self._compact_requested and self._evicted:
+                    self._schedule_rebuild()   # a rebuild was already running; compact after it
+            self.wait_for_index_rebuild()
+        return len(self._evicted)
+
+    def wait_for_index_rebuild(self, timeout: Optional[float] = None) -> bool:
+        """Block until a running background rebuild or compaction finishes. Returns False on timeout."""
+        thread = self._rebuild_thread
+        if thread is None:
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def set_search_params(self, ef_search: Optional[int] = None, nprobe: Optional[int] = None):
+        """Change HNSW ef_search / IVF nprobe; applies to the live index and future rebuilds."""
+        with self._lock:
+            if ef_search is not None:
+                self.tiering.hnsw_ef_search = int(ef_search)
+            if nprobe is not None:
+                self.tiering.ivf_nprobe = int(nprobe)
+            if self.db is not None:
+                self.tiering.apply_search_params(self.db.index)
+
+    def index_stats(self) -> Dict:
+        """Index kind, size, search parameters and whether a rebuild is running."""
+        with self._lock:
+            if self.db is None:
+                return {"index": None, "ntotal": 0, "rebuilding": False}
+            return {
+                "index": index_kind(self.db.index),
+                "ntotal": self.db.index.ntotal,
+                "threshold": self.tiering.threshold,
+                "target": self.tiering.index_type,
+                "rebuilding": self._rebuild_thread is not None and self._rebuild_thread.is_alive(),
+                "metadata": self.metadata_index.stats(),
+                "lexical": self.lexical_index.stats(),
+                "dedup": self.dedup.stats(),
+                "live": self.db.index.ntotal - len(self._evicted),
+                "evicted": len(self._evicted),
+                "capacity": self.retention.capacity,
+                "ttl_seconds": self.retention.ttl_seconds,
+                "eviction_policy": self.retention.policy,
+                **self.tiering.search_params(self.db.index)
+            }
+
+    def measure_recall(self, queries: Optional[List[str]] = None, k: int = 10, sample: int = 200, sweep=None) -> Dict:
+        """
+        Recall@k of the live index against exact search (see IndexTiering.recall).
+
+        Args:
+            queries: query texts to embed; if None, `sample` stored insights are
+                used as queries.
+            k: neighbours compared per query.
+            sample: stored vectors to use when queries is None.
+            sweep: ef_search (HNSW) or nprobe (IVF) values to compare.
+        Inserts and queries wait while it runs.
+        """
+        vectors = [self.embeddings.embed_query(q) for q in queries] if queries else None
+        with self._lock:
+            if self.db is None:
+                return {"index": None, "ntotal": 0, "k": k, "queries": 0, "results": []}
+            return self.tiering.recall(self.db.index, vectors, k=k, sample=sample, sweep=sweep)
+
+    def cache_stats(self) -> Dict:
+        """Embedding cache hit / miss / eviction counters."""
+        return self.embedding_cache.stats()
+
+    def clear_memory(self, confirm=False):
+        if confirm:
+            with self._lock:
+                self.db = None   # reset in-memory FAISS
+                self.metadata_index.clear()
+                self.lexical_index.clear()
+                self.dedup.clear()
+                self.usage.clear()
+                self._evicted = set()
+                self._pending_since_checkpoint = 0
+                if self.persist:
+                    for path in (self._index_path, self._index_path + ".old", self._index_path + ".tmp"):
+                        shutil.rmtree(path, ignore_errors=True)
+                    for path in (self._log_path, self._meta_path):
+                        if os.path.exists(path):
+                            os.remove(path)
+            print("Memory cleared.")
+        else:
+            print("Pass confirm=True to clear memory.")
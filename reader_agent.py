@@ -1,7 +1,11 @@
 import json
 import time
-from typing import Dict, Any, Optional
+import asyncio
+from typing import Callable, Dict, Any, Optional
 from llm_validator import LLMValidator
+from llm_cache import invoke_llm, stream_llm, ainvoke_llm, astream_llm, has_cached_response, run_sync
+from retry_policy import RetryPolicy, classify_error, TRANSIENT, RATE_LIMIT, MALFORMED, SEMANTIC
+from tracing import span
 
 
 # JSON schema used to validate the plan generated by the ReaderAgent
@@ -20,6 +24,9 @@ PLAN_SCHEMA = {
 }
 
 
+HEDGE_POLICIES = ("first_success", "best_score")
+
+
 class ReaderAgent:
     """
     Reader Agent (Autonomous Dynamic System Planner)
@@ -28,13 +35,53 @@ class ReaderAgent:
     - Lets the LLM invent its own architecture dynamically
     - Avoids static archetypes like ReaderAgent/WriterAgent/ValidatorAgent
     - Produces a validated plan that the Writer Agent can consume
+    - Optionally hedges: several candidates are generated concurrently and the
+      first (or best-scoring) one that passes validation wins
     """
 
-    def __init__(self, llm_client, validator: LLMValidator, max_retries: int = 2, retry_delay: float = 0.8):
+    def __init__(
+        self,
+        llm_client,
+        validator: LLMValidator,
+        max_retries: int = 2,
+        retry_delay: float = 0.8,
+        hedge: int = 1,
+        hedge_budget: Optional[float] = None,
+        hedge_policy: str = "first_success",
+        retry_policy: Optional[RetryPolicy] = None
+    ):
+        """
+        Args:
+            llm_client: LLM instance with .invoke(prompt).
+            validator: LLMValidator used for the schema and LLM checks.
+            max_retries: sequential retries after a rejected plan (hedge == 1).
+            retry_delay: base backoff before retrying a transport failure. Malformed
+                or rejected plans are retried immediately.
+            hedge: number of plan candidates generated concurrently. 1 keeps the
+                sequential retry loop.
+            hedge_budget: wall-clock seconds allowed for a hedged round (None = no limit).
+            hedge_policy: "first_success" returns the first candidate that passes;
+                "best_score" waits for every candidate (within the budget) and
+                returns the one with the highest validation scores.
+            retry_policy: overrides the policy built from max_retries and retry_delay.
+        """
+        if hedge_policy not in HEDGE_POLICIES:
+            raise ValueError(f"hedge_policy must be one of {HEDGE_POLICIES}, got {hedge_policy!r}")
         self.llm = llm_client
         self.validator = validator
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.hedge = max(1, int(hedge))
+        self.hedge_budget = hedge_budget
+        self.hedge_policy = hedge_policy
+        self.retry_policy = retry_policy or RetryPolicy(
+            max_attempts=max_retries + 1,
+            base_delay=retry_delay,
+            retry_on=(TRANSIENT, RATE_LIMIT, MALFORMED, SEMANTIC)
+        )
+
+        # Compile the plan schema once instead of on every attempt
+        self.validator.register_schema(PLAN_SCHEMA)
 
     def _build_plan_prompt(self, enhanced_prompt: str) -> str:
         """Construct the prompt that will guide the LLM to create a structured architecture plan."""
@@ -100,90 +147,335 @@ Return only JSON below.
 
         return {}
 
-    def plan_from_prompt(self, enhanced_prompt: str, instruction: Optional[str] = None) -> Dict[str, Any]:
+    def _candidate_from_content(self, content: str) -> Optional[Dict[str, Any]]:
+        """Parse an LLM response into a plan candidate with normalized components."""
+        plan_candidate = self._parse_json(content)
+        if plan_candidate is not None and "components" in plan_candidate:
+            # Normalize components if the model returned a list
+            plan_candidate["components"] = self._normalize_components(plan_candidate["components"])
+        return plan_candidate
+
+    def _has_generic_names(self, plan_candidate: Dict[str, Any]) -> bool:
+        """Detect generic placeholder names the prompt asked the model to avoid."""
+        bad_names = ["readeragent", "writeragent", "validatoragent", "improveragent", "coordinatoragent"]
+        comp_names = [n.lower() for n in plan_candidate.get("components", {}).keys()]
+        return any(b in n for n in comp_names for b in bad_names)
+
+    @staticmethod
+    def _plan_score(report: Dict[str, Any]) -> float:
+        """Mean of the validator's scores; used by the best_score hedge policy."""
+        scores = report.get("scores") or {}
+        return sum(scores.values()) / len(scores) if scores else 0.0
+
+    @staticmethod
+    def _token_callback(on_token: Optional[Callable[[int, str], None]], attempt: int) -> Optional[Callable[[str], None]]:
+        if on_token is None:
+            return None
+        return lambda text: on_token(attempt, text)
+
+    @staticmethod
+    def _rejected(error: str, error_class: str, exc: Optional[Exception] = None) -> Dict[str, Any]:
+        return {"plan": None, "report": None, "error": error, "error_class": error_class, "exception": exc}
+
+    def _check_content(self, content: str):
+        """Parse a response; returns (plan_candidate, plan_text) or a rejection dict."""
+        plan_candidate = self._candidate_from_content(content)
+        if plan_candidate is None:
+            print("JSON invalid.")
+            return self._rejected("Invalid or non-JSON response.", MALFORMED)
+        return plan_candidate, json.dumps(plan_candidate)
+
+    def _check_reports(self, v_report, v_report_full=None) -> Optional[Dict[str, Any]]:
+        """Turn the validator reports into a rejection dict, or None if the plan passes."""
+        if v_report.get("status") == "fail":
+            print("Schema validation failed.")
+            return self._rejected(f"Schema invalid: {v_report.get('issues')}", MALFORMED)
+        if v_report_full is not None and v_report_full.get("status") == "fail":
+            return self._rejected(f"LLM validator rejected plan: {v_report_full.get('issues')}", SEMANTIC)
+        return None
+
+    def _check_names(self, plan_candidate, v_report_full) -> Dict[str, Any]:
+        # Reject generic placeholder names
+        if self._has_generic_names(plan_candidate):
+            print("Generic agent names detected, requesting a more creative plan.")
+            return self._rejected("Plan uses generic agent names.", SEMANTIC)
+        return {"plan": plan_candidate, "report": v_report_full, "error": None}
+
+    def _evaluate_candidate(self, prompt: str, instruction: str, use_cache: bool, on_chunk=None) -> Dict[str, Any]:
         """
-        Main pipeline that uses the LLM to create an autonomous plan.
-        It validates each response and retries when structure or fidelity issues occur.
+        One planning attempt: ask the LLM, then run the schema, LLM and
+        generic-name checks. Returns {"plan", "report", "error"}; plan is None
+        when the candidate was rejected.
         """
-        prompt = self._build_plan_prompt(enhanced_prompt)
-        attempts = 0
-        last_error = None
+        if on_chunk is not None:
+            llm_resp = stream_llm(self.llm, prompt, on_chunk, use_cache=use_cache)
+        else:
+            llm_resp = invoke_llm(self.llm, prompt, use_cache=use_cache)
+        content = getattr(llm_resp, "content", None) or getattr(llm_resp, "text", None) or str(llm_resp)
+        checked = self._check_content(content)
+        if isinstance(checked, dict):
+            return checked
+        plan_candidate, plan_text = checked
 
-        while attempts <= self.max_retries:
-            attempts += 1
-            print(f"Attempt {attempts}: Asking LLM for architecture plan.")
-            try:
-                llm_resp = self.llm.invoke(prompt)
-                content = getattr(llm_resp, "content", None) or getattr(llm_resp, "text", None) or str(llm_resp)
-                plan_candidate = self._parse_json(content)
-
-                if plan_candidate is None:
-                    last_error = "Invalid or non-JSON response."
-                    print("JSON invalid, retrying...")
-                    time.sleep(self.retry_delay)
-                    continue
-
-                # Normalize components if the model returned a list
-                if "components" in plan_candidate:
-                    plan_candidate["components"] = self._normalize_components(plan_candidate["components"])
-
-                # Structural schema validation
-                v_report = self.validator.validate_response(
-                    response_text=json.dumps(plan_candidate),
-                    expected_schema=PLAN_SCHEMA,
-                    instruction=instruction or "Autonomous system plan generation",
-                    require_json=True,
-                    run_llm_check=False
-                )
-
-                if v_report.get("status") == "fail":
-                    last_error = f"Schema invalid: {v_report.get('issues')}"
-                    print("Schema validation failed, retrying...")
-                    time.sleep(self.retry_delay)
-                    continue
-
-                # Deep validation using LLM check
-                v_report_full = self.validator.validate_response(
-                    response_text=json.dumps(plan_candidate),
-                    expected_schema=PLAN_SCHEMA,
-                    instruction=instruction or "Autonomous system plan generation",
-                    require_json=True,
-                    run_llm_check=True
-                )
-
-                if v_report_full.get("status") == "fail":
-                    last_error = f"LLM validator rejected plan: {v_report_full.get('issues')}"
-                    time.sleep(self.retry_delay)
-                    continue
-
-                # Reject generic placeholder names
-                bad_names = ["readeragent", "writeragent", "validatoragent", "improveragent", "coordinatoragent"]
-                comp_names = [n.lower() for n in plan_candidate.get("components", {}).keys()]
-                if any(b in n for n in comp_names for b in bad_names):
-                    print("Generic agent names detected, requesting a more creative plan.")
-                    time.sleep(self.retry_delay)
-                    continue
-
-                print("Architecture plan validated successfully.")
-                return {
-                    "success": True,
-                    "plan": plan_candidate,
-                    "validation_report": v_report_full,
-                    "attempts": attempts,
-                    "error": None
-                }
-
-            except Exception as e:
-                last_error = str(e)
-                print(f"Exception during planning: {last_error}")
-                time.sleep(self.retry_delay)
-                continue
+        # Structural schema validation
+        v_report = self.validator.validate_response(
+            response_text=plan_text,
+            expected_schema=PLAN_SCHEMA,
+            instruction=instruction,
+            require_json=True,
+            run_llm_check=False
+        )
+        rejected = self._check_reports(v_report)
+        if rejected:
+            return rejected
+
+        # Deep validation using LLM check
+        v_report_full = self.validator.validate_response(
+            response_text=plan_text,
+            expected_schema=PLAN_SCHEMA,
+            instruction=instruction,
+            require_json=True,
+            run_llm_check=True
+        )
+        rejected = self._check_reports(v_report, v_report_full)
+        if rejected:
+            return rejected
+        return self._check_names(plan_candidate, v_report_full)
+
+    async def _aevaluate_candidate(self, prompt: str, instruction: str, use_cache: bool, on_chunk=None) -> Dict[str, Any]:
+        """Async counterpart of _evaluate_candidate."""
+        if on_chunk is not None:
+            llm_resp = await astream_llm(self.llm, prompt, on_chunk, use_cache=use_cache)
+        else:
+            llm_resp = await ainvoke_llm(self.llm, prompt, use_cache=use_cache)
+        content = getattr(llm_resp, "content", None) or getattr(llm_resp, "text", None) or str(llm_resp)
+        checked = self._check_content(content)
+        if isinstance(checked, dict):
+            return checked
+        plan_candidate, plan_text = checked
+
+        v_report = await self.validator.avalidate_response(
+            response_text=plan_text,
+            expected_schema=PLAN_SCHEMA,
+            instruction=instruction,
+            require_json=True,
+            run_llm_check=False
+        )
+        rejected = self._check_reports(v_report)
+        if rejected:
+            return rejected
+
+        v_report_full = await self.validator.avalidate_response(
+            response_text=plan_text,
+            expected_schema=PLAN_SCHEMA,
+            instruction=instruction,
+            require_json=True,
+            run_llm_check=True
+        )
+        rejected = self._check_reports(v_report, v_report_full)
+        if rejected:
+            return rejected
+        return self._check_names(plan_candidate, v_report_full)
+
+    def _retry_delay(self, outcome: Dict[str, Any], attempts: int) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None to stop retrying."""
+        error_class = outcome["error_class"]
+        if not self.retry_policy.should_retry(error_class, attempts):
+            return None
+        delay = self.retry_policy.backoff(error_class, attempts, outcome.get("exception"))
+        self.retry_policy.record("reader", error_class, delay)
+        return delay
+
+    def _success(self, plan_candidate: Dict[str, Any], v_report_full: Dict[str, Any], attempts: int, **extra) -> Dict[str, Any]:
+        print("Architecture plan validated successfully.")
+        return {
+            "success": True,
+            "plan": plan_candidate,
+            "validation_report": v_report_full,
+            "attempts": attempts,
+            "error": None,
+            **extra
+        }
 
+    def _failure(self, attempts: int, last_error: Optional[str], **extra) -> Dict[str, Any]:
         print("Failed to generate a valid autonomous plan after retries.")
         return {
             "success": False,
             "plan": None,
             "validation_report": None,
             "attempts": attempts,
-            "error": last_error or "unknown"
+            "error": last_error or "unknown",
+            **extra
         }
+
+    def _pick(self, best: Optional[Dict[str, Any]], outcome: Dict[str, Any], attempt: int):
+        """Keep the higher-scoring of the current best and a passing outcome."""
+        if best is None or self._plan_score(outcome["report"]) > self._plan_score(best["report"]):
+            return {**outcome, "attempt": attempt}
+        return best
+
+    def _hedged_result(self, best, launched: int, completed: int, last_error, on_token, streamed: int = 1) -> Dict[str, Any]:
+        hedge_info = {"candidates": launched, "completed": completed, "winner": best["attempt"] if best else None}
+        if best is None:
+            return self._failure(launched, last_error, hedge=hedge_info)
+        if on_token is not None and best["attempt"] != streamed:
+            # Only one candidate is streamed; show the winning plan in full instead
+            on_token(best["attempt"], json.dumps(best["plan"], indent=2))
+        return self._success(best["plan"], best["report"], launched, hedge=hedge_info)
+
+    def plan_from_prompt(
+        self,
+        enhanced_prompt: str,
+        instruction: Optional[str] = None,
+        on_token: Optional[Callable[[int, str], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Main pipeline that uses the LLM to create an autonomous plan.
+        It validates each response and retries when structure or fidelity issues occur.
+        With hedge > 1, candidates are generated concurrently instead (see _hedged_plan).
+
+        If on_token is given, the plan is streamed and on_token(attempt, text) is
+        called for each chunk as it arrives.
+        """
+        prompt = self._build_plan_prompt(enhanced_prompt)
+        instruction = instruction or "Autonomous system plan generation"
+        if self.hedge > 1:
+            return self._hedged_plan(prompt, instruction, on_token)
+
+        attempts = 0
+        last_error = None
+
+        while True:
+            attempts += 1
+            print(f"Attempt {attempts}: Asking LLM for architecture plan.")
+            with span("planning_attempt", attempt=attempts):
+                try:
+                    # Retries must reach the model: a cached copy of a rejected plan would just fail again
+                    use_cache = attempts == 1
+                    outcome = self._evaluate_candidate(prompt, instruction, use_cache, self._token_callback(on_token, attempts))
+                except Exception as e:
+                    print(f"Exception during planning: {e}")
+                    outcome = self._rejected(str(e), classify_error(e), e)
+
+            if outcome["plan"] is not None:
+                return self._success(outcome["plan"], outcome["report"], attempts)
+            last_error = outcome["error"]
+            delay = self._retry_delay(outcome, attempts)
+            if delay is None:
+                break
+            if delay:
+                time.sleep(delay)
+
+        return self._failure(attempts, last_error)
+
+    def _hedged_plan(self, prompt: str, instruction: str, on_token) -> Dict[str, Any]:
+        """
+        Sync entry to hedging: runs _ahedged_plan on its own event loop, so losing
+        candidates are cancelled mid-request exactly as in the async API. (Worker
+        threads could only abandon them, still paying for every request.) A client
+        whose async connection pool is bound to another event loop should be
+        used through aplan_from_prompt on that loop instead.
+        """
+        return run_sync(self._ahedged_plan(prompt, instruction, on_token))
+
+    async def aplan_from_prompt(
+        self,
+        enhanced_prompt: str,
+        instruction: Optional[str] = None,
+        on_token: Optional[Callable[[int, str], None]] = None
+    ) -> Dict[str, Any]:
+        """Async counterpart of plan_from_prompt (uses ainvoke and non-blocking sleeps)."""
+        prompt = self._build_plan_prompt(enhanced_prompt)
+        instruction = instruction or "Autonomous system plan generation"
+        if self.hedge > 1:
+            return await self._ahedged_plan(prompt, instruction, on_token)
+
+        attempts = 0
+        last_error = None
+
+        while True:
+            attempts += 1
+            print(f"Attempt {attempts}: Asking LLM for architecture plan.")
+            with span("planning_attempt", attempt=attempts):
+                try:
+                    use_cache = attempts == 1
+                    outcome = await self._aevaluate_candidate(prompt, instruction, use_cache, self._token_callback(on_token, attempts))
+                except Exception as e:
+                    print(f"Exception during planning: {e}")
+                    outcome = self._rejected(str(e), classify_error(e), e)
+
+            if outcome["plan"] is not None:
+                return self._success(outcome["plan"], outcome["report"], attempts)
+            last_error = outcome["error"]
+            delay = self._retry_delay(outcome, attempts)
+            if delay is None:
+                break
+            if delay:
+                await asyncio.sleep(delay)
+
+        return self._failure(attempts, last_error)
+
+    async def _ahedged_plan(self, prompt: str, instruction: str, on_token) -> Dict[str, Any]:
+        """
+        Generate self.hedge candidates concurrently and validate them as they
+        finish; losing candidates are cancelled outright. A plan already in the
+        response cache is tried alone first, so a cache hit costs no fresh samples.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if self.hedge_budget is None else loop.time() + self.hedge_budget
+        first = 1
+
+        async def candidate(attempt: int) -> Dict[str, Any]:
+            with span("planning_candidate", attempt=attempt) as s:
+                try:
+                    # Only the first candidate may come from the cache; the rest must be fresh samples
+                    return await self._aevaluate_candidate(
+                        prompt, instruction, use_cache=attempt == 1,
+                        on_chunk=self._token_callback(on_token, attempt) if attempt == first else None
+                    )
+                except asyncio.CancelledError:
+                    s.set(cancelled=True)
+                    raise
+                except Exception as e:
+                    print(f"Exception during planning (candidate {attempt}): {e}")
+                    return self._rejected(str(e), classify_error(e), e)
+
+        best = None
+        last_error = None
+        completed = 0
+        if await asyncio.to_thread(has_cached_response, self.llm, prompt):
+            print("Evaluating the cached architecture plan before hedging.")
+            outcome = await candidate(1)
+            completed = 1
+            if outcome["plan"] is not None:
+                return self._hedged_result({**outcome, "attempt": 1}, 1, completed, None, on_token)
+            last_error = outcome["error"]
+            first = 2   # the cached plan was rejected: hedge with fresh candidates only
+
+        launched = first - 1 + self.hedge
+        print(f"Asking LLM for {self.hedge} architecture plan candidates concurrently.")
+        tasks = {asyncio.create_task(candidate(attempt)): attempt for attempt in range(first, launched + 1)}
+        pending = set(tasks)
+        try:
+            while pending:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    last_error = f"Planning budget of {self.hedge_budget}s exhausted."
+                    break
+                for task in done:
+                    completed += 1
+                    outcome = task.result()
+                    if outcome["plan"] is None:
+                        last_error = outcome["error"]
+                    else:
+                        best = self._pick(best, outcome, tasks[task])
+                if best is not None and self.hedge_policy == "first_success":
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        return self._hedged_result(best, launched, completed, last_error, on_token, streamed=first)
@@ -0,0 +1,240 @@
+import time
+import json
+import random
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Iterator, Optional, Tuple
+
+from tracing import current_span, metrics
+
+# Error classes
+TRANSIENT = "transient"      # connection resets, timeouts, 5xx
+RATE_LIMIT = "rate_limit"    # 429 / RateLimitError
+MALFORMED = "malformed"      # unparsable model output
+SEMANTIC = "semantic"        # well-formed output rejected by a check
+FATAL = "fatal"              # auth, bad request, programming errors: never retried
+
+# Exception class names (anywhere in the MRO) that indicate a transport-level problem.
+# Matching by name keeps openai/httpx optional at import time.
+_TRANSIENT_TYPES = {"APIConnectionError", "APITimeoutError", "InternalServerError", "TransportError"}
+_RATE_LIMIT_TYPES = {"RateLimitError"}
+
+_current_budget: "contextvars.ContextVar[Optional[RetryBudget]]" = contextvars.ContextVar("nexus_retry_budget", default=None)
+
+
+class MalformedOutputError(ValueError):
+    """The model answered, but the output could not be parsed."""
+
+
+class SemanticRejection(ValueError):
+    """The output parsed but failed a content check."""
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(exc: BaseException) -> str:
+    """Map an exception from an LLM call (or its parsing) to an error class."""
+    if isinstance(exc, SemanticRejection):
+        return SEMANTIC
+    if isinstance(exc, (MalformedOutputError, json.JSONDecodeError)):
+        return MALFORMED
+
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    if names & _RATE_LIMIT_TYPES:
+        return RATE_LIMIT
+    status = _status_code(exc)
+    if status == 429:
+        return RATE_LIMIT
+    if names & _TRANSIENT_TYPES or isinstance(exc, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    if status is not None and (status in (408, 409) or status >= 500):
+        return TRANSIENT
+    return FATAL
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms / retry-after headers), if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            return max(0.0, float(value) / 1000.0)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+class RetryBudget:
+    """Caps the retries one pipeline run may spend across all of its stages."""
+
+    def __init__(self, max_retries: int):
+        self.max_retries = max(0, int(max_retries))
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+
+    @property
+    def remaining(self) -> int:
+        with self._lock:
+            return self.max_retries - self.used
+
+
+@contextmanager
+def retry_budget(max_retries: int) -> Iterator[RetryBudget]:
+    """
+    Install a RetryBudget for the enclosed block. Like tracing spans it travels
+    through contextvars, so asyncio tasks and copied thread contexts share it.
+    """
+    budget = RetryBudget(max_retries)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def current_retry_budget() -> Optional[RetryBudget]:
+    return _current_budget.get()
+
+
+class RetryPolicy:
+    """
+    Error-classified retry policy.
+    ------------------------------
+    - Retries only the error classes in retry_on, up to max_attempts calls
+    - Transient errors back off exponentially with jitter
+    - Rate limits wait for the server's retry-after hint when one is given
+    - Malformed output and semantic rejections retry immediately: a fresh
+      sample is as likely to pass now as later
+    - Every retry draws from the current RetryBudget, if one is installed
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        multiplier: float = 2.0,
+        jitter: bool = True,
+        max_retry_after: float = 60.0,
+        retry_on: Tuple[str, ...] = (TRANSIENT, RATE_LIMIT, MALFORMED)
+    ):
+        """
+        Args:
+            max_attempts: total calls allowed, including the first.
+            base_delay: backoff before the first retry (seconds).
+            max_delay: upper bound for exponential backoff.
+            multiplier: backoff growth per attempt.
+            jitter: randomize each delay between 50% and 100% of its value.
+            max_retry_after: cap on server-provided retry-after hints.
+            retry_on: error classes that may be retried.
+        """
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.max_retry_after = max_retry_after
+        self.retry_on = tuple(retry_on)
+
+    def backoff(self, error_class: str, attempt: int, exc: Optional[BaseException] = None) -> float:
+        """Seconds to wait before attempt + 1."""
+        if error_class in (MALFORMED, SEMANTIC):
+            return 0.0
+        if error_class == RATE_LIMIT and exc is not None:
+            hint = retry_after(exc)
+            if hint is not None:
+                return min(hint, self.max_retry_after)
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        if self.jitter:
+            delay = delay / 2 + random.uniform(0, delay / 2)
+        return delay
+
+    def should_retry(self, error_class: str, attempt: int) -> bool:
+        """Whether a failure of error_class on attempt may be retried (consumes budget)."""
+        if attempt >= self.max_attempts or error_class not in self.retry_on:
+            return False
+        budget = current_retry_budget()
+        if budget is not None and not budget.acquire():
+            print("Retry budget exhausted; giving up on this call.")
+            metrics.inc("nexus_retry_budget_exhausted")
+            return False
+        return True
+
+    @staticmethod
+    def record(site: str, error_class: str, delay: float):
+        """Count one retry in the process metrics and on the current span."""
+        metrics.inc("nexus_retries", site=site, error=error_class)
+        s = current_span()
+        if s is not None:
+            s.add(retries=1, retry_wait_ms=delay * 1000)
+
+    def _prepare_retry(self, site: str, exc: Exception, attempt: int, on_retry) -> Optional[float]:
+        error_class = classify_error(exc)
+        if not self.should_retry(error_class, attempt):
+            return None
+        delay = self.backoff(error_class, attempt, exc)
+        self.record(site, error_class, delay)
+        print(f"{site}: {error_class} error ({exc}); retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_attempts}).")
+        if on_retry is not None:
+            on_retry(attempt + 1, exc)
+        return delay
+
+    def call(self, fn: Callable[[int], Any], site: str = "llm", on_retry: Optional[Callable[[int, Exception], None]] = None) -> Any:
+        """
+        Call fn(attempt) until it succeeds or the error is not retryable.
+        attempt starts at 1, so callers can bypass caches on retries.
+        on_retry(next_attempt, exc) runs before each retry.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return fn(attempt)
+            except Exception as e:
+                delay = self._prepare_retry(site, e, attempt, on_retry)
+                if delay is None:
+                    raise
+                if delay:
+                    time.sleep(delay)
+
+    async def acall(
+        self,
+        fn: Callable[[int], Awaitable[Any]],
+        site: str = "llm",
+        on_retry: Optional[Callable[[int, Exception], None]] = None
+    ) -> Any:
+        """Async counterpart of call(); fn(attempt) returns an awaitable."""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await fn(attempt)
+            except Exception as e:
+                delay = self._prepare_retry(site, e, attempt, on_retry)
+                if delay is None:
+                    raise
+                if delay:
+                    await asyncio.sleep(delay)
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+
+# Latency buckets (seconds) shared by every histogram
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0]
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("nexus_current_span", default=None)
+# Guards span metrics: worker threads (e.g. concurrent component generation) add to shared ancestors
+_metrics_lock = threading.Lock()
+
+
+class Span:
+    """
+    One timed unit of pipeline work.
+    --------------------------------
+    LLM usage recorded while a span is current is added to it and to every
+    ancestor, so the root span carries totals for the whole run.
+    """
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.metrics: Dict[str, float] = {}
+        self.status = "ok"
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, **metrics: float):
+        """Accumulate numeric metrics on this span and its ancestors."""
+        with _metrics_lock:
+            span = self
+            while span is not None:
+                for key, value in metrics.items():
+                    span.metrics[key] = span.metrics.get(key, 0) + value
+                span = span.parent
+
+    def to_dict(self) -> Dict[str, Any]:
+        with _metrics_lock:
+            metrics = dict(self.metrics)
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "status": self.status,
+            "attributes": self.attributes,
+            "metrics": metrics
+        }
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: Optional[List[float]] = None):
+        self.buckets = list(buckets or DEFAULT_BUCKETS)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _escape_label(value: Any) -> str:
+    """Escape a label value for the Prometheus text format (backslash, double quote, newline)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Process-wide histograms and counters, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[tuple, Histogram] = {}
+        self._counters: Dict[tuple, float] = {}
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @staticmethod
+    def _labels(labels: tuple, extra: Optional[Dict[str, str]] = None) -> str:
+        items = list(labels) + list((extra or {}).items())
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in items) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{name}_total{self._labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(labels, {'le': str(bound)})} {cumulative}")
+                lines.append(f"{name}_bucket{self._labels(labels, {'le': '+Inf'})} {histogram.count}")
+                lines.append(f"{name}_sum{self._labels(labels)} {histogram.total}")
+                lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class JsonlSpanExporter:
+    """Appends each finished span as one JSON line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+metrics = MetricsRegistry()
+_exporter: Optional[JsonlSpanExporter] = None
+if os.getenv("NEXUS_TRACE_PATH"):
+    _exporter = JsonlSpanExporter(os.environ["NEXUS_TRACE_PATH"])
+
+
+def configure_tracing(path: Optional[str]):
+    """Export finished spans to a JSONL file at path (None disables export)."""
+    global _exporter
+    _exporter = JsonlSpanExporter(path) if path else None
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """
+    Time a block as a child of the current span. Works in sync and async code;
+    contextvars carry the parent across asyncio tasks and to_thread calls.
+    """
+    s = Span(name, parent=_current_span.get(), attributes=attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.status = "error"
+        s.set(error=str(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        s.duration = time.perf_counter() - s._start
+        metrics.observe("nexus_span_duration_seconds", s.duration, span=name)
+        if _exporter is not None:
+            try:
+                _exporter.export(s)
+            except Exception as e:
+                print(f"Span export failed: {e}")
+
+
+def record_llm_call(latency: float, prompt_chars: int, completion_chars: int, cached: bool = False):
+    """Attribute one LLM round-trip to the current span and the process metrics."""
+    metrics.observe("nexus_llm_latency_seconds", latency, cached=str(cached).lower())
+    s = _current_span.get()
+    if s is not None:
+        s.add(
+            llm_calls=1,
+            llm_latency_ms=latency * 1000,
+            prompt_chars=prompt_chars,
+            completion_chars=completion_chars,
+            llm_cache_hits=1 if cached else 0
+        )
+
+
+def record_cache_hit(cache: str):
+    metrics.inc("nexus_cache_hits", cache=cache)
+    s = _current_span.get()
+    if s is not None:
+        s.add(**{f"{cache}_cache_hits": 1})
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Serve GET /metrics on a daemon thread. Idempotent per process."""
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is not None:
+            return _metrics_server
+        try:
+            _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            print(f"Metrics endpoint not started on port {port}: {e}")
+            return None
+        threading.Thread(target=_metrics_server.serve_forever, name="nexus-metrics", daemon=True).start()
+        print(f"Metrics available at http://{host}:{port}/metrics")
+        return _metrics_server
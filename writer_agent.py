@@ -1,7 +1,59 @@
 import os
 import json
 import time
-from typing import Dict, Any, Optional
+import asyncio
+import hashlib
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Any, Optional
+
+from llm_cache import invoke_llm, stream_llm, ainvoke_llm, astream_llm
+from retry_policy import RetryPolicy
+from tracing import span
+
+# Records, per component, the hash of its code prompt and of the code written for it
+MANIFEST_FILENAME = ".nexus_manifest.json"
+MANIFEST_VERSION = 1
+
+
+# One lock per output directory: a run holds it from reading the manifest until saving it
+_dir_locks: Dict[str, threading.Lock] = {}
+_dir_locks_guard = threading.Lock()
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _output_dir_lock(path: str) -> threading.Lock:
+    key = os.path.realpath(path)
+    with _dir_locks_guard:
+        return _dir_locks.setdefault(key, threading.Lock())
+
+
+def _guard_events(on_event: Optional[Callable[[Dict[str, Any]], None]]) -> Optional[Callable[[Dict[str, Any]], None]]:
+    """Wrap an event callback so a failing consumer can never fail a component or the run."""
+    if on_event is None:
+        return None
+
+    def guarded(event: Dict[str, Any]):
+        try:
+            on_event(event)
+        except Exception as e:
+            print(f"Writer event handler failed: {e}")
+    return guarded
+
+
+async def _acquire_async(lock: threading.Lock):
+    """Acquire a threading lock without blocking the event loop."""
+    acquiring = asyncio.ensure_future(asyncio.to_thread(lock.acquire))
+    try:
+        await asyncio.shield(acquiring)
+    except asyncio.CancelledError:
+        # The thread still gets the lock eventually; hand it straight back
+        acquiring.add_done_callback(lambda f: lock.release() if not f.cancelled() and f.exception() is None else None)
+        raise
 
 
 class WriterAgent:
@@ -12,19 +64,43 @@ class WriterAgent:
     - Generates runnable, modular code files for each component
     - Supports LangGraph, CrewAI, AutoGen, and LlamaIndex frameworks
     - Automatically builds an orchestrator (main.py)
+    - Generates independent components concurrently (bounded by max_workers)
     - Optionally saves files to disk
+    - Regenerates only new or changed components, tracked by a manifest in the output directory
+    - Runs sharing an output directory (in this process) take turns, so they
+      never interleave manifest reads, file writes and removals
     """
 
-    def __init__(self, llm_client=None, base_output_dir: str = "./generated_code", auto_save: bool = True):
+    def __init__(
+        self,
+        llm_client=None,
+        base_output_dir: str = "./generated_code",
+        auto_save: bool = True,
+        max_workers: int = 4,
+        use_llm_cache: bool = True,
+        retry_policy: Optional[RetryPolicy] = None,
+        incremental: bool = True
+    ):
         """
         Args:
             llm_client: LLM instance with .invoke(prompt). If None, a mock generator is used.
             base_output_dir: directory for saving generated files.
             auto_save: whether to automatically save generated files to disk.
+            max_workers: maximum number of components generated concurrently.
+                Use 1 to generate components sequentially.
+            use_llm_cache: serve identical component prompts from the LLM response cache.
+            retry_policy: retries transient and rate-limit failures of a component's
+                LLM call (default RetryPolicy()).
+            incremental: with auto_save, reuse the saved code of components whose
+                spec and plan context are unchanged since the last run (see MANIFEST_FILENAME).
         """
         self.llm = llm_client or self._mock_llm()
         self.base_output_dir = base_output_dir
         self.auto_save = auto_save
+        self.max_workers = max(1, int(max_workers))
+        self.use_llm_cache = use_llm_cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.incremental = incremental
 
         os.makedirs(self.base_output_dir, exist_ok=True)
 
@@ -76,12 +152,48 @@ Instructions:
 Return valid {language} source code only.
 """.strip()
 
-    def _generate_component_code(self, component_name: str, details: Dict[str, Any], plan: Dict[str, Any]) -> str:
+    @staticmethod
+    def _stream_callbacks(component_name: str, on_event):
+        """
+        Build (on_chunk, on_retry) for one component. A retry emits
+        {"type": "component_retry", "component", "attempt", "error"} so consumers
+        can discard code streamed by the failed attempt.
+        """
+        if on_event is None:
+            return None, None
+
+        def on_chunk(text: str):
+            on_event({"type": "code_chunk", "component": component_name, "text": text})
+
+        def on_retry(attempt: int, error: Exception):
+            on_event({"type": "component_retry", "component": component_name, "attempt": attempt, "error": str(error)})
+
+        return on_chunk, on_retry
+
+    def _generate_component_code(
+        self,
+        component_name: str,
+        details: Dict[str, Any],
+        plan: Dict[str, Any],
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> str:
         """
         Use the LLM to generate the actual code implementation for one component.
+        With on_event, code is streamed as {"type": "code_chunk", "component", "text"} events.
+        Retryable LLM failures are retried according to self.retry_policy.
         """
         prompt = self._build_code_prompt(component_name, details, plan)
-        response = self.llm.invoke(prompt)
+        on_chunk, on_retry = self._stream_callbacks(component_name, on_event)
+
+        def generate(attempt: int):
+            # Retries skip the cache so they always reach the model
+            use_cache = self.use_llm_cache and attempt == 1
+            if on_chunk is not None:
+                return stream_llm(self.llm, prompt, on_chunk, use_cache=use_cache)
+            return invoke_llm(self.llm, prompt, use_cache=use_cache)
+
+        with span("component_generation", component=component_name):
+            response = self.retry_policy.call(generate, site="writer", on_retry=on_retry)
         content = getattr(response, "content", None) or getattr(response, "text", None) or str(response)
         return content.strip()
 
@@ -123,40 +235,337 @@ Return valid {language} source code only.
         # Fallback orchestrator for other frameworks
         return f"# Orchestrator for {framework}\n# TODO: Implement orchestration logic here.\n"
 
-    def write_system_code(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+    @staticmethod
+    def _component_finished_event(comp_name: str, result: Any) -> Dict[str, Any]:
+        error = result if isinstance(result, Exception) else None
+        return {
+            "type": "component_finished",
+            "component": comp_name,
+            "status": "failed" if error else "success",
+            "error": str(error) if error else None
+        }
+
+    def _generate_all_components(
+        self,
+        plan: Dict[str, Any],
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+        components: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """
-        Generate code for all components and optionally save to disk.
-        Returns a dictionary with file contents and status.
+        Generate code for every component in the plan (or only those in components).
+        Components are independent LLM calls, so up to max_workers run at once.
+        Returns {component_name: code or Exception}; failures never cancel the others.
         """
-        if "components" not in plan:
-            raise ValueError("Plan missing 'components' key.")
+        components = list((plan["components"] if components is None else components).items())
+        results: Dict[str, Any] = {}
+
+        def finished(comp_name: str):
+            if on_event is not None:
+                on_event(self._component_finished_event(comp_name, results[comp_name]))
+
+        if self.max_workers == 1 or len(components) <= 1:
+            for comp_name, details in components:
+                print(f"Generating component: {comp_name}")
+                try:
+                    results[comp_name] = self._generate_component_code(comp_name, details, plan, on_event)
+                except Exception as e:
+                    results[comp_name] = e
+                finished(comp_name)
+            return results
+
+        workers = min(self.max_workers, len(components))
+        print(f"Generating {len(components)} components with {workers} workers.")
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="writer") as pool:
+            # Each task runs in a copy of the caller's context so its span nests under the current one
+            futures = {
+                pool.submit(
+                    contextvars.copy_context().run,
+                    self._generate_component_code, comp_name, details, plan, on_event
+                ): comp_name
+                for comp_name, details in components
+            }
+            for future in as_completed(futures):
+                comp_name = futures[future]
+                try:
+                    results[comp_name] = future.result()
+                    print(f"Generated component: {comp_name}")
+                except Exception as e:
+                    results[comp_name] = e
+                finished(comp_name)
+        return results
+
+    def _component_filename(self, comp_name: str) -> str:
+        return f"{comp_name.lower()}.py"
+
+    def _spec_hash(self, comp_name: str, details: Dict[str, Any], plan: Dict[str, Any]) -> str:
+        """Hash of the component's spec plus plan context: exactly what its code prompt contains."""
+        return _sha256(f"{MANIFEST_VERSION}\x00{self._build_code_prompt(comp_name, details, plan)}")
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        """Component entries of the manifest in base_output_dir ({} if missing or unreadable)."""
+        path = os.path.join(self.base_output_dir, MANIFEST_FILENAME)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        components = manifest.get("components")
+        return components if isinstance(components, dict) else {}
+
+    def _save_manifest(self, components: Dict[str, Any]):
+        path = os.path.join(self.base_output_dir, MANIFEST_FILENAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "components": components}, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def _plan_incremental(self, plan: Dict[str, Any]):
+        """
+        Compare the plan with the manifest.
+        Returns (previous manifest entries, spec hash per component, {name: code} of
+        components that can be reused). A component is reused only when its spec
+        hash matches and its file still holds the code recorded in the manifest.
+        """
+        spec_hashes = {name: self._spec_hash(name, details, plan) for name, details in plan["components"].items()}
+        if not (self.incremental and self.auto_save):
+            return {}, spec_hashes, {}
+
+        previous = self._load_manifest()
+        reused = {}
+        for name, spec_hash in spec_hashes.items():
+            entry = previous.get(name)
+            if not isinstance(entry, dict) or entry.get("spec_hash") != spec_hash:
+                continue
+            try:
+                with open(os.path.join(self.base_output_dir, entry["file"]), "r", encoding="utf-8") as f:
+                    code = f.read()
+            except (OSError, KeyError):
+                continue
+            if _sha256(code) == entry.get("content_hash"):
+                reused[name] = code
+        return previous, spec_hashes, reused
 
+    def _write_if_changed(self, filename: str, content: str) -> bool:
+        """Write content to filename unless the file already holds exactly that. Returns True if written."""
+        filepath = os.path.join(self.base_output_dir, filename)
+        try:
+            with open(filepath, "r", encoding="utf-8") as f:
+                if f.read() == content:
+                    return False
+        except OSError:
+            pass
+        with open(filepath, "w", encoding="utf-8") as f:
+            f.write(content)
+        return True
+
+    def _emit_reused(self, reused: Dict[str, str], on_event: Optional[Callable[[Dict[str, Any]], None]]):
+        if on_event is None:
+            return
+        for comp_name in reused:
+            on_event({"type": "component_finished", "component": comp_name, "status": "reused", "error": None})
+
+    def _assemble_output(
+        self,
+        plan: Dict[str, Any],
+        results: Dict[str, Any],
+        previous: Optional[Dict[str, Any]] = None,
+        spec_hashes: Optional[Dict[str, str]] = None,
+        reused: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """
+        Collect generated components in deterministic plan order, add the
+        orchestrator, and save everything when auto_save is on.
+        The orchestrator only wires the components that were generated.
+        Unchanged files are not rewritten, files of components dropped from the
+        plan (or failed in this run) are removed if they still hold the code the
+        manifest recorded (a file edited or rewritten since is left alone), and
+        the manifest is updated for the next run. When every component failed, nothing is
+        written or removed. Caller holds the output directory lock.
+        """
+        previous = previous or {}
+        spec_hashes = spec_hashes or {}
+        reused = reused or {}
         generated_files = {}
-        print("Starting system code generation.")
+        errors = []
+        manifest = {}
 
-        # Iterate through each component and generate code
-        for comp_name, details in plan["components"].items():
-            print(f"Generating component: {comp_name}")
-            code = self._generate_component_code(comp_name, details, plan)
-            filename = f"{comp_name.lower()}.py"
-            filepath = os.path.join(self.base_output_dir, filename)
+        for comp_name in plan["components"]:
+            code = results.get(comp_name)
+            if isinstance(code, Exception):
+                print(f"Failed to generate component {comp_name}: {code}")
+                errors.append({"component": comp_name, "error": str(code)})
+                continue
 
+            filename = self._component_filename(comp_name)
             generated_files[filename] = code
+            manifest[comp_name] = {"file": filename, "spec_hash": spec_hashes.get(comp_name), "content_hash": _sha256(code)}
 
             if self.auto_save:
-                with open(filepath, "w", encoding="utf-8") as f:
-                    f.write(code)
-                print(f"Saved {filename}")
+                if self._write_if_changed(filename, code):
+                    print(f"Saved {filename}")
+                else:
+                    print(f"Unchanged {filename}")
 
-        # Generate orchestrator script
+        if not errors:
+            status = "success"
+        elif len(errors) < len(plan["components"]):
+            status = "partial"
+        else:
+            status = "failed"
+
+        removed = []
+        if status == "failed":
+            # Nothing to orchestrate; leave the directory and manifest as the last run left them
+            print("Code generation failed for every component; main.py and the manifest are left unchanged.")
+            return {
+                "status": status,
+                "files": [],
+                "errors": errors,
+                "regenerated": [],
+                "reused": [],
+                "removed": removed
+            }
+
+        # Generate orchestrator script, wiring only the components that were generated
         print("Generating main orchestrator script.")
-        main_code = self._generate_main_script(plan)
+        main_code = self._generate_main_script(
+            {**plan, "components": {name: spec for name, spec in plan["components"].items() if name in manifest}}
+        )
         generated_files["main.py"] = main_code
 
         if self.auto_save:
-            with open(os.path.join(self.base_output_dir, "main.py"), "w", encoding="utf-8") as f:
-                f.write(main_code)
-            print("Saved main.py")
+            if self._write_if_changed("main.py", main_code):
+                print("Saved main.py")
+
+            # Remove files the previous run produced for components no longer in the plan
+            # (or that failed this time, so a stale copy is not left behind unrecorded)
+            for comp_name, entry in previous.items():
+                filename = entry.get("file") if isinstance(entry, dict) else None
+                if comp_name in manifest or not filename or filename in generated_files:
+                    continue
+                filepath = os.path.join(self.base_output_dir, filename)
+                try:
+                    with open(filepath, "r", encoding="utf-8") as f:
+                        if _sha256(f.read()) != entry.get("content_hash"):
+                            print(f"Kept {filename} (changed since it was generated)")
+                            continue
+                    os.remove(filepath)
+                    removed.append(filename)
+                    print(f"Removed {filename}")
+                except FileNotFoundError:
+                    pass
+
+            if self.incremental:
+                self._save_manifest(manifest)
+
+        print(f"Code generation complete ({status}).")
+        return {
+            "status": status,
+            "files": [{"name": k, "content": v} for k, v in generated_files.items()],
+            "errors": errors,
+            "regenerated": [name for name in plan["components"] if name not in reused and name in manifest],
+            "reused": list(reused),
+            "removed": removed
+        }
+
+    def write_system_code(
+        self,
+        plan: Dict[str, Any],
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate code for all components and optionally save to disk.
+        Returns a dictionary with file contents and status.
+
+        on_event, if given, receives "code_chunk", "component_retry" and
+        "component_finished" events.
+        It may be called from worker threads; exceptions it raises are logged
+        and ignored.
+
+        Files are returned (and saved) in plan order regardless of the order in
+        which concurrent generations finish. If some components fail, the others
+        are still returned and status is "partial" with details under "errors".
+
+        With incremental=True, only new or changed components reach the LLM;
+        "regenerated", "reused" and "removed" list what this run did.
+        """
+        if "components" not in plan:
+            raise ValueError("Plan missing 'components' key.")
+
+        print("Starting system code generation.")
+        on_event = _guard_events(on_event)
+        with _output_dir_lock(self.base_output_dir):
+            previous, spec_hashes, reused = self._plan_incremental(plan)
+            pending = {name: details for name, details in plan["components"].items() if name not in reused}
+            if reused:
+                print(f"Reusing {len(reused)} unchanged components; generating {len(pending)}.")
+            self._emit_reused(reused, on_event)
+            results = self._generate_all_components(plan, on_event, pending)
+            return self._assemble_output(plan, {**reused, **results}, previous, spec_hashes, reused)
+
+    async def _agenerate_component_code(
+        self,
+        component_name: str,
+        details: Dict[str, Any],
+        plan: Dict[str, Any],
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> str:
+        """Async counterpart of _generate_component_code."""
+        prompt = self._build_code_prompt(component_name, details, plan)
+        on_chunk, on_retry = self._stream_callbacks(component_name, on_event)
+
+        async def generate(attempt: int):
+            use_cache = self.use_llm_cache and attempt == 1
+            if on_chunk is not None:
+                return await astream_llm(self.llm, prompt, on_chunk, use_cache=use_cache)
+            return await ainvoke_llm(self.llm, prompt, use_cache=use_cache)
+
+        with span("component_generation", component=component_name):
+            response = await self.retry_policy.acall(generate, site="writer", on_retry=on_retry)
+        content = getattr(response, "content", None) or getattr(response, "text", None) or str(response)
+        return content.strip()
+
+    async def awrite_system_code(
+        self,
+        plan: Dict[str, Any],
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Async counterpart of write_system_code. Up to max_workers components are
+        generated concurrently on the event loop; file writes run in a worker thread.
+        """
+        if "components" not in plan:
+            raise ValueError("Plan missing 'components' key.")
+
+        print("Starting system code generation.")
+        on_event = _guard_events(on_event)
+        lock = _output_dir_lock(self.base_output_dir)
+        await _acquire_async(lock)
+        try:
+            return await self._awrite_locked(plan, on_event)
+        finally:
+            lock.release()
+
+    async def _awrite_locked(self, plan: Dict[str, Any], on_event: Optional[Callable[[Dict[str, Any]], None]]) -> Dict[str, Any]:
+        previous, spec_hashes, reused = await asyncio.to_thread(self._plan_incremental, plan)
+        if reused:
+            print(f"Reusing {len(reused)} unchanged components; generating {len(plan['components']) - len(reused)}.")
+        self._emit_reused(reused, on_event)
+        semaphore = asyncio.Semaphore(self.max_workers)
+        results: Dict[str, Any] = {}
+
+        async def generate(comp_name: str, details: Dict[str, Any]):
+            async with semaphore:
+                try:
+                    results[comp_name] = await self._agenerate_component_code(comp_name, details, plan, on_event)
+                except Exception as e:
+                    results[comp_name] = e
+                if on_event is not None:
+                    on_event(self._component_finished_event(comp_name, results[comp_name]))
 
-        print("Code generation complete.")
-        return {"status": "success", "files": [{"name": k, "content": v} for k, v in generated_files.items()]}
+        await asyncio.gather(*(
+            generate(name, details) for name, details in plan["components"].items() if name not in reused
+        ))
+        return await asyncio.to_thread(self._assemble_output, plan, {**reused, **results}, previous, spec_hashes, reused)